@@ -20,4 +20,4 @@ echo "PostgreSQL started"
 python manage.py recreate_db
 python manage.py seed_db
 
-gunicorn -b 0.0.0.0:$PORT manage:app
\ No newline at end of file
+gunicorn -b 0.0.0.0:$PORT --timeout ${GUNICORN_TIMEOUT:-30} manage:app
\ No newline at end of file
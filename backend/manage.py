@@ -1,5 +1,6 @@
 # services/users/manage.py
 
+import click
 from flask.cli import FlaskGroup
 from project import create_app, db
 import os
@@ -8,6 +9,20 @@ import math
 import pytest
 import sys
 from project.api.models import User, Exercise, Score
+from project.api.signing import generate_key_file
+from project.grading.benchmark import (
+    HEADER,
+    KINDS,
+    ClientSender,
+    HttpSender,
+    build_payloads,
+    format_row,
+    load_exercises,
+    run_benchmark,
+)
+from project.grading.regrade import regrade_exercise
+from project.grading.telemetry import telemetry
+from project.grading.watchdog import recycle_summary
 
 
 # deug env
@@ -924,6 +939,107 @@ def seed_db():
     db.session.commit()
 
 
+@cli.command("benchmark_grading")
+@click.option("--url", default=None, help="Base URL of a running server, e.g. http://localhost:5000. Mặc định dùng Flask test client.")
+@click.option("--concurrency", default="1,4,16", help="Comma separated concurrency levels.")
+@click.option("--modes", default="serial,fail_fast,parallel", help="Comma separated grading modes.")
+@click.option("--kinds", default=",".join(KINDS), help="Comma separated answer kinds.")
+@click.option("--requests", "count", default=100, help="Requests per (mode, concurrency, kind).")
+@click.option("--memo/--no-memo", default=False, help="Allow memoized results (identical answers).")
+@click.option("--token", default=None, help="Auth token of an admin, không bị tính budget chấm của submitter.")
+def benchmark_grading(url, concurrency, modes, kinds, count, memo, token):
+    """Đo throughput và latency của validate_code trên các exercise của seed_db."""
+    if url:
+        sender = HttpSender(url, token=token)
+    else:
+        sender = ClientSender(app, token=token)
+        # Mọi request từ test client chung một địa chỉ, bỏ budget per submitter
+        app.config["GRADER_USER_BUDGET"] = 0
+        app.config["GRADER_USER_QUEUE_SIZE"] = 0
+        if not memo:
+            app.config["GRADER_MEMO_PERSIST"] = False
+
+    exercises = load_exercises(sender)
+    if not exercises:
+        raise click.ClickException("No exercises found, run seed_db first.")
+    click.echo(f"{len(exercises)} exercises, {count} requests per run")
+    click.echo(HEADER)
+
+    for mode in modes.split(","):
+        for level in [int(x) for x in concurrency.split(",")]:
+            for kind in kinds.split(","):
+                payloads = build_payloads(exercises, kind, mode, count, unique=not memo)
+                stats = run_benchmark(sender, payloads, level)
+                click.echo(format_row(mode, level, kind, stats))
+
+    if not url:
+        telemetry.flush()
+
+
+@cli.command("regrade")
+@click.argument("exercise_ids", nargs=-1, type=int)
+@click.option("--all", "regrade_all", is_flag=True, help="Regrade every exercise.")
+@click.option("--chunk-size", default=None, type=int, help="Scores per batch (GRADER_REGRADE_CHUNK_SIZE).")
+def regrade(exercise_ids, regrade_all, chunk_size):
+    """Chấm lại các Score đã lưu theo test_cases/solutions hiện tại."""
+    if regrade_all:
+        exercise_ids = [exercise.id for exercise in Exercise.query.order_by(Exercise.id)]
+    if not exercise_ids:
+        raise click.UsageError("Pass exercise ids or --all.")
+
+    for exercise_id in exercise_ids:
+        stats = regrade_exercise(exercise_id, chunk_size)
+        click.echo(
+            f"exercise {exercise_id}: {stats['updated']}/{stats['scores']} scores updated, "
+            f"{stats['skipped']} skipped"
+        )
+
+
+@cli.command("grading_stats")
+@click.option("--exercise-id", default=None, type=int, help="Only this exercise.")
+@click.option("--limit", default=20, help="Number of exercises to show.")
+@click.option("--reset", is_flag=True, help="Delete all collected stats.")
+def grading_stats(exercise_id, limit, reset):
+    """In telemetry chấm bài theo exercise, tốn thời gian chấm nhất trước."""
+    if reset:
+        telemetry.reset()
+        click.echo("Grading stats were reset.")
+        return
+
+    names = {exercise.id: exercise.title for exercise in Exercise.query}
+    click.echo(
+        f"{'id':>4} {'title':<28} {'subs':>6} {'pass%':>6} {'timeout':>7} {'crash':>6} "
+        f"{'compile':>7} {'mean ms':>8} {'p90 ms':>7} {'p99 ms':>7} {'total s':>8}"
+    )
+    for stat in telemetry.report(exercise_id)[:limit]:
+        pass_rate = f"{stat['pass_rate'] * 100:.1f}" if stat["pass_rate"] is not None else "-"
+        click.echo(
+            f"{stat['exercise_id']:>4} {names.get(stat['exercise_id'], '?')[:28]:<28} "
+            f"{stat['submissions']:>6} {pass_rate:>6} {stat['timeouts']:>7} "
+            f"{stat['crashes']:>6} {stat['compile_errors']:>7} "
+            f"{str(stat['mean_ms'] or '-'):>8} "
+            f"{str(stat['p90_ms'] or '-'):>7} "
+            f"{str(stat['p99_ms'] or '-'):>7} "
+            f"{stat['total_ms'] / 1000:>8.1f}"
+        )
+
+    recycles = recycle_summary(limit=0)
+    by_reason = ", ".join(f"{k}: {v}" for k, v in sorted(recycles["by_reason"].items()))
+    click.echo(f"Worker recycles: {recycles['total']}" + (f" ({by_reason})" if by_reason else ""))
+
+
+@cli.command("generate_signing_key")
+@click.option("--algorithm", default="EdDSA", type=click.Choice(["EdDSA", "RS256"]))
+@click.option("--directory", default=None, help="Key directory (AUTH_SIGNING_KEYS_DIR).")
+def generate_signing_key(algorithm, directory):
+    """Tạo key ký token mới; key mới nhất dùng để ký, key cũ vẫn verify được."""
+    directory = directory or app.config.get("AUTH_SIGNING_KEYS_DIR")
+    if not directory:
+        raise click.UsageError("Pass --directory or set AUTH_SIGNING_KEYS_DIR.")
+    path = generate_key_file(directory, algorithm)
+    click.echo(f"Wrote {algorithm} signing key {path}")
+
+
 @cli.command("run_tests")
 def run_tests():
     """Chạy hết test case trong project/tests ."""
@@ -5,13 +5,21 @@ from flask_bcrypt import Bcrypt
 from flask_debugtoolbar import DebugToolbarExtension
 from flask_cors import CORS
 from flask_migrate import Migrate
+from werkzeug.middleware.proxy_fix import ProxyFix
 from project.logger import get_logger
 from project.middleware import setup_request_logging
+from project.grading.pool import GraderPool
+from project.passwords import PasswordHasher
 
 toolbar = DebugToolbarExtension()
 migrate = Migrate()
 bcrypt = Bcrypt()
+password_hasher = PasswordHasher()  # bcrypt chạy trên thread pool riêng, có giới hạn
 db = SQLAlchemy()  # Init db global, attach sau khi create_app
+grader = GraderPool()  # Pool process chấm bài, start lazy trong từng worker
+regrader = GraderPool(
+    name="regrader", workers_setting="GRADER_REGRADE_WORKERS", nice_setting="GRADER_REGRADE_NICE"
+)
 
 
 def create_app():
@@ -24,6 +32,12 @@ def create_app():
     app_settings = os.getenv("APP_SETTINGS", "project.config.DevelopmentConfig")
     app.config.from_object(app_settings)
 
+    # Sau load balancer: remote_addr lấy từ X-Forwarded-For của proxy tin cậy
+    if app.config.get("PROXY_FIX_X_FOR"):
+        app.wsgi_app = ProxyFix(
+            app.wsgi_app, x_for=app.config["PROXY_FIX_X_FOR"], x_proto=1
+        )
+
     # Setup logging
     logger = get_logger("flask_app", app.config.get("LOG_LEVEL"))
     logger.info(f"Starting application with config: {app_settings}")
@@ -36,6 +50,9 @@ def create_app():
     toolbar.init_app(app)
     migrate.init_app(app, db)
     bcrypt.init_app(app)
+    password_hasher.init_app(app)
+    grader.init_app(app)
+    regrader.init_app(app)
 
     logger.info("Database and extensions initialized")
 
@@ -1,13 +1,17 @@
 # services/users/project/api.py
 
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, g, jsonify, request
 from sqlalchemy import exc, or_
 
 from project.api.models import User
-from project import db, bcrypt
-from project.api.utils import authenticate
+from project.api.revocation import revocation_store
+from project.api.signing import key_ring
+from project.api.user_cache import token_cache
+from project import db, password_hasher
+from project.api.utils import authenticate, current_user
 from project.logger import get_logger
+from project.passwords import PasswordHasherBusy
 
 # Get logger for this module
 logger = get_logger('auth_api')
@@ -16,6 +20,21 @@ logger = get_logger('auth_api')
 auth_blueprint = Blueprint("auth", __name__)
 
 
+def busy_response():
+    return {"status": "fail", "message": "Server is busy, please try again!"}
+
+
+def rehash_password(user, password):
+    """Re-hash a password made with an old bcrypt cost; login still succeeds if this fails"""
+    try:
+        user.password = password_hasher.hash(password)
+        db.session.commit()
+        logger.info(f"Password of user {user.username} rehashed with the current bcrypt cost")
+    except (PasswordHasherBusy, exc.SQLAlchemyError) as e:
+        logger.warning(f"Failed to rehash password of user {user.username}: {str(e)}")
+        db.session.rollback()
+
+
 @auth_blueprint.route("/register", methods=["POST"])
 def register_user():
     logger.info("User registration attempt")
@@ -54,6 +73,11 @@ def register_user():
             
             # generate auth token
             auth_token = new_user.encode_auth_token(new_user.id)
+            if isinstance(auth_token, Exception):
+                # encode_auth_token trả về exception khi ký lỗi (vd. thiếu signing key)
+                logger.error(f"Failed to generate auth token for user: {email}")
+                response_object["message"] = "Authentication failed."
+                return jsonify(response_object), 500
             logger.info(f"User {username} registered successfully with ID: {new_user.id}")
             
             response_object["status"] = "success"
@@ -67,6 +91,10 @@ def register_user():
             return jsonify(response_object), 400
             
     # handler errors
+    except PasswordHasherBusy as e:
+        logger.warning(f"Registration for {email} rejected, password hasher busy: {str(e)}")
+        db.session.rollback()
+        return jsonify(busy_response()), 503
     except (exc.IntegrityError, ValueError) as e:
         logger.error(f"Database error during registration for {email}: {str(e)}")
         logger.exception("Full traceback:")
@@ -110,9 +138,12 @@ def login_user():
                 response_object["message"] = "User account is inactive."
                 return jsonify(response_object), 401
                 
-            if bcrypt.check_password_hash(user.password, password):
+            if password_hasher.check(user.password, password):
+                if password_hasher.needs_rehash(user.password):
+                    rehash_password(user, password)
                 auth_token = user.encode_auth_token(user.id)
-                if auth_token:
+                # encode_auth_token trả về exception khi ký lỗi (vd. thiếu signing key)
+                if auth_token and not isinstance(auth_token, Exception):
                     logger.info(f"User {user.username} ({email}) logged in successfully")
                     response_object["status"] = "success"
                     response_object["message"] = "Successfully logged in."
@@ -132,6 +163,9 @@ def login_user():
             response_object["message"] = "User does not exist."
             return jsonify(response_object), 404
             
+    except PasswordHasherBusy as e:
+        logger.warning(f"Login for {email} rejected, password hasher busy: {str(e)}")
+        return jsonify(busy_response()), 503
     except Exception as e:
         logger.error(f"Error during login for {email}: {str(e)}")
         logger.exception("Full traceback:")
@@ -139,6 +173,38 @@ def login_user():
         return jsonify(response_object), 500
 
 
+@auth_blueprint.route("/jwks", methods=["GET"])
+def get_jwks():
+    """
+    Public keys that verify auth tokens (JWKS), so other services check tokens locally
+
+    Service khác chỉ verify được chữ ký và exp; logout/revoke vẫn phải hỏi /auth/status.
+    """
+    document, etag = key_ring.jwks()
+    response = jsonify(document)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config.get("AUTH_JWKS_MAX_AGE", 300)
+    return response.make_conditional(request)
+
+
+@auth_blueprint.route("/telemetry", methods=["GET"])
+@authenticate
+def get_auth_telemetry(resp):
+    """Verified token cache counters of this worker (admin only)"""
+    user = current_user()
+    if not user or not user.admin:
+        response_object = {
+            "status": "error",
+            "message": "You do not have permission to do that.",
+        }
+        return jsonify(response_object), 401
+
+    # Hit rate của cache claims token trong process này
+    response_object = {"status": "success", "data": {"token_cache": token_cache.stats()}}
+    return jsonify(response_object), 200
+
+
 @auth_blueprint.route("/logout", methods=["GET"])
 @authenticate
 def logout_user(resp):
@@ -146,11 +212,18 @@ def logout_user(resp):
     
     try:
         # Get user info for logging
-        user = User.query.filter_by(id=resp).first()
+        user = current_user()
         if user:
-            logger.info(f"User {user.username} ({user.email}) logged out successfully")
+            logger.info(f"User {user.username} logged out successfully")
         else:
             logger.warning(f"Logout for unknown user_id: {resp}")
+
+        # Revoke token đang dùng tới khi nó tự hết hạn
+        claims = g.get("auth_claims") or {}
+        if claims.get("jti"):
+            revocation_store.revoke(claims["jti"], resp, claims["exp"])
+        else:
+            logger.warning(f"Token of user_id {resp} has no jti and cannot be revoked")
             
         response_object = {"status": "success", "message": "Successfully logged out."}
         return jsonify(response_object), 200
@@ -168,7 +241,8 @@ def get_user_status(resp):
     logger.debug(f"Getting user status for user_id: {resp}")
     
     try:
-        user = User.query.filter_by(id=resp).first()
+        # Cần cả row cho to_json, auth state trong cache không đủ
+        user = db.session.get(User, resp)
         
         if not user:
             logger.error(f"User status requested for non-existent user_id: {resp}")
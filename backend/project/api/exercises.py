@@ -1,11 +1,31 @@
 # services/project/api.py
 
 from sqlalchemy import exc
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
 
 from project import db
-from project.api.models import Exercise, User  # Assuming User model exists
-from project.api.utils import authenticate
+from project.api.models import Exercise, Score, User  # Assuming User model exists
+from project.api.utils import authenticate, current_user, load_user
+from project.grading.jobs import job_runner
+from project.grading.pool import GraderBusy
+from project.grading.memo import result_memo, submission_digest
+from project.grading.regrade import regrade_runner
+from project.grading.service import (
+    GRADING_MODES,
+    batch_deadline,
+    check_exercise,
+    grade_many,
+    grading_spec_error,
+    grade_submission,
+    grading_response,
+    grading_task,
+    is_deterministic,
+    solutions_error,
+    stream_grading,
+)
+from project.grading.telemetry import telemetry
+from project.grading.testcases import exercise_cache
+from project.grading.watchdog import recycle_summary, watchdog
 
 exercises_blueprint = Blueprint("exercises", __name__)
 
@@ -36,77 +56,252 @@ def get_single_exercise(exercise_id):
     except ValueError:
         return jsonify(response_object), 404
 
+def submitter():
+    """
+    Fair scheduling key of the caller and whether its budget is metered - :return: (key, metered)
+
+    Key là user id nếu token hợp lệ, không thì địa chỉ client (cần PROXY_FIX_X_FOR
+    khi chạy sau load balancer). Admin (benchmark, tool chấm hàng loạt) không bị
+    tính budget.
+    """
+    parts = request.headers.get("Authorization", "").split(" ")
+    if len(parts) == 2:
+        user = load_user(parts[1])
+        if user:
+            return f"user:{user.id}", not user.admin
+    return f"ip:{request.remote_addr}", True
+
+def load_submission():
+    """
+    Build a grading task from the request JSON - :return: (task, error)
+    """
+    data = request.get_json()
+    if not data or "answer" not in data or "exercise_id" not in data:
+        return None, ({"status": "fail", "message": "Invalid data!"}, 400)
+
+    mode = data.get("mode", "serial")
+    if mode not in GRADING_MODES:
+        return None, ({"status": "fail", "message": "Invalid mode!"}, 400)
+
+    try:
+        exercise = exercise_cache.get(int(data["exercise_id"]))
+    except (TypeError, ValueError):
+        exercise = None
+    error = check_exercise(exercise)
+    if error:
+        return None, error
+    user, metered = submitter()
+    return grading_task(exercise, data["answer"], mode, user=user, metered=metered), None
+
 @exercises_blueprint.route("/validate_code", methods=["POST"])
 def validate_code():
+    task, error = load_submission()
+    if error:
+        body, code = error
+        return jsonify(body), code
+
+    body, code = grade_submission(task)
+    return jsonify(body), code
+
+@exercises_blueprint.route("/validate_code/record", methods=["POST"])
+@authenticate
+def validate_code_and_record(user_id):
+    """Grade a submission and upsert the user's score in the same request"""
+    task, error = load_submission()
+    if error:
+        body, code = error
+        return jsonify(body), code
+
+    body, code = grade_submission(task)
+    if code != 200:
+        return jsonify(body), code
+
+    exercise_id = task["key"][0]
+    try:
+        score = Score.query.filter_by(
+            exercise_id=exercise_id, user_id=int(user_id)
+        ).first()
+        if not score:
+            score = Score(user_id=int(user_id), exercise_id=exercise_id)
+            db.session.add(score)
+        score.answer = task["answer"]
+        score.results = body["results"]
+        score.user_results = body["user_results"]
+        score.metrics = body["metrics"]
+        db.session.commit()
+    except (exc.IntegrityError, ValueError, TypeError) as e:
+        db.session.rollback()
+        response_object = {"status": "fail", "message": f"Error: {str(e)}"}
+        return jsonify(response_object), 400
+
+    return jsonify(dict(body, score=score.to_json())), 200
+
+@exercises_blueprint.route("/validate_code/stream", methods=["POST"])
+def validate_code_stream():
+    """Stream each test result as NDJSON as soon as it finishes"""
+    task, error = load_submission()
+    if error:
+        body, code = error
+        return jsonify(body), code
+
+    return Response(
+        stream_with_context(stream_grading(task)), mimetype="application/x-ndjson"
+    )
+
+@exercises_blueprint.route("/validate_code/jobs", methods=["POST"])
+def submit_validate_code_job():
+    """Queue validate_code as a background job and return its id right away"""
+    task, error = load_submission()
+    if error:
+        body, code = error
+        return jsonify(body), code
+
+    try:
+        job = job_runner.submit(task["key"][0], task)
+    except GraderBusy as e:
+        body, code = grading_response(e)
+        return jsonify(body), code
+
+    response_object = {
+        "status": "success",
+        "message": "Grading job was queued!",
+        "data": job.to_json(),
+    }
+    return jsonify(response_object), 202
+
+@exercises_blueprint.route("/validate_code/jobs/<job_id>", methods=["GET"])
+def get_validate_code_job(job_id):
+    """Get grading job status and result"""
+    job = job_runner.get(job_id)
+    if not job:
+        response_object = {"status": "fail", "message": "Job does not exist"}
+        return jsonify(response_object), 404
+    response_object = {"status": "success", "data": job.to_json()}
+    return jsonify(response_object), 200
+
+@exercises_blueprint.route("/validate_code/batch", methods=["POST"])
+def validate_code_batch():
+    """Grade many {exercise_id, answer} pairs in one request"""
     data = request.get_json()
-    if not data or "answer" not in data or "exercise_id" not in data:
+    submissions = data.get("submissions") if isinstance(data, dict) else None
+    if not isinstance(submissions, list) or not submissions:
         return (
             jsonify({"status": "fail", "message": "Invalid data!"}),
             400,
         )
-
-    answer = data["answer"]
-    exercise_id = data["exercise_id"]
-
-    exercise = Exercise.query.get(exercise_id)
-    if not exercise:
+    if len(submissions) > current_app.config["GRADER_BATCH_LIMIT"]:
         return (
-            jsonify({"status": "fail", "message": "Exercise not found!"}),
-            404,
+            jsonify({"status": "fail", "message": "Too many submissions in batch!"}),
+            400,
         )
 
-    tests = exercise.test_cases
-    solutions = exercise.solutions
+    exercise_ids = []
+    for item in submissions:
+        if not isinstance(item, dict) or "answer" not in item:
+            return (
+                jsonify({"status": "fail", "message": "Invalid data!"}),
+                400,
+            )
+        try:
+            exercise_ids.append(int(item.get("exercise_id")))
+        except (TypeError, ValueError):
+            return (
+                jsonify({"status": "fail", "message": "Invalid data!"}),
+                400,
+            )
+    exercises = exercise_cache.get_many(exercise_ids)
+    user, metered = submitter()
+
+    # Item lỗi (không có exercise...) trả về luôn, còn lại chấm song song
+    items = [None] * len(submissions)
+    pending = []
+    for index, (item, exercise_id) in enumerate(zip(submissions, exercise_ids)):
+        exercise = exercises.get(exercise_id)
+        error = check_exercise(exercise)
+        if error:
+            body, code = error
+            items[index] = dict(body, status_code=code)
+        else:
+            # Số item chạy cùng lúc đã bị pool giới hạn, chỉ còn tính budget
+            task = grading_task(
+                exercise, item["answer"], user=user, metered=metered, capped=False
+            )
+            pending.append((index, task))
 
-    if len(tests) != len(solutions):
-        return (
-            jsonify(
-                {"status": "fail", "message": "Tests and solutions length mismatch!"}
-            ),
-            500,
-        )
+    # Submission đã có trong memo lấy bằng một query; answer trùng nhau trong
+    # batch (cả lớp nộp cùng một bài) chỉ chấm một lần rồi chia kết quả
+    cached = result_memo.get_many([task for _, task in pending])
+    groups = {}
+    for index, task in pending:
+        digest = submission_digest(task) if isinstance(task["answer"], str) else index
+        if digest in cached:
+            body, code = cached[digest]
+            items[index] = dict(body, status_code=code)
+        else:
+            groups.setdefault(digest, (task, []))[1].append(index)
 
-    results = []
-    user_results = []
+    # Item chưa kịp chấm trước batch_deadline trả 503, client gửi lại sau
+    graded = list(groups.values())
+    outcomes = grade_many([task for task, _ in graded], deadline=batch_deadline())
+    memoized = []
+    for (task, indexes), outcome in zip(graded, outcomes):
+        body, code = grading_response(outcome)
+        if is_deterministic(outcome):
+            memoized.append((task, body, code))
+        for index in indexes:
+            items[index] = dict(body, status_code=code)
+    result_memo.put_many(memoized)
 
-    namespace = {}
+    response_object = {"status": "success", "data": {"results": items}}
+    return jsonify(response_object), 200
+
+@exercises_blueprint.route("/telemetry", methods=["GET"])
+@authenticate
+def get_grading_telemetry(user_id):
+    """Per-exercise grading counters and latency, heaviest exercises first (admin only)"""
+    user = current_user()
+    if not user or not user.admin:
+        response_object = {
+            "status": "error",
+            "message": "You do not have permission to do that.",
+        }
+        return jsonify(response_object), 401
+
+    exercise_id = request.args.get("exercise_id")
     try:
-        exec(answer, namespace)
-    except Exception as e:
-        return (
-            jsonify(
-                {"status": "fail", "message": f"Code compilation failed: {str(e)}!"}
-            ),
-            400,
-        )
+        exercise_id = int(exercise_id) if exercise_id is not None else None
+    except ValueError:
+        return jsonify({"status": "fail", "message": "Invalid exercise id!"}), 400
 
-    for test, sol in zip(tests, solutions):
-        try:
-            res = eval(test, namespace)
-            user_str = str(res)
-            user_results.append(user_str)
-            results.append(user_str == sol)
-        except Exception as e:
-            user_results.append(f"Error: {str(e)}")
-            results.append(False)
-
-    return (
-        jsonify(
-            {
-                "status": "success",
-                "results": results,
-                "user_results": user_results,
-                "all_correct": all(results),
-            }
-        ),
-        200,
-    )
+    response_object = {
+        "status": "success",
+        "data": {"exercises": telemetry.report(exercise_id)},
+    }
+    return jsonify(response_object), 200
+
+@exercises_blueprint.route("/telemetry/workers", methods=["GET"])
+@authenticate
+def get_worker_telemetry(user_id):
+    """In-process grading leak metrics of this worker and worker recycle history (admin only)"""
+    user = current_user()
+    if not user or not user.admin:
+        response_object = {
+            "status": "error",
+            "message": "You do not have permission to do that.",
+        }
+        return jsonify(response_object), 401
+
+    response_object = {
+        "status": "success",
+        "data": {"current": watchdog.stats(), "recycles": recycle_summary()},
+    }
+    return jsonify(response_object), 200
 
 @exercises_blueprint.route("/", methods=["POST"])
 @authenticate
 def add_exercise(user_id):
     """Add exercise"""
-    user = User.query.get(user_id)
+    user = current_user()
     if not user:
         response_object = {
             "status": "error",
@@ -129,6 +324,14 @@ def add_exercise(user_id):
     difficulty = post_data.get("difficulty")
     test_cases = post_data.get("test_cases")
     solutions = post_data.get("solutions")
+    time_limits = post_data.get("time_limits")
+    large_tests = post_data.get("large_tests")
+    message = grading_spec_error(test_cases, time_limits, large_tests) or solutions_error(
+        solutions, large_tests
+    )
+    if message:
+        response_object = {"status": "fail", "message": message}
+        return jsonify(response_object), 400
     try:
         exercise = Exercise(
             title=title,
@@ -136,6 +339,8 @@ def add_exercise(user_id):
             difficulty=difficulty,
             test_cases=test_cases,
             solutions=solutions,
+            time_limits=time_limits,
+            large_tests=large_tests,
         )
         db.session.add(exercise)
         db.session.commit()
@@ -154,7 +359,7 @@ def add_exercise(user_id):
 @authenticate
 def update_exercise(user_id, exercise_id):
     """Update exercise"""
-    user = User.query.get(user_id)
+    user = current_user()
     if not user:
         response_object = {
             "status": "error",
@@ -180,13 +385,27 @@ def update_exercise(user_id, exercise_id):
         difficulty = post_data.get("difficulty")
         test_cases = post_data.get("test_cases")
         solutions = post_data.get("solutions")
+        time_limits = post_data.get("time_limits")
+        large_tests = post_data.get("large_tests")
 
-        if all(x is None for x in [title, body, difficulty, test_cases, solutions]):
+        if all(
+            x is None
+            for x in [title, body, difficulty, test_cases, solutions, time_limits, large_tests]
+        ):
             response_object["message"] = "No fields to update in payload!"
             return jsonify(response_object), 400
 
         exercise = Exercise.query.filter_by(id=int(exercise_id)).first()
         if exercise:
+            # Kiểm tra trên giá trị sau khi update, bài nộp sau không bị 400 vì limit sai
+            message = grading_spec_error(
+                test_cases if test_cases is not None else exercise.test_cases,
+                time_limits if time_limits is not None else exercise.time_limits,
+                large_tests if large_tests is not None else exercise.large_tests,
+            ) or solutions_error(solutions, large_tests)
+            if message:
+                response_object["message"] = message
+                return jsonify(response_object), 400
             if title is not None:
                 exercise.title = title
             if body is not None:
@@ -197,7 +416,18 @@ def update_exercise(user_id, exercise_id):
                 exercise.test_cases = test_cases
             if solutions is not None:
                 exercise.solutions = solutions
+            if time_limits is not None:
+                exercise.time_limits = time_limits
+            if large_tests is not None:
+                exercise.large_tests = large_tests
             db.session.commit()
+            exercise_cache.invalidate(exercise.id)
+            result_memo.forget_exercise(exercise.id)
+            grading_changed = any(
+                x is not None for x in [test_cases, solutions, time_limits, large_tests]
+            )
+            if grading_changed and current_app.config["GRADER_REGRADE_ON_UPDATE"]:
+                regrade_runner.schedule(exercise.id)
             response_object["status"] = "success"
             response_object["message"] = "Exercise was updated!"
             response_object["data"] = exercise.to_json()
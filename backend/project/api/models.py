@@ -1,10 +1,13 @@
 # services/users/project/api/models.py
 from datetime import datetime, timezone, timedelta
+import uuid
 import jwt
 
 from flask import current_app
 
-from project import db, bcrypt
+from project import db, password_hasher
+from project.api.signing import key_ring
+from project.api.user_cache import token_cache, token_epochs, user_state_cache
 from project.logger import get_logger
 from sqlalchemy.types import JSON
 
@@ -20,11 +23,18 @@ class Score(db.Model):
     answer = db.Column(db.Text, nullable=True)
     results = db.Column(JSON, nullable=True)
     user_results = db.Column(JSON, nullable=True)
+    metrics = db.Column(JSON, nullable=True)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), nullable=False)
 
     def __init__(
-        self, user_id, exercise_id, answer=None, results=None, user_results=None
+        self,
+        user_id,
+        exercise_id,
+        answer=None,
+        results=None,
+        user_results=None,
+        metrics=None,
     ):
         logger.debug(
             f"Creating Score: user_id={user_id}, exercise_id={exercise_id}, answer length={len(answer) if answer else None}, results={results}, user_results={user_results}"
@@ -34,6 +44,7 @@ class Score(db.Model):
         self.answer = answer
         self.results = results
         self.user_results = user_results
+        self.metrics = metrics
 
     def to_json(self):
         logger.debug(f"Converting Score {self.id} to JSON")
@@ -44,11 +55,12 @@ class Score(db.Model):
             "answer": self.answer,
             "results": self.results,
             "user_results": self.user_results,
+            "metrics": self.metrics,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
         }
 
-    def update_score(self, answer, results, user_results):
+    def update_score(self, answer, results, user_results, metrics=None):
         """Update score with logging"""
         logger.info(
             f"Updating score {self.id} for user {self.user_id}, exercise {self.exercise_id}: results {self.results} -> {results}"
@@ -57,6 +69,7 @@ class Score(db.Model):
         self.answer = answer
         self.results = results
         self.user_results = user_results
+        self.metrics = metrics
 
         try:
             db.session.commit()
@@ -76,10 +89,23 @@ class Exercise(db.Model):
     difficulty = db.Column(db.Integer, nullable=False)
     test_cases = db.Column(JSON, nullable=False)
     solutions = db.Column(JSON, nullable=False)
+    # CPU time limit (ms) của từng test case, None = không giới hạn
+    time_limits = db.Column(JSON, nullable=True)
+    # Test ẩn với input lớn: [{"setup", "test", "solution", "time_limit_ms"}]
+    large_tests = db.Column(JSON, nullable=True)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), nullable=False)
 
-    def __init__(self, title, body, difficulty, test_cases, solutions):
+    def __init__(
+        self,
+        title,
+        body,
+        difficulty,
+        test_cases,
+        solutions,
+        time_limits=None,
+        large_tests=None,
+    ):
         logger.debug(
             f"Creating Exercise: title={title}, body length={len(body)}, difficulty={difficulty}, test_cases count={len(test_cases) if test_cases else 0}"
         )
@@ -88,6 +114,8 @@ class Exercise(db.Model):
         self.difficulty = difficulty
         self.test_cases = test_cases
         self.solutions = solutions
+        self.time_limits = time_limits
+        self.large_tests = large_tests
 
     def to_json(self):
         logger.debug(f"Converting Exercise {self.id} to JSON")
@@ -98,6 +126,9 @@ class Exercise(db.Model):
             "difficulty": self.difficulty,
             "test_cases": self.test_cases,
             "solutions": self.solutions,
+            "time_limits": self.time_limits,
+            # Test ẩn: chỉ cho biết số lượng
+            "large_test_count": len(self.large_tests or []),
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
         }
@@ -126,6 +157,131 @@ class Exercise(db.Model):
             raise e
 
 
+class GradingJob(db.Model):
+    __tablename__ = "grading_jobs"
+    id = db.Column(db.String(32), primary_key=True)
+    exercise_id = db.Column(db.Integer, nullable=False)
+    state = db.Column(db.String(16), default="queued", nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)
+    result = db.Column(JSON, nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), nullable=False)
+
+    def __init__(self, exercise_id):
+        self.id = uuid.uuid4().hex
+        self.exercise_id = exercise_id
+        self.state = "queued"
+        logger.debug(f"Creating GradingJob {self.id} for exercise_id={exercise_id}")
+
+    def to_json(self):
+        logger.debug(f"Converting GradingJob {self.id} to JSON")
+        return {
+            "id": self.id,
+            "exercise_id": self.exercise_id,
+            "state": self.state,
+            "status_code": self.status_code,
+            "result": self.result,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+
+class GradingResult(db.Model):
+    __tablename__ = "grading_results"
+    digest = db.Column(db.String(64), primary_key=True)
+    exercise_id = db.Column(db.Integer, nullable=False, index=True)
+    status_code = db.Column(db.Integer, nullable=False)
+    result = db.Column(JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+    def __init__(self, digest, exercise_id, status_code, result):
+        logger.debug(f"Creating GradingResult {digest} for exercise_id={exercise_id}")
+        self.digest = digest
+        self.exercise_id = exercise_id
+        self.status_code = status_code
+        self.result = result
+
+
+class RevokedToken(db.Model):
+    __tablename__ = "revoked_tokens"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    jti = db.Column(db.String(64), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+
+    def __init__(self, jti, user_id, expires_at):
+        logger.debug(f"Creating RevokedToken {jti} for user_id={user_id}")
+        self.jti = jti
+        self.user_id = user_id
+        self.expires_at = expires_at
+
+
+class GradingStat(db.Model):
+    __tablename__ = "grading_stats"
+    exercise_id = db.Column(db.Integer, primary_key=True)
+    submissions = db.Column(db.Integer, default=0, nullable=False)
+    passed = db.Column(db.Integer, default=0, nullable=False)
+    failed = db.Column(db.Integer, default=0, nullable=False)
+    compile_errors = db.Column(db.Integer, default=0, nullable=False)
+    rejected = db.Column(db.Integer, default=0, nullable=False)
+    timeouts = db.Column(db.Integer, default=0, nullable=False)
+    crashes = db.Column(db.Integer, default=0, nullable=False)
+    busy = db.Column(db.Integer, default=0, nullable=False)
+    total_ms = db.Column(db.Float, default=0, nullable=False)
+    max_ms = db.Column(db.Float, default=0, nullable=False)
+    latency_buckets = db.Column(JSON, nullable=True)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), nullable=False)
+
+    def __init__(self, exercise_id):
+        logger.debug(f"Creating GradingStat for exercise_id={exercise_id}")
+        self.exercise_id = exercise_id
+        self.submissions = 0
+        self.passed = 0
+        self.failed = 0
+        self.compile_errors = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self.busy = 0
+        self.total_ms = 0
+        self.max_ms = 0
+        self.latency_buckets = None
+
+
+class WorkerRecycle(db.Model):
+    __tablename__ = "worker_recycles"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    pid = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(16), nullable=False)
+    rss_kb = db.Column(db.Integer, nullable=False)
+    rss_growth_kb = db.Column(db.Integer, nullable=False)
+    new_modules = db.Column(db.Integer, nullable=False)
+    checks = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+    def __init__(self, pid, reason, rss_kb, rss_growth_kb, new_modules, checks):
+        logger.debug(f"Creating WorkerRecycle for pid={pid}, reason={reason}")
+        self.pid = pid
+        self.reason = reason
+        self.rss_kb = rss_kb
+        self.rss_growth_kb = rss_growth_kb
+        self.new_modules = new_modules
+        self.checks = checks
+
+    def to_json(self):
+        return {
+            "id": self.id,
+            "pid": self.pid,
+            "reason": self.reason,
+            "rss_kb": self.rss_kb,
+            "rss_growth_kb": self.rss_growth_kb,
+            "new_modules": self.new_modules,
+            "checks": self.checks,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+
 class User(db.Model):
     __tablename__ = "users"
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -134,6 +290,8 @@ class User(db.Model):
     password = db.Column(db.String(255), nullable=False)
     active = db.Column(db.Boolean, default=True, nullable=False)
     admin = db.Column(db.Boolean, default=False, nullable=False)
+    # Tăng khi deactivate/revoke admin: mọi token cấp với epoch cũ hết hiệu lực
+    token_epoch = db.Column(db.Integer, default=0, nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), nullable=False)
 
@@ -143,13 +301,12 @@ class User(db.Model):
         self.email = email
         self.admin = admin
         self.active = active
+        self.token_epoch = 0
 
         try:
             # Hash password
             logger.debug("Hashing user password")
-            self.password = bcrypt.generate_password_hash(
-                password, current_app.config.get("BCRYPT_LOG_ROUNDS")
-            ).decode()
+            self.password = password_hasher.hash(password)
             logger.debug("Password hashed successfully")
         except Exception as e:
             logger.error(f"Failed to hash password for user {username}: {str(e)}")
@@ -182,11 +339,27 @@ class User(db.Model):
                 + timedelta(days=expiration_days, seconds=expiration_seconds),
                 "iat": datetime.now(timezone.utc),
                 "sub": str(user_id),  # Convert to string for JWT compatibility
+                # Claims để authenticate không phải query users
+                "name": self.username,
+                "admin": bool(self.admin),
+                "epoch": self.token_epoch or 0,
+                # Id riêng của token để logout revoke đúng token này
+                "jti": uuid.uuid4().hex,
             }
 
-            token = jwt.encode(
-                payload, current_app.config.get("SECRET_KEY"), algorithm="HS256"
-            )
+            key = key_ring.signing_key()
+            if key is None:
+                token = jwt.encode(
+                    payload, current_app.config.get("SECRET_KEY"), algorithm="HS256"
+                )
+            else:
+                # kid trong header để bên verify chọn đúng public key trong JWKS
+                token = jwt.encode(
+                    payload,
+                    key.private_key,
+                    algorithm=key.algorithm,
+                    headers={"kid": key.kid},
+                )
 
             logger.debug(f"Auth token encoded successfully for user_id: {user_id}")
             logger.debug(
@@ -204,14 +377,41 @@ class User(db.Model):
         """
         Decodes the auth token - :param auth_token: - :return: integer|string
         """
+        claims = User.decode_auth_claims(auth_token)
+        if isinstance(claims, str):
+            return claims
+        return claims["user_id"]
+
+    @staticmethod
+    def decode_auth_claims(auth_token):
+        """
+        Decodes the auth token - :param auth_token: - :return: dict of user_id, username, admin, epoch, jti, exp|string
+
+        Token cấp trước khi có claim admin/epoch/jti thì các claim đó là None.
+        """
+        # Key bị xoá/thay thì claims đã cache của nó cũng bị bỏ
+        key_ring.maybe_reload()
+        claims = token_cache.get(auth_token)
+        if claims is not None:
+            return claims
+
         logger.debug("Decoding auth token")
 
         try:
-            payload = jwt.decode(
-                auth_token,
-                current_app.config.get("SECRET_KEY"),
-                algorithms=["HS256"],
-            )
+            kid = jwt.get_unverified_header(auth_token).get("kid")
+            if kid is None:
+                payload = jwt.decode(
+                    auth_token,
+                    current_app.config.get("SECRET_KEY"),
+                    algorithms=["HS256"],
+                )
+            else:
+                key = key_ring.verification_key(kid)
+                if key is None:
+                    raise jwt.InvalidTokenError(f"Unknown signing key {kid}")
+                payload = jwt.decode(
+                    auth_token, key.public_key, algorithms=[key.algorithm]
+                )
             user_id_str = payload["sub"]
             logger.debug(
                 f"Token payload sub: {user_id_str} (type: {type(user_id_str)})"
@@ -222,7 +422,17 @@ class User(db.Model):
             logger.debug(
                 f"Auth token decoded successfully for user_id: {user_id} (type: {type(user_id)})"
             )
-            return user_id
+            epoch = payload.get("epoch")
+            claims = {
+                "user_id": user_id,
+                "username": payload.get("name"),
+                "admin": payload.get("admin"),
+                "epoch": int(epoch) if epoch is not None else None,
+                "jti": payload.get("jti"),
+                "exp": datetime.fromtimestamp(payload["exp"], timezone.utc),
+            }
+            token_cache.put(auth_token, claims)
+            return claims
 
         except jwt.ExpiredSignatureError:
             logger.warning("Auth token expired")
@@ -247,7 +457,10 @@ class User(db.Model):
 
         try:
             self.active = False
+            self.token_epoch = (self.token_epoch or 0) + 1
             db.session.commit()
+            user_state_cache.invalidate(self.id)
+            token_epochs.bump(self.id, self.token_epoch, active=False)
             logger.info(f"User {self.username} deactivated successfully")
         except Exception as e:
             logger.error(f"Failed to deactivate user {self.username}: {str(e)}")
@@ -262,6 +475,8 @@ class User(db.Model):
         try:
             self.active = True
             db.session.commit()
+            user_state_cache.invalidate(self.id)
+            token_epochs.bump(self.id, self.token_epoch)
             logger.info(f"User {self.username} activated successfully")
         except Exception as e:
             logger.error(f"Failed to activate user {self.username}: {str(e)}")
@@ -276,6 +491,7 @@ class User(db.Model):
         try:
             self.admin = True
             db.session.commit()
+            user_state_cache.invalidate(self.id)
             logger.info(f"User {self.username} granted admin privileges successfully")
         except Exception as e:
             logger.error(
@@ -293,7 +509,10 @@ class User(db.Model):
 
         try:
             self.admin = False
+            self.token_epoch = (self.token_epoch or 0) + 1
             db.session.commit()
+            user_state_cache.invalidate(self.id)
+            token_epochs.bump(self.id, self.token_epoch)
             logger.info(
                 f"Admin privileges revoked from user {self.username} successfully"
             )
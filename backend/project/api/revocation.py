@@ -0,0 +1,164 @@
+# services/users/project/api/revocation.py
+
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import exc
+
+from project.logger import get_logger
+
+# Get logger for this module
+logger = get_logger("token_revocation")
+
+# Refresh đọc lại cả khoảng này trước lần refresh trước, bắt kịp row commit trễ
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter of strings: no false negatives, about error_rate false positives.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+class RevocationStore:
+    """
+    Revoked token ids (jti) in the revoked_tokens table with a Bloom filter in front.
+
+    Token hợp lệ gần như luôn không nằm trong Bloom filter nên authenticate
+    không query DB; chỉ khi filter báo "có thể" mới hỏi bảng để loại false
+    positive. Filter nạp thêm jti mới của các process khác mỗi
+    AUTH_REVOCATION_REFRESH_INTERVAL giây, và cứ AUTH_REVOCATION_REBUILD_INTERVAL
+    giây thì xoá row đã hết hạn rồi dựng lại filter từ các row còn lại.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._refreshed_at = None
+        self._rebuilt_at = None
+        self._watermark = None
+
+    def is_revoked(self, jti):
+        self.maybe_refresh()
+        with self._lock:
+            maybe = jti in self._filter
+        if not maybe:
+            return False
+
+        from project import db
+        from project.api.models import RevokedToken
+
+        return (
+            db.session.query(RevokedToken.id).filter(RevokedToken.jti == jti).first()
+            is not None
+        )
+
+    def revoke(self, jti, user_id, expires_at):
+        """Store a revoked token until it would have expired anyway"""
+        from project import db
+        from project.api.models import RevokedToken
+
+        try:
+            db.session.add(RevokedToken(jti=jti, user_id=user_id, expires_at=expires_at))
+            db.session.commit()
+        except exc.IntegrityError:
+            # Token này đã bị revoke (logout hai lần)
+            db.session.rollback()
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+        logger.debug(f"Revoked token {jti} of user_id {user_id}")
+
+    def maybe_refresh(self):
+        config = current_app.config
+        now = time.monotonic()
+        with self._lock:
+            rebuilt_at, refreshed_at = self._rebuilt_at, self._refreshed_at
+        if (
+            rebuilt_at is None
+            or now - rebuilt_at >= config.get("AUTH_REVOCATION_REBUILD_INTERVAL", 3600)
+        ):
+            self.rebuild()
+        elif now - refreshed_at >= config.get("AUTH_REVOCATION_REFRESH_INTERVAL", 0):
+            self.refresh()
+
+    def refresh(self):
+        """Add the tokens revoked since the last refresh"""
+        from project import db
+        from project.api.models import RevokedToken
+
+        started = datetime.now(timezone.utc)
+        with self._lock:
+            since = self._watermark - REFRESH_OVERLAP
+        jtis = [
+            row.jti
+            for row in db.session.query(RevokedToken.jti).filter(
+                RevokedToken.created_at >= since, RevokedToken.expires_at > started
+            )
+        ]
+        with self._lock:
+            for jti in jtis:
+                self._filter.add(jti)
+            self._watermark = started
+            self._refreshed_at = time.monotonic()
+
+    def rebuild(self):
+        """Purge expired rows, then build a new filter sized for the remaining ones"""
+        from project import db
+        from project.api.models import RevokedToken
+
+        started = datetime.now(timezone.utc)
+        try:
+            RevokedToken.query.filter(RevokedToken.expires_at <= started).delete()
+            db.session.commit()
+        except exc.SQLAlchemyError as e:
+            logger.error(f"Failed to purge expired revoked tokens: {str(e)}")
+            db.session.rollback()
+
+        jtis = [row.jti for row in db.session.query(RevokedToken.jti)]
+        capacity = max(
+            current_app.config.get("AUTH_REVOCATION_BLOOM_CAPACITY", 100000),
+            2 * len(jtis),
+        )
+        bloom = BloomFilter(capacity)
+        for jti in jtis:
+            bloom.add(jti)
+        with self._lock:
+            self._filter = bloom
+            self._watermark = started
+            self._refreshed_at = self._rebuilt_at = time.monotonic()
+        logger.debug(f"Rebuilt token revocation filter with {len(jtis)} tokens")
+
+    def reset(self):
+        with self._lock:
+            self._filter = None
+            self._rebuilt_at = None
+
+
+revocation_store = RevocationStore()
@@ -2,11 +2,12 @@
 
 
 from sqlalchemy import exc
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 
 from project import db
 from project.api.models import Score
 from project.api.utils import authenticate
+from project.grading.output import truncate_results
 
 
 scores_blueprint = Blueprint("scores", __name__)
@@ -66,13 +67,17 @@ def add_scores(resp):
     answer = post_data.get("answer")
     results = post_data.get("results")
     user_results = post_data.get("user_results")
+    metrics = post_data.get("metrics")
     try:
         score = Score(
             user_id=int(resp),
             exercise_id=exercise_id,
             answer=answer,
             results=results,
-            user_results=user_results,
+            user_results=truncate_results(
+                user_results, current_app.config["GRADER_RESULT_PREVIEW_CHARS"]
+            ),
+            metrics=metrics,
         )
         db.session.add(score)
         db.session.commit()
@@ -99,7 +104,8 @@ def update_score(resp, exercise_id):
         answer = post_data.get("answer")
         results = post_data.get("results")
         user_results = post_data.get("user_results")
-        if answer is None and results is None and user_results is None:
+        metrics = post_data.get("metrics")
+        if all(x is None for x in [answer, results, user_results, metrics]):
             response_object["message"] = "No fields to update in payload!"
             return jsonify(response_object), 400
 
@@ -112,7 +118,11 @@ def update_score(resp, exercise_id):
             if results is not None:
                 score.results = results
             if user_results is not None:
-                score.user_results = user_results
+                score.user_results = truncate_results(
+                    user_results, current_app.config["GRADER_RESULT_PREVIEW_CHARS"]
+                )
+            if metrics is not None:
+                score.metrics = metrics
             db.session.commit()
             response_object["status"] = "success"
             response_object["message"] = "Score was updated!"
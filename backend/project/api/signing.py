@@ -0,0 +1,210 @@
+# services/users/project/api/signing.py
+
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from flask import current_app
+
+from project.logger import get_logger
+
+# Get logger for this module
+logger = get_logger("token_signing")
+
+ASYMMETRIC_ALGORITHMS = ("EdDSA", "RS256")
+
+SigningKey = namedtuple("SigningKey", ["kid", "algorithm", "private_key", "public_key"])
+
+_EMPTY_JWKS = ({"keys": []}, hashlib.sha256(b'{"keys": []}').hexdigest())
+
+
+def _algorithm_of(key):
+    from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return "EdDSA"
+    if isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+        return "RS256"
+    return None
+
+
+def load_key_file(path):
+    """Load a PEM private or public key - :return: SigningKey, or None if unsupported"""
+    from cryptography.hazmat.primitives import serialization
+
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        private_key = serialization.load_pem_private_key(data, password=None)
+        public_key = private_key.public_key()
+    except (TypeError, ValueError):
+        # Key đã retire chỉ cần public key để verify token cũ
+        private_key = None
+        public_key = serialization.load_pem_public_key(data)
+
+    algorithm = _algorithm_of(public_key)
+    if algorithm is None:
+        logger.warning(f"Unsupported signing key type in {path}, skipping")
+        return None
+    kid = os.path.splitext(os.path.basename(path))[0]
+    return SigningKey(kid, algorithm, private_key, public_key)
+
+
+def generate_key_file(directory, algorithm="EdDSA"):
+    """Write a new private key named by the current UTC time - :return: path"""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+    if algorithm == "EdDSA":
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    elif algorithm == "RS256":
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    else:
+        raise ValueError(f"Unsupported signing algorithm: {algorithm}")
+
+    os.makedirs(directory, exist_ok=True)
+    # Tên theo thời gian để key mới nhất đứng cuối khi sort
+    kid = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{secrets.token_hex(4)}"
+    path = os.path.join(directory, f"{kid}.pem")
+    data = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return path
+
+
+def _to_jwk(key):
+    from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+
+    codec = OKPAlgorithm if key.algorithm == "EdDSA" else RSAAlgorithm
+    jwk = codec.to_jwk(key.public_key, as_dict=True)
+    jwk.update({"kid": key.kid, "alg": key.algorithm, "use": "sig"})
+    return jwk
+
+
+def _key_files(directory):
+    """(name, mtime, size) of each .pem file, changes whenever a key is added, replaced or removed"""
+    files = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".pem"):
+            stat = os.stat(os.path.join(directory, name))
+            files.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(files)
+
+
+class KeyRing:
+    """
+    Asymmetric token signing keys loaded from AUTH_SIGNING_KEYS_DIR.
+
+    Mỗi file <kid>.pem là một key; file có private key mới nhất (theo tên,
+    generate_key_file đặt tên theo thời gian) cùng thuật toán với
+    AUTH_TOKEN_ALGORITHM dùng để ký. Rotate bằng cách thêm key mới, giữ key cũ
+    (hoặc chỉ public key của nó) tới khi token cũ hết hạn rồi mới xoá. File .pem
+    nào thêm/xoá/đổi mtime hoặc size thì load lại (kiểm tra tối đa mỗi
+    AUTH_SIGNING_KEYS_CHECK_INTERVAL giây), JWKS được build sẵn cùng lúc load.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._source = None
+        self._checked_at = None
+        self._keys = {}
+        self._jwks = _EMPTY_JWKS
+
+    def _current(self):
+        directory = current_app.config.get("AUTH_SIGNING_KEYS_DIR")
+        if not directory:
+            return {}
+        interval = current_app.config.get("AUTH_SIGNING_KEYS_CHECK_INTERVAL", 0)
+        with self._lock:
+            if (
+                self._source is not None
+                and self._source[0] == directory
+                and time.monotonic() - self._checked_at < interval
+            ):
+                return self._keys
+        try:
+            source = (directory, _key_files(directory))
+        except OSError as e:
+            logger.error(f"Cannot read signing keys from {directory}: {str(e)}")
+            return {}
+
+        with self._lock:
+            if source == self._source:
+                self._checked_at = time.monotonic()
+                return self._keys
+        self._load(source)
+        with self._lock:
+            return self._keys
+
+    def _load(self, source):
+        from project.api.user_cache import token_cache
+
+        directory = source[0]
+        keys = {}
+        for name, _, _ in source[1]:
+            try:
+                key = load_key_file(os.path.join(directory, name))
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to load signing key {name}: {str(e)}")
+                continue
+            if key is not None:
+                keys[key.kid] = key
+
+        document = {"keys": [_to_jwk(key) for key in keys.values()]}
+        body = json.dumps(document, sort_keys=True).encode()
+        with self._lock:
+            self._source = source
+            self._checked_at = time.monotonic()
+            self._keys = keys
+            self._jwks = (document, hashlib.sha256(body).hexdigest())
+        # Claims đã cache có thể được verify bằng key vừa bị xoá/thay
+        token_cache.clear()
+        logger.info(f"Loaded {len(keys)} token signing keys from {directory}")
+
+    def signing_key(self):
+        """Newest private key of AUTH_TOKEN_ALGORITHM, or None to sign with SECRET_KEY (HS256)"""
+        algorithm = current_app.config.get("AUTH_TOKEN_ALGORITHM", "HS256")
+        if algorithm not in ASYMMETRIC_ALGORITHMS:
+            return None
+        candidates = [
+            key
+            for key in self._current().values()
+            if key.private_key is not None and key.algorithm == algorithm
+        ]
+        if not candidates:
+            raise RuntimeError(f"No {algorithm} signing key in AUTH_SIGNING_KEYS_DIR")
+        return max(candidates, key=lambda key: key.kid)
+
+    def maybe_reload(self):
+        """Reload the keys if a key file changed, dropping cached token claims"""
+        self._current()
+
+    def verification_key(self, kid):
+        """Key with the given kid, or None"""
+        return self._current().get(kid)
+
+    def jwks(self):
+        """Published public keys - :return: (JWKS document, etag)"""
+        self._current()
+        with self._lock:
+            return self._jwks
+
+    def reset(self):
+        with self._lock:
+            self._source = None
+            self._checked_at = None
+            self._keys = {}
+            self._jwks = _EMPTY_JWKS
+
+
+key_ring = KeyRing()
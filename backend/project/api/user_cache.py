@@ -0,0 +1,186 @@
+# services/users/project/api/user_cache.py
+
+import hashlib
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from flask import current_app
+
+from project.cache import LRUCache
+from project.logger import get_logger
+
+# Get logger for this module
+logger = get_logger("user_cache")
+
+CACHE_SIZE = 4096
+
+TOKEN_CACHE_SIZE = 10000
+
+# Những gì authenticate cần biết về user, không cần cả row
+UserState = namedtuple("UserState", ["id", "active", "admin", "username"])
+
+
+class UserStateCache:
+    """
+    Per-process cache of user auth state (id -> active, admin, username).
+
+    Entry sống AUTH_USER_CACHE_TTL giây; activate_user, deactivate_user,
+    make_admin và revoke_admin invalidate ngay trong process hiện tại, các
+    worker khác thấy thay đổi chậm nhất sau một TTL.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self._entries = LRUCache(maxsize=maxsize)
+
+    def get(self, user_id):
+        """Return the UserState of a user, or None if the user does not exist"""
+        return self.load(user_id)[0]
+
+    def load(self, user_id):
+        """
+        Return (UserState, User row loaded on a miss or None on a hit) - :return: tuple
+
+        Miss thì load cả row: caller giữ reference tới nó thì db.session.get trong
+        cùng request lấy lại từ identity map của session mà không query thêm.
+        """
+        from project import db
+        from project.api.models import User
+
+        state = self._entries.get(user_id)
+        if state is not None:
+            return state, None
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None, None
+        state = UserState(user.id, user.active, user.admin, user.username)
+        ttl = current_app.config.get("AUTH_USER_CACHE_TTL", 0)
+        if ttl > 0:
+            self._entries.set(user_id, state, ttl=ttl)
+        return state, user
+
+    def invalidate(self, user_id):
+        logger.debug(f"Invalidating cached auth state of user {user_id}")
+        self._entries.pop(user_id)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class TokenEpochs:
+    """
+    Per-process map of user id -> current token epoch, refreshed periodically.
+
+    Chỉ giữ user có epoch > 0 hoặc inactive (user khác mặc định epoch 0), nên
+    map nhỏ và refresh bằng một query cứ AUTH_EPOCH_REFRESH_INTERVAL giây.
+    Token có epoch khớp thì authenticate tin claim admin trong token luôn mà
+    không query users; deactivate/revoke admin tăng epoch nên token cũ hết hiệu
+    lực ngay trong process hiện tại, các process khác sau một lần refresh.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._epochs = {}
+        self._refreshed_at = None
+
+    def current(self, user_id):
+        """Current epoch of a user, or None if the user is inactive"""
+        self.maybe_refresh()
+        with self._lock:
+            return self._epochs.get(user_id, 0)
+
+    def maybe_refresh(self):
+        interval = current_app.config.get("AUTH_EPOCH_REFRESH_INTERVAL", 0)
+        with self._lock:
+            refreshed_at = self._refreshed_at
+        if refreshed_at is None or time.monotonic() - refreshed_at >= interval:
+            self.refresh()
+
+    def refresh(self):
+        """Reload the epochs of every user whose tokens were ever revoked"""
+        from project import db
+        from project.api.models import User
+
+        rows = (
+            db.session.query(User.id, User.token_epoch, User.active)
+            .filter(db.or_(User.token_epoch > 0, User.active.is_(False)))
+            .all()
+        )
+        epochs = {row.id: row.token_epoch if row.active else None for row in rows}
+        with self._lock:
+            self._epochs = epochs
+            self._refreshed_at = time.monotonic()
+        logger.debug(f"Refreshed token epochs of {len(epochs)} users")
+
+    def bump(self, user_id, epoch, active=True):
+        """Record a new epoch right away, without waiting for the next refresh"""
+        with self._lock:
+            self._epochs[user_id] = epoch if active else None
+
+    def reset(self):
+        with self._lock:
+            self._epochs = {}
+            self._refreshed_at = None
+
+
+class TokenCache:
+    """
+    Per-process cache of verified token claims keyed by sha256 of the token.
+
+    Cùng một bearer token gửi lại thì bỏ qua bước verify chữ ký và parse
+    payload. Entry hết hạn đúng lúc token hết hạn nên token expired vẫn đi qua
+    jwt.decode và bị từ chối như cũ; revoke/epoch vẫn được kiểm tra mỗi request.
+    """
+
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE):
+        self._entries = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def _digest(auth_token):
+        if isinstance(auth_token, str):
+            auth_token = auth_token.encode()
+        return hashlib.sha256(auth_token).digest()
+
+    def get(self, auth_token):
+        """Return the cached claims of a verified token, or None"""
+        claims = self._entries.get(self._digest(auth_token))
+        with self._lock:
+            if claims is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return claims
+
+    def put(self, auth_token, claims):
+        ttl = (claims["exp"] - datetime.now(timezone.utc)).total_seconds()
+        if ttl > 0:
+            self._entries.set(self._digest(auth_token), claims, ttl=ttl)
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self._hits, self._misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else None,
+            "size": len(self._entries),
+        }
+
+    def clear(self):
+        self._entries.clear()
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
+
+
+user_state_cache = UserStateCache()
+
+token_cache = TokenCache()
+
+token_epochs = TokenEpochs()
@@ -3,9 +3,11 @@
 
 from functools import wraps
 
-from flask import request, jsonify
+from flask import g, has_request_context, request, jsonify
 
 from project.api.models import User
+from project.api.revocation import revocation_store
+from project.api.user_cache import UserState, token_epochs, user_state_cache
 from project.logger import get_logger
 
 # Get logger for this module
@@ -38,46 +40,76 @@ def authenticate(f):
             response_object["message"] = "Invalid token format."
             return jsonify(response_object), code
 
-        user_id = decode_auth_token(str(auth_token))
-        if not user_id:
+        user = load_user(str(auth_token))
+        if not user:
             logger.warning("Invalid or expired auth token")
             response_object["message"] = "Invalid token. Please log in again."
             return jsonify(response_object), code
 
-        logger.debug(f"Authentication successful for user_id: {user_id}")
-        return f(user_id, *args, **kwargs)
+        # Auth state load một lần cho cả request, handler không query lại
+        g.current_user = user
+        logger.debug(f"Authentication successful for user_id: {user.id}")
+        return f(user.id, *args, **kwargs)
 
     return decorated_function
 
 
+def current_user():
+    """UserState (id, active, admin, username) of the authenticated user, or None"""
+    return g.get("current_user")
+
+
 def decode_auth_token(auth_token):
     """
     Decodes the auth token and returns user_id if valid
     """
-    try:
-        from project.api.models import User
+    user = load_user(auth_token)
+    return user.id if user else None
+
 
-        user_id = User.decode_auth_token(auth_token)
+def load_user(auth_token):
+    """
+    Decodes the auth token and returns the UserState of its active user, or None
+    """
+    try:
+        claims = User.decode_auth_claims(auth_token)
 
-        if isinstance(user_id, str):
+        if isinstance(claims, str):
             # Token decode returned an error message
-            logger.warning(f"Token decode error: {user_id}")
+            logger.warning(f"Token decode error: {claims}")
+            return None
+
+        if has_request_context():
+            g.auth_claims = claims
+
+        user_id = claims["user_id"]
+        if claims["jti"] is not None and revocation_store.is_revoked(claims["jti"]):
+            logger.warning(f"Token of user_id {user_id} was revoked (logged out)")
             return None
 
-        # Check if user exists and is active
-        user = User.query.filter_by(id=user_id).first()
+        if claims["epoch"] is not None:
+            # Token có epoch: authorize bằng claim, chỉ so với epoch map trong memory
+            epoch = token_epochs.current(user_id)
+            if epoch != claims["epoch"]:
+                logger.warning(f"Token revoked for user_id: {user_id}")
+                return None
+            return UserState(user_id, True, claims["admin"], claims["username"])
+
+        # Check if user exists and is active (thường lấy từ cache, không query DB)
+        user, row = user_state_cache.load(user_id)
+        if row is not None and has_request_context():
+            # Session chỉ giữ weak reference, giữ row để handler get lại không query
+            g.current_user_row = row
         if not user:
             logger.warning(f"Token valid but user not found: {user_id}")
             return None
 
         if not user.active:
-            logger.warning(
-                f"Token valid but user inactive: {user.username} ({user.email})"
-            )
+            logger.warning(f"Token valid but user inactive: {user.username}")
             return None
 
         logger.debug(f"Token successfully decoded for user: {user.username}")
-        return user_id
+        return user
 
     except Exception as e:
         logger.error(f"Error decoding auth token: {str(e)}")
@@ -91,8 +123,12 @@ def is_admin(user_id):
     """
     logger.debug(f"Checking admin status for user_id: {user_id}")
 
+    user = current_user()
+    if user is not None and user.id == user_id:
+        return user.admin
+
     try:
-        user = User.query.filter_by(id=user_id).first()
+        user = user_state_cache.get(user_id)
         if not user:
             logger.warning(f"Admin check for non-existent user_id: {user_id}")
             return False
@@ -11,9 +11,88 @@ class BaseConfig:
     SECRET_KEY = os.environ.get("SECRET_KEY")
     DEBUG_TB_ENABLED = False
     DEBUG_TB_INTERCEPT_REDIRECTS = False
+    # Cost dùng khi tắt calibrate (AUTH_BCRYPT_TARGET_MS = 0)
     BCRYPT_LOG_ROUNDS = 13
+    # bcrypt chạy trên thread pool riêng; lúc start chọn cost cao nhất mà hash
+    # mất <= TARGET_MS, không thấp hơn MIN_ROUNDS (sàn riêng, thấp hơn cost 13)
+    AUTH_BCRYPT_WORKERS = 2
+    AUTH_BCRYPT_QUEUE_SIZE = 16
+    AUTH_BCRYPT_TIMEOUT = 10
+    AUTH_BCRYPT_TARGET_MS = 250
+    AUTH_BCRYPT_MIN_ROUNDS = 10
     TOKEN_EXPIRATION_DAYS = 30
     TOKEN_EXPIRATION_SECONDS = 0
+    # Cache active/admin của user trong process, authenticate không phải query DB
+    AUTH_USER_CACHE_TTL = 30
+    # Epoch map (token bị revoke khi deactivate/revoke admin) refresh mỗi N giây
+    AUTH_EPOCH_REFRESH_INTERVAL = 10
+    # Token đã logout (jti): nạp jti mới mỗi N giây, dọn row hết hạn mỗi giờ
+    AUTH_REVOCATION_REFRESH_INTERVAL = 5
+    AUTH_REVOCATION_REBUILD_INTERVAL = 3600
+    AUTH_REVOCATION_BLOOM_CAPACITY = 100000
+    # HS256 ký bằng SECRET_KEY; EdDSA/RS256 ký bằng key mới nhất trong AUTH_SIGNING_KEYS_DIR
+    AUTH_TOKEN_ALGORITHM = os.environ.get("AUTH_TOKEN_ALGORITHM", "HS256")
+    AUTH_SIGNING_KEYS_DIR = os.environ.get("AUTH_SIGNING_KEYS_DIR")
+    AUTH_SIGNING_KEYS_CHECK_INTERVAL = 5
+    AUTH_JWKS_MAX_AGE = 300
+
+    # Grading worker pool (GRADER_WORKERS = 0 chạy in-process)
+    GRADER_WORKERS = 2
+    GRADER_QUEUE_SIZE = 8
+    GRADER_QUEUE_TIMEOUT = 5
+    GRADER_WALL_TIMEOUT = 10
+    GRADER_CPU_LIMIT = 5
+    GRADER_FORK_PER_SUBMISSION = True
+    GRADER_PRELOAD_MODULES = ["math", "json", "collections", "re", "datetime", "random"]
+    GRADER_EXERCISE_CACHE_TTL = 30
+    GRADER_BATCH_LIMIT = 500
+    # Timeout của gunicorn worker (entrypoint.sh truyền cùng giá trị cho --timeout);
+    # batch ngừng lấy item mới sau GUNICORN_TIMEOUT - GRADER_WALL_TIMEOUT - grace - margin giây
+    GUNICORN_TIMEOUT = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+    GRADER_BATCH_SAFETY_MARGIN = 4
+    GRADER_JOB_THREADS = 4
+    GRADER_JOB_QUEUE_SIZE = 1000
+    GRADER_JOB_RETRY_TIMEOUT = 60
+    # Job queued/running quá N giây (process chấm đã chết) thì failed; job xong giữ 1 ngày
+    GRADER_JOB_STALE_TIMEOUT = 600
+    GRADER_JOB_TTL = 86400
+    GRADER_JOB_PURGE_INTERVAL = 3600
+    GRADER_MEMO_TTL = 300
+    GRADER_MEMO_PERSIST = True
+    # Kết quả lưu trong grading_results giữ 7 ngày, dọn mỗi giờ
+    GRADER_MEMO_PERSIST_TTL = 7 * 86400
+    GRADER_MEMO_PURGE_INTERVAL = 3600
+    # Số ký tự tối đa của mỗi user_result trả về/lưu trong Score
+    GRADER_RESULT_PREVIEW_CHARS = 1000
+    # Chấm lại Score khi test_cases/solutions đổi, pool riêng với traffic thật
+    GRADER_REGRADE_WORKERS = 1
+    GRADER_REGRADE_NICE = 10
+    GRADER_REGRADE_CHUNK_SIZE = 200
+    GRADER_REGRADE_ON_UPDATE = True
+    # Fair scheduling theo submitter: số bài chờ/chạy tối đa và budget giây chấm
+    GRADER_USER_QUEUE_SIZE = 4
+    GRADER_USER_BUDGET = 120
+    GRADER_USER_BUDGET_WINDOW = 300
+    # Budget/bài chờ tính riêng trong từng process; sau load balancer (ALB) đặt số
+    # proxy tin cậy để key theo X-Forwarded-For thay vì địa chỉ của proxy
+    PROXY_FIX_X_FOR = int(os.environ.get("PROXY_FIX_X_FOR", 0))
+    # Telemetry per exercise cộng dồn vào grading_stats mỗi N giây
+    GRADER_TELEMETRY_FLUSH_INTERVAL = 10
+    # Chấm in-process: recycle gunicorn worker khi RSS tăng/module bị import quá ngưỡng
+    GRADER_WATCHDOG_ENABLED = True
+    GRADER_WATCHDOG_MAX_RSS_GROWTH_MB = 256
+    GRADER_WATCHDOG_MAX_NEW_MODULES = 50
+    # Precheck trước khi exec (xem project/grading/precheck.py)
+    GRADER_MAX_ANSWER_BYTES = 64 * 1024
+    GRADER_FORBIDDEN_MODULES = [
+        "os", "sys", "subprocess", "socket", "ctypes", "multiprocessing", "threading",
+        "signal", "shutil", "importlib", "builtins", "resource", "gc",
+    ]
+    GRADER_FORBIDDEN_NAMES = ["__import__", "exec", "eval", "compile", "globals", "breakpoint"]
+    GRADER_FORBIDDEN_ATTRIBUTES = [
+        "__subclasses__", "__globals__", "__builtins__", "__code__", "__closure__",
+        "__bases__", "__mro__",
+    ]
     
     # Logging configuration
     LOG_LEVEL = logging.INFO
@@ -32,6 +111,7 @@ class DevelopmentConfig(BaseConfig):
     SQLALCHEMY_DATABASE_URI = f"postgresql://{db_user}:{db_password}@{db_url}"
     DEBUG_TB_ENABLED = True
     BCRYPT_LOG_ROUNDS = 4
+    AUTH_BCRYPT_TARGET_MS = 0
     LOG_LEVEL = logging.DEBUG
 
 
@@ -45,8 +125,18 @@ class TestingConfig(BaseConfig):
 
     SQLALCHEMY_DATABASE_URI = f"postgresql://{db_user}:{db_password}@{db_url}"
     BCRYPT_LOG_ROUNDS = 4
+    AUTH_BCRYPT_TARGET_MS = 0
     TOKEN_EXPIRATION_DAYS = 0
     TOKEN_EXPIRATION_SECONDS = 3
+    AUTH_USER_CACHE_TTL = 0
+    AUTH_EPOCH_REFRESH_INTERVAL = 0
+    AUTH_REVOCATION_REFRESH_INTERVAL = 0
+    AUTH_SIGNING_KEYS_CHECK_INTERVAL = 0
+    GRADER_WORKERS = 1
+    GRADER_EXERCISE_CACHE_TTL = 0
+    GRADER_WALL_TIMEOUT = 2
+    GRADER_CPU_LIMIT = 1
+    GRADER_REGRADE_ON_UPDATE = False
     LOG_LEVEL = logging.WARNING
 
 
@@ -58,5 +148,6 @@ class ProductionConfig(BaseConfig):
     db_url = f"{os.environ.get("DB_URL")}:{os.environ.get("DB_PORT")}/{os.environ.get("DB_NAME")}"  # e.g., "db:5432/dev"
 
     SQLALCHEMY_DATABASE_URI = f"postgresql://{db_user}:{db_password}@{db_url}"
+    PROXY_FIX_X_FOR = int(os.environ.get("PROXY_FIX_X_FOR", 1))
     LOG_LEVEL = logging.ERROR
     LOG_TO_STDOUT = True
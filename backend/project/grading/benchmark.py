@@ -0,0 +1,368 @@
+# services/users/project/grading/benchmark.py
+
+import json
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+KINDS = ("correct", "incorrect", "crashing", "slow")
+
+# Vòng lặp đốt CPU của answer "slow", khoảng vài chục ms
+SLOW_ITERATIONS = 300000
+
+# Đáp án đúng cho các exercise do `manage.py seed_db` tạo, key theo tên hàm/class
+CORRECT_ANSWERS = {
+    "sum": "def sum(a, b):\n    return a + b",
+    "reverse": "def reverse(s):\n    return s[::-1]",
+    "factorial": (
+        "def factorial(n):\n"
+        "    result = 1\n"
+        "    for i in range(2, n + 1):\n"
+        "        result *= i\n"
+        "    return result"
+    ),
+    "is_palindrome": "def is_palindrome(s):\n    return s == s[::-1]",
+    "max_in_list": "def max_in_list(lst):\n    return max(lst)",
+    "fibonacci": (
+        "def fibonacci(n):\n"
+        "    a, b = 0, 1\n"
+        "    for _ in range(n):\n"
+        "        a, b = b, a + b\n"
+        "    return a"
+    ),
+    "count_vowels": (
+        "def count_vowels(s):\n"
+        "    return len([c for c in s if c in 'aeiou'])"
+    ),
+    "is_prime": (
+        "def is_prime(n):\n"
+        "    if n < 2:\n"
+        "        return False\n"
+        "    i = 2\n"
+        "    while i * i <= n:\n"
+        "        if n % i == 0:\n"
+        "            return False\n"
+        "        i += 1\n"
+        "    return True"
+    ),
+    "list_sum": (
+        "def list_sum(lst):\n"
+        "    total = 0\n"
+        "    for x in lst:\n"
+        "        total += x\n"
+        "    return total"
+    ),
+    "remove_duplicates": "def remove_duplicates(lst):\n    return list(dict.fromkeys(lst))",
+    "capitalize_words": "def capitalize_words(s):\n    return s.title()",
+    "gcd": (
+        "def gcd(a, b):\n"
+        "    while b:\n"
+        "        a, b = b, a % b\n"
+        "    return a"
+    ),
+    "reverse_list": "def reverse_list(lst):\n    return lst[::-1]",
+    "binary_search": (
+        "def binary_search(lst, target):\n"
+        "    lo, hi = 0, len(lst) - 1\n"
+        "    while lo <= hi:\n"
+        "        mid = (lo + hi) // 2\n"
+        "        if lst[mid] == target:\n"
+        "            return mid\n"
+        "        if lst[mid] < target:\n"
+        "            lo = mid + 1\n"
+        "        else:\n"
+        "            hi = mid - 1\n"
+        "    return -1"
+    ),
+    "count_occurrences": "def count_occurrences(lst, elem):\n    return lst.count(elem)",
+    "merge_lists": "def merge_lists(lst1, lst2):\n    return lst1 + lst2",
+    "power": "def power(base, exp):\n    return base ** exp",
+    "sort_list": "def sort_list(lst):\n    return sorted(lst)",
+    "is_even": "def is_even(n):\n    return n % 2 == 0",
+    "longest_word": (
+        "def longest_word(s):\n"
+        "    return max(s.split(), key=len) if s else ''"
+    ),
+    "square_root": "def square_root(n):\n    return int(n ** 0.5)",
+    "unique_elements": (
+        "def unique_elements(lst1, lst2):\n"
+        "    return sorted(set(lst1) | set(lst2))"
+    ),
+    "average": "def average(lst):\n    return sum(lst) / len(lst) if lst else 0.0",
+    "is_anagram": "def is_anagram(s1, s2):\n    return sorted(s1) == sorted(s2)",
+    "multiply_strings": "def multiply_strings(s, n):\n    return s * n",
+    "transpose": "def transpose(matrix):\n    return [list(row) for row in zip(*matrix)]",
+    "is_leap_year": (
+        "def is_leap_year(year):\n"
+        "    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)"
+    ),
+    "merge_dicts": "def merge_dicts(d1, d2):\n    return {**d1, **d2}",
+    "fizz_buzz": (
+        "def fizz_buzz(n):\n"
+        "    if n % 15 == 0:\n"
+        "        return 'FizzBuzz'\n"
+        "    if n % 3 == 0:\n"
+        "        return 'Fizz'\n"
+        "    if n % 5 == 0:\n"
+        "        return 'Buzz'\n"
+        "    return str(n)"
+    ),
+    "roman_to_int": (
+        "def roman_to_int(s):\n"
+        "    values = {'I': 1, 'V': 5, 'X': 10, 'L': 50, 'C': 100, 'D': 500, 'M': 1000}\n"
+        "    total = 0\n"
+        "    for i, c in enumerate(s):\n"
+        "        if i + 1 < len(s) and values[c] < values[s[i + 1]]:\n"
+        "            total -= values[c]\n"
+        "        else:\n"
+        "            total += values[c]\n"
+        "    return total"
+    ),
+    "generate_primes": (
+        "def generate_primes(n):\n"
+        "    return [p for p in range(2, n + 1) if all(p % d for d in range(2, p))]"
+    ),
+    "caesar_cipher": (
+        "def caesar_cipher(s, shift):\n"
+        "    return ''.join(chr((ord(c) - 97 + shift) % 26 + 97) for c in s)"
+    ),
+    "flatten_list": "def flatten_list(lst):\n    return [x for sub in lst for x in sub]",
+    "permutations": (
+        "def permutations(lst):\n"
+        "    if not lst:\n"
+        "        return [[]]\n"
+        "    return [[x] + p for i, x in enumerate(lst)\n"
+        "            for p in permutations(lst[:i] + lst[i + 1:])]"
+    ),
+    "celsius_to_fahrenheit": "def celsius_to_fahrenheit(c):\n    return c * 9 / 5 + 32",
+    "Queue": (
+        "class Queue:\n"
+        "    def __init__(self):\n"
+        "        self.queue = []\n"
+        "    def enqueue(self, item):\n"
+        "        self.queue.append(item)\n"
+        "    def dequeue(self):\n"
+        "        return self.queue.pop(0)\n"
+        "    def is_empty(self):\n"
+        "        return not self.queue"
+    ),
+    "Stack": (
+        "class Stack:\n"
+        "    def __init__(self):\n"
+        "        self.stack = []\n"
+        "    def push(self, item):\n"
+        "        self.stack.append(item)\n"
+        "    def pop(self):\n"
+        "        return self.stack.pop()\n"
+        "    def is_empty(self):\n"
+        "        return not self.stack"
+    ),
+    "Node": (
+        "class Node:\n"
+        "    def __init__(self, value):\n"
+        "        self.value = value\n"
+        "        self.next = None"
+    ),
+    "tree_height": (
+        "def tree_height(root):\n"
+        "    if root is None:\n"
+        "        return 0\n"
+        "    return 1 + max(tree_height(root.left), tree_height(root.right))"
+    ),
+    "is_valid_email": (
+        "import re\n"
+        "def is_valid_email(email):\n"
+        "    return re.fullmatch(r'[^@\\s]+@[^@\\s]+\\.[^@\\s]+', email) is not None"
+    ),
+    "random_between": "import random\ndef random_between(a, b):\n    return random.randint(a, b)",
+    "parse_json": "import json\ndef parse_json(s):\n    return json.loads(s)",
+    "read_file": (
+        "def read_file(filename):\n"
+        "    with open(filename) as f:\n"
+        "        return f.read()"
+    ),
+    "days_between": (
+        "from datetime import datetime\n"
+        "def days_between(d1, d2):\n"
+        "    fmt = '%Y-%m-%d'\n"
+        "    return abs((datetime.strptime(d2, fmt) - datetime.strptime(d1, fmt)).days)"
+    ),
+    "hex_to_dec": "def hex_to_dec(h):\n    return int(h, 16)",
+    "bin_to_dec": "def bin_to_dec(b):\n    return int(b, 2)",
+    "shuffle_list": (
+        "import random\n"
+        "def shuffle_list(lst):\n"
+        "    return random.sample(lst, len(lst))"
+    ),
+    "circle_area": "import math\ndef circle_area(r):\n    return math.pi * r * r",
+    "find_median": (
+        "def find_median(lst):\n"
+        "    if not lst:\n"
+        "        return None\n"
+        "    s = sorted(lst)\n"
+        "    mid = len(s) // 2\n"
+        "    return s[mid] if len(s) % 2 else (s[mid - 1] + s[mid]) / 2"
+    ),
+    "tower_of_hanoi": (
+        "def tower_of_hanoi(n):\n"
+        "    if n == 0:\n"
+        "        return 0\n"
+        "    return 2 * tower_of_hanoi(n - 1) + 1"
+    ),
+}
+
+
+def exercise_name(exercise):
+    """Name of the function or class an exercise body asks for"""
+    match = re.search(r"^(def|class) (\w+)", exercise["body"], re.M)
+    return (match.group(1), match.group(2)) if match else ("def", "solution")
+
+
+def reference_answer(exercise, kind):
+    """Build a correct, incorrect, crashing or slow answer for a seeded exercise"""
+    keyword, name = exercise_name(exercise)
+    if kind == "incorrect":
+        if keyword == "class":
+            return f"class {name}:\n    pass"
+        return f"def {name}(*args, **kwargs):\n    return None"
+    if kind == "crashing":
+        if keyword == "class":
+            return f"class {name}:\n    def __init__(self, *args):\n        raise RuntimeError('benchmark crash')"
+        return f"def {name}(*args, **kwargs):\n    raise RuntimeError('benchmark crash')"
+
+    answer = CORRECT_ANSWERS.get(name, f"def {name}(*args, **kwargs):\n    return None")
+    if kind == "slow":
+        answer = f"_burn = sum(i * i for i in range({SLOW_ITERATIONS}))\n{answer}"
+    return answer
+
+
+def build_payloads(exercises, kind, mode, count, unique=True):
+    """Cycle through exercises building validate_code payloads"""
+    payloads = []
+    for i in range(count):
+        exercise = exercises[i % len(exercises)]
+        answer = reference_answer(exercise, kind)
+        if unique:
+            # Comment khác nhau để memo không trả kết quả có sẵn
+            answer = f"{answer}\n# benchmark {time.monotonic_ns()} {i}"
+        payloads.append({"exercise_id": exercise["id"], "answer": answer, "mode": mode})
+    return payloads
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(q / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class ClientSender:
+    """Send requests through the Flask test client, one client per thread"""
+
+    def __init__(self, app, token=None):
+        self.app = app
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self._local = threading.local()
+
+    def _client(self):
+        if not hasattr(self._local, "client"):
+            self._local.client = self.app.test_client()
+        return self._local.client
+
+    def get(self, path):
+        response = self._client().get(path, headers=self.headers)
+        return response.status_code, json.loads(response.data.decode())
+
+    def post(self, path, payload):
+        response = self._client().post(
+            path,
+            data=json.dumps(payload),
+            content_type="application/json",
+            headers=self.headers,
+        )
+        return response.status_code, json.loads(response.data.decode())
+
+
+class HttpSender:
+    """Send requests to a running server, e.g. a local gunicorn"""
+
+    def __init__(self, base_url, timeout=60, token=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+
+    def _open(self, request):
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read().decode())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read().decode() or "{}")
+
+    def get(self, path):
+        return self._open(urllib.request.Request(self.base_url + path, headers=self.headers))
+
+    def post(self, path, payload):
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(payload).encode(),
+            headers={"Content-Type": "application/json", **self.headers},
+            method="POST",
+        )
+        return self._open(request)
+
+
+def load_exercises(sender):
+    status, data = sender.get("/exercises/")
+    if status != 200:
+        raise RuntimeError(f"Cannot load exercises: HTTP {status}")
+    return data["data"]["exercises"]
+
+
+def run_benchmark(sender, payloads, concurrency):
+    """
+    Post payloads to validate_code with a fixed concurrency - :return: dict of stats
+    """
+    def timed(payload):
+        started = time.perf_counter()
+        try:
+            status, _ = sender.post("/exercises/validate_code", payload)
+        except Exception:
+            status = None
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(timed, payloads))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    statuses = {}
+    for _, status in samples:
+        statuses[status] = statuses.get(status, 0) + 1
+    return {
+        "requests": len(samples),
+        "throughput": len(samples) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p90_ms": percentile(latencies, 90),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": latencies[-1] if latencies else 0.0,
+        "statuses": statuses,
+    }
+
+
+def format_row(mode, concurrency, kind, stats):
+    statuses = " ".join(f"{k}:{v}" for k, v in sorted(stats["statuses"].items(), key=str))
+    return (
+        f"{mode:<10} {concurrency:>5} {kind:<10} {stats['requests']:>6} "
+        f"{stats['throughput']:>9.1f} {stats['p50_ms']:>9.1f} {stats['p90_ms']:>9.1f} "
+        f"{stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}  {statuses}"
+    )
+
+
+HEADER = (
+    f"{'mode':<10} {'conc':>5} {'kind':<10} {'reqs':>6} {'req/s':>9} "
+    f"{'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}  statuses"
+)
@@ -0,0 +1,181 @@
+# services/users/project/grading/jobs.py
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import exc
+
+from project import db
+from project.api.models import GradingJob
+from project.grading.pool import GraderBusy
+from project.grading.service import grade_submission
+from project.logger import get_logger
+
+# Get logger for this module
+logger = get_logger("grading_jobs")
+
+UNFINISHED_STATES = ("queued", "running")
+
+# Body của job mà process chấm nó đã chết (restart, OOM...) trước khi xong
+LOST_JOB_RESULT = {"status": "error", "message": "Grading job was lost, please resubmit!"}
+
+
+class JobRunner:
+    """
+    Background executor for asynchronous grading jobs.
+
+    Trạng thái job lưu trong bảng grading_jobs nên gunicorn worker nào cũng poll
+    được; task chỉ nằm trong memory của process đã nhận job. Process đó chết thì
+    job queued/running không đổi quá GRADER_JOB_STALE_TIMEOUT giây bị đánh dấu
+    failed, và cứ GRADER_JOB_PURGE_INTERVAL giây xoá job xong quá GRADER_JOB_TTL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._pending = 0
+        self._purged_at = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=current_app.config["GRADER_JOB_THREADS"],
+                    thread_name_prefix="grading-job",
+                )
+                self._pending = 0
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, exercise_id, task):
+        """Queue a grading task - :return: GradingJob"""
+        self.maybe_purge()
+        executor = self._get_executor()
+        with self._lock:
+            if self._pending >= current_app.config["GRADER_JOB_QUEUE_SIZE"]:
+                logger.warning("Grading job queue is full, rejecting job")
+                raise GraderBusy("Too many pending grading jobs")
+            self._pending += 1
+
+        try:
+            job = GradingJob(exercise_id=exercise_id)
+            db.session.add(job)
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"Failed to create grading job: {str(e)}")
+            db.session.rollback()
+            with self._lock:
+                self._pending -= 1
+            raise e
+
+        app = current_app._get_current_object()
+        executor.submit(self._run, app, job.id, task)
+        logger.info(f"Grading job {job.id} queued for exercise {exercise_id}")
+        return job
+
+    def _run(self, app, job_id, task):
+        try:
+            with app.app_context():
+                job = db.session.get(GradingJob, job_id)
+                if job is None or job.state != "queued":
+                    # Đợi quá lâu nên đã bị đánh dấu failed (hoặc bị purge)
+                    logger.warning(f"Grading job {job_id} is no longer queued, skipping")
+                    return
+                job.state = "running"
+                db.session.commit()
+
+                try:
+                    body, code = self._grade(task)
+                    job.state = "done"
+                except Exception as e:
+                    logger.error(f"Grading job {job_id} failed: {str(e)}")
+                    logger.exception("Full traceback:")
+                    body, code = {"status": "error", "message": "Internal server error"}, 500
+                    job.state = "failed"
+                job.result = body
+                job.status_code = code
+                db.session.commit()
+                logger.debug(f"Grading job {job_id} finished with state {job.state}")
+        except Exception as e:
+            logger.error(f"Failed to update grading job {job_id}: {str(e)}")
+            logger.exception("Full traceback:")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _grade(self, task):
+        # Job không bị giới hạn bởi HTTP timeout nên đợi pool rảnh thay vì fail
+        deadline = time.monotonic() + current_app.config["GRADER_JOB_RETRY_TIMEOUT"]
+        while True:
+            body, code = grade_submission(task)
+            if code != 503 or time.monotonic() >= deadline:
+                return body, code
+            time.sleep(0.5)
+
+    def get(self, job_id):
+        """Load a job, failing it first if it has been unfinished for too long - :return: GradingJob"""
+        self.fail_stale(job_id)
+        return db.session.get(GradingJob, job_id)
+
+    def fail_stale(self, job_id=None):
+        """Mark queued/running jobs not updated for GRADER_JOB_STALE_TIMEOUT seconds as failed"""
+        cutoff = datetime.now(timezone.utc) - timedelta(
+            seconds=current_app.config["GRADER_JOB_STALE_TIMEOUT"]
+        )
+        query = GradingJob.query.filter(
+            GradingJob.state.in_(UNFINISHED_STATES), GradingJob.updated_at < cutoff
+        )
+        if job_id is not None:
+            query = query.filter(GradingJob.id == job_id)
+        try:
+            count = query.update(
+                {
+                    GradingJob.state: "failed",
+                    GradingJob.status_code: 500,
+                    GradingJob.result: LOST_JOB_RESULT,
+                    GradingJob.updated_at: datetime.now(timezone.utc),
+                },
+                synchronize_session=False,
+            )
+            db.session.commit()
+        except exc.SQLAlchemyError as e:
+            logger.error(f"Failed to fail stale grading jobs: {str(e)}")
+            db.session.rollback()
+            return 0
+        if count:
+            logger.warning(f"Marked {count} stale grading jobs as failed")
+        return count
+
+    def maybe_purge(self):
+        interval = current_app.config["GRADER_JOB_PURGE_INTERVAL"]
+        with self._lock:
+            purged_at = self._purged_at
+        if purged_at is None or time.monotonic() - purged_at >= interval:
+            self.purge()
+
+    def purge(self):
+        """Fail stale jobs, then delete finished jobs older than GRADER_JOB_TTL"""
+        with self._lock:
+            self._purged_at = time.monotonic()
+        self.fail_stale()
+        cutoff = datetime.now(timezone.utc) - timedelta(
+            seconds=current_app.config["GRADER_JOB_TTL"]
+        )
+        try:
+            count = GradingJob.query.filter(
+                GradingJob.state.notin_(UNFINISHED_STATES), GradingJob.updated_at < cutoff
+            ).delete(synchronize_session=False)
+            db.session.commit()
+        except exc.SQLAlchemyError as e:
+            logger.error(f"Failed to purge grading jobs: {str(e)}")
+            db.session.rollback()
+            return
+        logger.debug(f"Purged {count} finished grading jobs")
+
+
+job_runner = JobRunner()
@@ -0,0 +1,188 @@
+# services/users/project/grading/memo.py
+
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import exc
+
+from project import db
+from project.api.models import GradingResult
+from project.cache import LRUCache
+from project.logger import get_logger
+
+# Get logger for this module
+logger = get_logger("grading_memo")
+
+
+def normalize_answer(answer):
+    """Normalize line endings and trailing whitespace, which never change semantics"""
+    return answer.replace("\r\n", "\n").replace("\r", "\n").rstrip()
+
+
+def submission_digest(task):
+    """sha256 of (exercise_id, revision, normalized answer)"""
+    exercise_id, revision = task["key"]
+    # fail_fast trả kết quả rút gọn nên không dùng chung entry với chế độ khác
+    fail_fast = task.get("mode") == "fail_fast"
+    digest = hashlib.sha256(f"{exercise_id}:{revision}:{fail_fast:d}\0".encode())
+    digest.update(normalize_answer(task["answer"]).encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+
+def memo_digest(task):
+    """submission_digest of a task, or None if its result must not be memoized"""
+    if not isinstance(task["answer"], str) or is_timed(task):
+        return None
+    return submission_digest(task)
+
+
+def is_timed(task):
+    """Whether any test has a time limit, so its result depends on machine load"""
+    return any(limit is not None for limit in task.get("limits") or [])
+
+
+class ResultMemo:
+    """
+    Two-tier memo of grading responses by submission hash.
+
+    Tầng 1 là LRU in-process có TTL (GRADER_MEMO_TTL), tầng 2 là bảng
+    grading_results nên kết quả vẫn còn sau khi worker restart. Revision nằm
+    trong hash nên sửa exercise thì các entry cũ tự động không còn được dùng.
+    Exercise có time limit không được memo: time_ok phụ thuộc tải của máy lúc
+    chấm, lần chấm sau có thể ra kết quả khác. Row cũ hơn GRADER_MEMO_PERSIST_TTL
+    giây bị xoá mỗi GRADER_MEMO_PURGE_INTERVAL giây.
+    """
+
+    def __init__(self, maxsize=4096):
+        self._local = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._purged_at = None
+
+    def get(self, task):
+        """Return the memoized (body, status code) for a task, or None"""
+        digest = memo_digest(task)
+        if digest is None:
+            return None
+        cached = self._local.get(digest)
+        if cached is not None:
+            logger.debug(f"Grading memo hit (local) for {digest}")
+            return cached
+
+        if not current_app.config["GRADER_MEMO_PERSIST"]:
+            return None
+        try:
+            row = db.session.get(GradingResult, digest)
+        except exc.SQLAlchemyError as e:
+            logger.error(f"Failed to read grading memo {digest}: {str(e)}")
+            db.session.rollback()
+            return None
+        if row is None:
+            return None
+
+        logger.debug(f"Grading memo hit (db) for {digest}")
+        cached = (row.result, row.status_code)
+        self._local.set(digest, cached, ttl=current_app.config["GRADER_MEMO_TTL"])
+        return cached
+
+    def get_many(self, tasks):
+        """Memoized (body, status code) of many tasks with one query - :return: {digest: tuple}"""
+        ttl = current_app.config["GRADER_MEMO_TTL"]
+        found = {}
+        missing = set()
+        for task in tasks:
+            digest = memo_digest(task)
+            if digest is None or digest in found:
+                continue
+            cached = self._local.get(digest)
+            if cached is not None:
+                found[digest] = cached
+            else:
+                missing.add(digest)
+
+        if not missing or not current_app.config["GRADER_MEMO_PERSIST"]:
+            return found
+        try:
+            rows = GradingResult.query.filter(GradingResult.digest.in_(missing)).all()
+        except exc.SQLAlchemyError as e:
+            logger.error(f"Failed to read grading memo: {str(e)}")
+            db.session.rollback()
+            return found
+        for row in rows:
+            found[row.digest] = (row.result, row.status_code)
+            self._local.set(row.digest, found[row.digest], ttl=ttl)
+        logger.debug(f"Grading memo hits (db): {len(rows)} of {len(missing)}")
+        return found
+
+    def put(self, task, body, code):
+        self.put_many([(task, body, code)])
+
+    def put_many(self, entries):
+        """Memoize many (task, body, status code) entries, persisting them in one commit"""
+        ttl = current_app.config["GRADER_MEMO_TTL"]
+        rows = {}
+        for task, body, code in entries:
+            digest = memo_digest(task)
+            if digest is None:
+                continue
+            self._local.set(digest, (body, code), ttl=ttl)
+            rows[digest] = GradingResult(
+                digest=digest, exercise_id=task["key"][0], status_code=code, result=body
+            )
+
+        if not rows or not current_app.config["GRADER_MEMO_PERSIST"]:
+            return
+        self.maybe_purge()
+        try:
+            db.session.add_all(rows.values())
+            db.session.commit()
+        except exc.IntegrityError:
+            # Worker khác vừa lưu một vài submission trong số này, lưu lại từng row
+            db.session.rollback()
+            if len(rows) > 1:
+                for task, body, code in entries:
+                    self.put(task, body, code)
+        except exc.SQLAlchemyError as e:
+            logger.error(f"Failed to persist {len(rows)} grading memo rows: {str(e)}")
+            db.session.rollback()
+
+    def maybe_purge(self):
+        interval = current_app.config["GRADER_MEMO_PURGE_INTERVAL"]
+        with self._lock:
+            purged_at = self._purged_at
+        if purged_at is None or time.monotonic() - purged_at >= interval:
+            self.purge()
+
+    def purge(self):
+        """Delete persisted results older than GRADER_MEMO_PERSIST_TTL"""
+        with self._lock:
+            self._purged_at = time.monotonic()
+        cutoff = datetime.now(timezone.utc) - timedelta(
+            seconds=current_app.config["GRADER_MEMO_PERSIST_TTL"]
+        )
+        try:
+            count = GradingResult.query.filter(GradingResult.created_at < cutoff).delete(
+                synchronize_session=False
+            )
+            db.session.commit()
+        except exc.SQLAlchemyError as e:
+            logger.error(f"Failed to purge grading memo: {str(e)}")
+            db.session.rollback()
+            return
+        logger.debug(f"Purged {count} persisted grading results")
+
+    def forget_exercise(self, exercise_id):
+        """Drop persisted results of every revision of an exercise"""
+        try:
+            GradingResult.query.filter_by(exercise_id=exercise_id).delete()
+            db.session.commit()
+        except exc.SQLAlchemyError as e:
+            logger.error(
+                f"Failed to delete grading memo for exercise {exercise_id}: {str(e)}"
+            )
+            db.session.rollback()
+
+
+result_memo = ResultMemo()
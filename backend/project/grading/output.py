@@ -0,0 +1,111 @@
+# services/users/project/grading/output.py
+
+PREVIEW_CHARS = 1000
+
+TRUNCATED_MARK = "... [truncated]"
+
+_CONTAINERS = (list, tuple, dict, set, frozenset)
+
+
+def _iter_repr(obj, active):
+    """Yield repr(obj) piece by piece for builtin containers"""
+    kind = type(obj)
+    if kind not in _CONTAINERS:
+        yield repr(obj)
+        return
+
+    if id(obj) in active:
+        # Giống repr() của list/dict tự chứa chính nó
+        yield {list: "[...]", dict: "{...}"}.get(kind, "...")
+        return
+
+    if kind in (set, frozenset) and not obj:
+        yield f"{kind.__name__}()"
+        return
+
+    open_, close = {
+        list: ("[", "]"),
+        tuple: ("(", ")"),
+        dict: ("{", "}"),
+        set: ("{", "}"),
+        frozenset: ("frozenset({", "})"),
+    }[kind]
+
+    active.add(id(obj))
+    try:
+        yield open_
+        items = obj.items() if kind is dict else obj
+        for index, item in enumerate(items):
+            if index:
+                yield ", "
+            if kind is dict:
+                yield from _iter_repr(item[0], active)
+                yield ": "
+                yield from _iter_repr(item[1], active)
+            else:
+                yield from _iter_repr(item, active)
+        if kind is tuple and len(obj) == 1:
+            yield ","
+        yield close
+    finally:
+        active.discard(id(obj))
+
+
+def iter_str(obj):
+    """
+    Yield str(obj) in pieces so a huge builtin container is never rendered in full.
+
+    Chỉ tách nhỏ list/tuple/dict/set đúng kiểu builtin; subclass và object khác
+    có thể override __str__/__repr__ nên vẫn gọi str()/repr() như cũ.
+    """
+    if type(obj) in _CONTAINERS:
+        yield from _iter_repr(obj, set())
+    else:
+        yield str(obj)
+
+
+def truncate(text, limit=PREVIEW_CHARS):
+    """Cut text to limit characters, marking it as truncated"""
+    if not isinstance(text, str) or len(text) <= limit:
+        return text
+    return text[:limit] + TRUNCATED_MARK
+
+
+def truncate_results(user_results, limit=PREVIEW_CHARS):
+    """Truncate every string of a user_results list, leaving anything else untouched"""
+    if not isinstance(user_results, list):
+        return user_results
+    return [truncate(value, limit) for value in user_results]
+
+
+def compare_output(obj, expected, limit=PREVIEW_CHARS):
+    """
+    Compare str(obj) with expected without building the whole string - :return: (ok, preview)
+
+    Dừng render khi đã chắc chắn sai và đã đủ limit ký tự cho preview, nên kết quả
+    khổng lồ không bao giờ được materialize hay gửi qua pipe.
+    """
+    # Exercise cũ có thể lưu solution không phải string (vd. số)
+    expected = str(expected)
+    ok = True
+    position = 0
+    preview = []
+    preview_size = 0
+    truncated = False
+
+    for piece in iter_str(obj):
+        if ok:
+            ok = expected.startswith(piece, position)
+        position += len(piece)
+
+        if preview_size < limit:
+            preview.append(piece[: limit - preview_size])
+            preview_size += len(preview[-1])
+        if position > limit:
+            truncated = True
+            if not ok:
+                break
+
+    ok = ok and position == len(expected)
+    preview = "".join(preview)
+    return ok, preview + TRUNCATED_MARK if truncated else preview
@@ -0,0 +1,508 @@
+# services/users/project/grading/pool.py
+
+import gc
+import importlib
+import math
+import multiprocessing
+import os
+import queue
+import resource
+import select
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from project.grading.output import PREVIEW_CHARS
+from project.grading.precheck import (
+    FORBIDDEN_ATTRIBUTES,
+    FORBIDDEN_MODULES,
+    FORBIDDEN_NAMES,
+    MAX_ANSWER_BYTES,
+    compile_answer,
+)
+from project.grading.runner import CompilationError, grade, iter_results
+from project.grading.scheduler import BudgetExceeded, FairScheduler
+from project.grading.testcases import (
+    InputGenerationError,
+    build_inputs,
+    compile_tests,
+    share_generated_inputs,
+)
+from project.grading.watchdog import watchdog
+from project.logger import get_logger
+
+# Get logger for this module
+logger = get_logger("grading_pool")
+
+# Module stdlib mà các exercise hay dùng, import sẵn trong fork server
+PRELOAD_MODULES = ("math", "json", "collections", "re", "datetime", "random")
+
+# Thời gian pool đợi thêm sau GRADER_WALL_TIMEOUT khi fork server tự kill child
+FORK_SERVER_GRACE = 1
+
+
+class GraderError(Exception):
+    """Base class for grading pool failures"""
+
+
+class GraderBusy(GraderError):
+    """Raised when the grading queue is full"""
+
+
+class GraderQuotaExceeded(GraderBusy):
+    """Raised when a submitter has used up its grading time budget"""
+
+
+class GraderTimeout(GraderError):
+    """Raised when a submission exceeds its wall-clock limit"""
+
+
+class GraderCrashed(GraderError):
+    """Raised when a grading process dies while running a submission"""
+
+
+def execute(task):
+    """Run a grading task in the current process"""
+    return grade(
+        task["answer"],
+        task["tests"],
+        task["solutions"],
+        task.get("key"),
+        fail_fast=task.get("mode") == "fail_fast",
+        preview_chars=task.get("preview_chars", PREVIEW_CHARS),
+        limits=task.get("limits"),
+        setups=task.get("setups"),
+    )
+
+
+def iter_execute(task):
+    """Run a grading task in the current process test by test"""
+    return iter_results(
+        task["answer"],
+        task["tests"],
+        task["solutions"],
+        task.get("key"),
+        fail_fast=task.get("mode") == "fail_fast",
+        preview_chars=task.get("preview_chars", PREVIEW_CHARS),
+        limits=task.get("limits"),
+        setups=task.get("setups"),
+    )
+
+
+def _apply_cpu_limit(cpu_limit):
+    """Allow the worker cpu_limit more seconds of CPU from now on"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = usage.ru_utime + usage.ru_stime
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = math.ceil(used + cpu_limit)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _handle(conn, task):
+    """Grade one task in this process and send its messages back"""
+    try:
+        if task.get("stream"):
+            for item in iter_execute(task):
+                conn.send(("test", item))
+            outcome = ("done", None)
+        else:
+            outcome = ("ok", execute(task))
+    except CompilationError as e:
+        outcome = ("compile_error", str(e))
+    except BaseException as e:
+        outcome = ("error", f"{type(e).__name__}: {str(e)}")
+    conn.send(outcome)
+
+
+def _wait_child(pid, timeout):
+    """Wait for a forked child - :return: wait status, or None on timeout"""
+    deadline = time.monotonic() + timeout
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        pidfd = None
+
+    if pidfd is not None:
+        try:
+            select.select([pidfd], [], [], timeout)
+        finally:
+            os.close(pidfd)
+        done, status = os.waitpid(pid, os.WNOHANG)
+        return status if done else None
+
+    while True:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            return status
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        time.sleep(min(0.005, remaining))
+
+
+def _fork_and_handle(conn, task, cpu_limit):
+    """Grade a task in a copy-on-write child of this fork server"""
+    # Compile/sinh input trong fork server để cache còn lại cho các submission sau
+    key = task.get("key")
+    compile_tests(task["tests"], key)
+    try:
+        compile_answer(task["answer"])
+    except CompilationError:
+        pass  # child báo lỗi như bình thường
+    for index, setup in enumerate(task.get("setups") or []):
+        if setup is not None and key is not None:
+            try:
+                build_inputs(setup, key + ("input", index))
+            except InputGenerationError:
+                pass  # test đó báo lỗi trong child
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            share_generated_inputs()
+            _apply_cpu_limit(cpu_limit)
+            _handle(conn, task)
+            os._exit(0)
+        finally:
+            os._exit(1)
+
+    status = _wait_child(pid, task["wall_timeout"])
+    if status is None:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        conn.send(("timeout", None))
+        return
+
+    exitcode = os.waitstatus_to_exitcode(status)
+    if exitcode == -signal.SIGXCPU:
+        conn.send(("cpu_limit", None))
+    elif exitcode != 0:
+        conn.send(("error", f"Grading process crashed with exit code {exitcode}"))
+
+
+def _worker_main(conn, cpu_limit, fork, preload, niceness):
+    """Grading process loop: receive a task, grade it, send the outcome back"""
+    if niceness:
+        # Pool nền (regrade) nhường CPU cho traffic thật, child fork ra cũng kế thừa
+        os.nice(niceness)
+    # Không kế thừa signal handler của gunicorn worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for sig in (signal.SIGTERM, signal.SIGQUIT, signal.SIGHUP, signal.SIGUSR1):
+        signal.signal(sig, signal.SIG_DFL)
+    # Process group riêng để kill được cả submission đang chạy
+    os.setpgrp()
+
+    if fork:
+        for name in preload:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                logger.warning(f"Cannot preload module {name} in grading worker")
+        # Object đã load không bị GC chạm tới, page giữ nguyên copy-on-write
+        gc.collect()
+        gc.freeze()
+
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            break
+
+        if fork:
+            _fork_and_handle(conn, task, cpu_limit)
+        else:
+            _apply_cpu_limit(cpu_limit)
+            _handle(conn, task)
+
+
+class _Worker:
+    """A pre-started grading process and the parent end of its pipe"""
+
+    def __init__(self, ctx, cpu_limit, fork, preload, niceness=0):
+        self.ctx = ctx
+        self.args = (cpu_limit, fork, preload, niceness)
+        self.start()
+
+    def start(self):
+        self.conn, child_conn = self.ctx.Pipe()
+        self.process = self.ctx.Process(
+            target=_worker_main, args=(child_conn,) + self.args, daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        logger.debug(f"Grading worker started with pid {self.process.pid}")
+
+    def kill(self):
+        self.conn.close()
+        if self.process.is_alive():
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except OSError:
+                self.process.kill()
+        self.process.join()
+
+    def restart(self):
+        logger.warning(f"Respawning grading worker {self.process.pid}")
+        self.kill()
+        self.start()
+
+
+def _context():
+    """Multiprocessing context grading workers are started from - :return: forkserver context"""
+    # Fork thẳng từ gunicorn worker có thể kế thừa lock đang bị request thread,
+    # JobRunner, RegradeRunner hay thread bcrypt giữ và deadlock. Forkserver là
+    # process riêng một thread, đã import sẵn module này nên respawn vẫn nhanh
+    ctx = multiprocessing.get_context("forkserver")
+    ctx.set_forkserver_preload([__name__])
+    return ctx
+
+
+def _raise_for(kind, payload):
+    """Turn a failed worker outcome into the matching exception"""
+    if kind == "compile_error":
+        raise CompilationError(payload)
+    if kind == "timeout":
+        raise GraderTimeout("Time limit exceeded")
+    if kind == "cpu_limit":
+        raise GraderTimeout("CPU time limit exceeded")
+    if kind == "error":
+        raise GraderCrashed(payload)
+
+
+class GraderPool:
+    """
+    Pre-started pool of grading processes with a bounded queue.
+
+    Mỗi gunicorn worker có pool riêng, khởi tạo lazy ở lần grade đầu tiên.
+    Process chấm bài được tạo từ forkserver chứ không fork từ worker nhiều thread.
+    GRADER_FORK_PER_SUBMISSION thì mỗi worker là một fork server đã preload
+    GRADER_PRELOAD_MODULES và fork một child copy-on-write cho từng submission.
+    GRADER_WORKERS = 0 thì chạy in-process như trước. Pool khác (regrade) dùng
+    setting số worker và độ nice riêng nên không tranh CPU với traffic thật.
+    """
+
+    def __init__(
+        self, app=None, name="grader", workers_setting="GRADER_WORKERS", nice_setting=None
+    ):
+        self.name = name
+        self.workers_setting = workers_setting
+        self.nice_setting = nice_setting
+        self._lock = threading.Lock()
+        self._pid = None
+        self._workers = []
+        self._scheduler = None
+        self._slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault(self.workers_setting, 2)
+        app.config.setdefault("GRADER_QUEUE_SIZE", 8)
+        app.config.setdefault("GRADER_QUEUE_TIMEOUT", 5)
+        app.config.setdefault("GRADER_WALL_TIMEOUT", 10)
+        app.config.setdefault("GRADER_CPU_LIMIT", 5)
+        app.config.setdefault("GRADER_FORK_PER_SUBMISSION", True)
+        app.config.setdefault("GRADER_PRELOAD_MODULES", PRELOAD_MODULES)
+        app.config.setdefault("GRADER_MAX_ANSWER_BYTES", MAX_ANSWER_BYTES)
+        app.config.setdefault("GRADER_RESULT_PREVIEW_CHARS", PREVIEW_CHARS)
+        app.config.setdefault("GRADER_USER_QUEUE_SIZE", 0)
+        app.config.setdefault("GRADER_USER_BUDGET", 0)
+        app.config.setdefault("GRADER_USER_BUDGET_WINDOW", 0)
+        app.config.setdefault("GRADER_TELEMETRY_FLUSH_INTERVAL", 10)
+        app.config.setdefault("GRADER_WATCHDOG_ENABLED", True)
+        app.config.setdefault("GRADER_WATCHDOG_MAX_RSS_GROWTH_MB", 256)
+        app.config.setdefault("GRADER_WATCHDOG_MAX_NEW_MODULES", 50)
+        app.config.setdefault("GRADER_FORBIDDEN_MODULES", FORBIDDEN_MODULES)
+        app.config.setdefault("GRADER_FORBIDDEN_NAMES", FORBIDDEN_NAMES)
+        app.config.setdefault("GRADER_FORBIDDEN_ATTRIBUTES", FORBIDDEN_ATTRIBUTES)
+        app.extensions[self.name] = self
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Pool tạo trước khi fork (gunicorn --preload) không dùng lại được
+            size = current_app.config[self.workers_setting]
+            queue_size = current_app.config["GRADER_QUEUE_SIZE"]
+            cpu_limit = current_app.config["GRADER_CPU_LIMIT"]
+            fork = current_app.config["GRADER_FORK_PER_SUBMISSION"]
+            preload = tuple(current_app.config["GRADER_PRELOAD_MODULES"])
+            niceness = current_app.config.get(self.nice_setting, 0) if self.nice_setting else 0
+            ctx = _context()
+
+            self._workers = [
+                _Worker(ctx, cpu_limit, fork, preload, niceness) for _ in range(size)
+            ]
+            self._scheduler = FairScheduler(
+                budget=current_app.config["GRADER_USER_BUDGET"],
+                window=current_app.config["GRADER_USER_BUDGET_WINDOW"],
+                max_pending=current_app.config["GRADER_USER_QUEUE_SIZE"],
+            )
+            for worker in self._workers:
+                self._scheduler.add_worker(worker)
+            self._slots = threading.BoundedSemaphore(size + queue_size)
+            self._pid = os.getpid()
+            logger.info(f"Grading pool {self.name} started with {size} workers")
+
+    def shutdown(self):
+        """Kill every grading process owned by this process"""
+        with self._lock:
+            if self._pid == os.getpid():
+                for worker in self._workers:
+                    worker.kill()
+            self._workers = []
+            self._pid = None
+
+    def run(self, task):
+        """
+        Grade a task dict (answer, tests, solutions, key, mode) - :return: dict with results, user_results and metrics
+        """
+        if current_app.config[self.workers_setting] <= 0:
+            with watchdog.guard():
+                return execute(task)
+
+        worker = self._acquire(task)
+        started = time.monotonic()
+        try:
+            deadline = self._send(worker, task)
+            kind, payload = self._receive(worker, deadline)
+        finally:
+            self._release(worker, task, started)
+
+        _raise_for(kind, payload)
+        return payload
+
+    def stream(self, task):
+        """
+        Grade a task test by test - yields (user_str, ok, metrics) as soon as each test finishes
+        """
+        if current_app.config[self.workers_setting] <= 0:
+            with watchdog.guard():
+                yield from iter_execute(task)
+            return
+
+        worker = self._acquire(task)
+        started = time.monotonic()
+        finished = False
+        try:
+            deadline = self._send(worker, dict(task, stream=True))
+            while True:
+                try:
+                    kind, payload = self._receive(worker, deadline)
+                except GraderError:
+                    finished = True  # _receive đã respawn worker
+                    raise
+                if kind != "test":
+                    break
+                yield payload
+            finished = True
+        finally:
+            if not finished:
+                # Client ngắt giữa chừng, worker vẫn đang chạy dở submission
+                worker.restart()
+            self._release(worker, task, started)
+
+        _raise_for(kind, payload)
+
+    def _acquire(self, task):
+        """Wait for a worker in the submitter's fair share of the pool"""
+        self._ensure_started()
+        if not self._slots.acquire(blocking=False):
+            logger.warning("Grading queue is full, rejecting submission")
+            raise GraderBusy("Grading queue is full")
+        timeout = current_app.config["GRADER_QUEUE_TIMEOUT"]
+        if task.get("queue_deadline") is not None:
+            # Batch không được chờ quá deadline của nó (xem batch_deadline)
+            timeout = min(timeout, task["queue_deadline"] - time.monotonic())
+        try:
+            return self._scheduler.acquire(
+                task.get("user"),
+                timeout,
+                metered=task.get("metered", False),
+                capped=task.get("capped", True),
+            )
+        except BudgetExceeded as e:
+            self._slots.release()
+            logger.warning(f"Submitter {task.get('user')} exceeded its grading budget")
+            raise GraderQuotaExceeded(str(e))
+        except queue.Empty:
+            self._slots.release()
+            logger.warning(f"No grading worker for submitter {task.get('user')}")
+            raise GraderBusy("No grading worker available")
+
+    def _release(self, worker, task, started):
+        # Tính phí theo thời gian chiếm worker, kể cả bài bị timeout/crash
+        self._scheduler.release(
+            worker,
+            task.get("user"),
+            time.monotonic() - started,
+            task.get("weight", 1),
+            metered=task.get("metered", False),
+        )
+        self._slots.release()
+
+    def _send(self, worker, task):
+        """Send a task to a worker - :return: deadline for its outcome"""
+        wall_timeout = current_app.config["GRADER_WALL_TIMEOUT"]
+        deadline = time.monotonic() + wall_timeout
+        if current_app.config["GRADER_FORK_PER_SUBMISSION"]:
+            # Fork server tự kill submission quá giờ, pool chỉ là chốt chặn cuối
+            deadline += FORK_SERVER_GRACE
+        try:
+            worker.conn.send(dict(task, wall_timeout=wall_timeout))
+        except (OSError, BrokenPipeError):
+            self._crashed(worker)
+        return deadline
+
+    def _receive(self, worker, deadline):
+        """Wait for the next message from a worker, killing it past the deadline"""
+        try:
+            if not worker.conn.poll(max(deadline - time.monotonic(), 0)):
+                logger.warning(
+                    f"Grading worker {worker.process.pid} exceeded its wall-clock limit"
+                )
+                worker.restart()
+                raise GraderTimeout("Time limit exceeded")
+            return worker.conn.recv()
+        except (EOFError, OSError, BrokenPipeError):
+            self._crashed(worker)
+
+    def _crashed(self, worker):
+        worker.process.join(timeout=1)
+        exitcode = worker.process.exitcode
+        logger.warning(
+            f"Grading worker {worker.process.pid} died with exit code {exitcode}"
+        )
+        worker.restart()
+        if exitcode == -signal.SIGXCPU:
+            raise GraderTimeout("CPU time limit exceeded")
+        raise GraderCrashed("Grading process crashed")
+
+    def run_many(self, tasks, run=None):
+        """
+        Grade tasks concurrently across the pool - :return: list of result dict|CompilationError|GraderError
+
+        run thay cho self.run khi caller cần bọc thêm (precheck, telemetry...).
+        """
+        app = current_app._get_current_object()
+        run = run or self.run
+
+        def run_one(task):
+            with app.app_context():
+                try:
+                    return run(task)
+                except (CompilationError, GraderError) as e:
+                    return e
+
+        workers = current_app.config[self.workers_setting]
+        if workers <= 0:
+            return [run_one(task) for task in tasks]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(run_one, tasks))
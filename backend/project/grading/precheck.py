@@ -0,0 +1,167 @@
+# services/users/project/grading/precheck.py
+
+import ast
+import hashlib
+import symtable
+
+from flask import current_app
+
+from project.cache import LRUCache
+from project.logger import get_logger
+
+# Get logger for this module
+logger = get_logger("grading_precheck")
+
+CACHE_SIZE = 1024
+
+MAX_ANSWER_BYTES = 64 * 1024
+
+# Module/builtin/attribute có thể thoát khỏi sandbox hoặc phá grading process
+FORBIDDEN_MODULES = (
+    "os",
+    "sys",
+    "subprocess",
+    "socket",
+    "ctypes",
+    "multiprocessing",
+    "threading",
+    "signal",
+    "shutil",
+    "importlib",
+    "builtins",
+    "resource",
+    "gc",
+)
+FORBIDDEN_NAMES = ("__import__", "exec", "eval", "compile", "globals", "breakpoint")
+FORBIDDEN_ATTRIBUTES = (
+    "__subclasses__",
+    "__globals__",
+    "__builtins__",
+    "__code__",
+    "__closure__",
+    "__bases__",
+    "__mro__",
+)
+
+# Per-process cache: sha256 của answer -> ParsedAnswer
+_parsed_answers = LRUCache(maxsize=CACHE_SIZE)
+
+
+class CompilationError(Exception):
+    """Raised when the submitted answer cannot be executed"""
+
+
+class SubmissionRejected(CompilationError):
+    """Raised when an answer is turned away before it is executed"""
+
+
+def _global_names(table):
+    """
+    Names a symbol table block reads that resolve to globals or builtins at run time
+
+    Biến local của function (gán, tham số...) là binding tĩnh nên `compile = 'x'`
+    trong function không bị tính; còn ở module/class thì tên được tra động, gán
+    trong một nhánh không chạy vẫn rơi về builtin nên vẫn bị tính.
+    """
+    names = set()
+    for symbol in table.get_symbols():
+        if symbol.is_referenced() and (
+            table.get_type() != "function" or symbol.is_global()
+        ):
+            names.add(symbol.get_name())
+    for child in table.get_children():
+        names |= _global_names(child)
+    return names
+
+
+class ParsedAnswer:
+    """Bytecode of an answer plus the imports, global names and attributes it uses"""
+
+    def __init__(self, tree, code, source):
+        self.code = code
+        self.modules = set()
+        self.names = _global_names(symtable.symtable(source, "<string>", "exec"))
+        self.attributes = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                self.modules.update(alias.name.split(".")[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                if node.module and not node.level:
+                    self.modules.add(node.module.split(".")[0])
+            elif isinstance(node, ast.Attribute):
+                self.attributes.add(node.attr)
+
+
+def parse_answer(answer):
+    """
+    Parse and compile an answer once per process - :return: ParsedAnswer
+
+    Kết quả cache theo hash của answer nên web process, fork server và các test
+    của chế độ parallel đều không phải parse/compile lại.
+    """
+    if not isinstance(answer, str):
+        raise CompilationError("Answer must be a string")
+
+    digest = hashlib.sha256(answer.encode("utf-8", "surrogatepass")).hexdigest()
+    parsed = _parsed_answers.get(digest)
+    if parsed is not None:
+        return parsed
+
+    try:
+        tree = ast.parse(answer, "<string>", "exec")
+        parsed = ParsedAnswer(tree, compile(tree, "<string>", "exec"), answer)
+    except (SyntaxError, ValueError) as e:
+        raise CompilationError(str(e))
+    except (RecursionError, MemoryError):
+        raise SubmissionRejected("Code is too deeply nested")
+    _parsed_answers.set(digest, parsed)
+    return parsed
+
+
+def compile_answer(answer):
+    """Return the cached bytecode of an answer"""
+    return parse_answer(answer).code
+
+
+def check_answer(answer):
+    """
+    Reject oversized, invalid or forbidden answers without running them - :return: ParsedAnswer
+    """
+    max_bytes = current_app.config.get("GRADER_MAX_ANSWER_BYTES", MAX_ANSWER_BYTES)
+    if isinstance(answer, str):
+        size = len(answer.encode("utf-8", "surrogatepass"))
+        if size > max_bytes:
+            raise SubmissionRejected(
+                f"Answer is too large ({size} bytes, limit is {max_bytes})"
+            )
+
+    parsed = parse_answer(answer)
+
+    modules = parsed.modules.intersection(
+        current_app.config.get("GRADER_FORBIDDEN_MODULES", FORBIDDEN_MODULES)
+    )
+    if modules:
+        raise SubmissionRejected(f"Importing {', '.join(sorted(modules))} is not allowed")
+    names = parsed.names.intersection(
+        current_app.config.get("GRADER_FORBIDDEN_NAMES", FORBIDDEN_NAMES)
+    )
+    if names:
+        raise SubmissionRejected(f"Using {', '.join(sorted(names))} is not allowed")
+    attributes = parsed.attributes.intersection(
+        current_app.config.get("GRADER_FORBIDDEN_ATTRIBUTES", FORBIDDEN_ATTRIBUTES)
+    )
+    if attributes:
+        raise SubmissionRejected(
+            f"Accessing {', '.join(sorted(attributes))} is not allowed"
+        )
+    return parsed
+
+
+def precheck(task):
+    """Run check_answer on a task - :return: CompilationError, or None if it may be graded"""
+    try:
+        check_answer(task["answer"])
+    except CompilationError as e:
+        logger.debug(f"Submission for {task.get('key')} rejected: {str(e)}")
+        return e
+    return None
@@ -0,0 +1,189 @@
+# services/users/project/grading/regrade.py
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from flask import current_app
+from sqlalchemy import bindparam, update
+
+from project import db, regrader
+from project.api.models import Score
+from project.grading.precheck import precheck
+from project.grading.runner import CompilationError
+from project.grading.service import check_exercise, grading_response, grading_task
+from project.grading.testcases import exercise_cache
+from project.logger import get_logger
+
+# Get logger for this module
+logger = get_logger("grading_regrade")
+
+# UPDATE theo id và answer: score vừa được nộp lại trong lúc regrade thì giữ nguyên
+_update_score = (
+    update(Score.__table__)
+    .where(Score.__table__.c.id == bindparam("score_id"))
+    .where(Score.__table__.c.answer == bindparam("old_answer"))
+    .values(
+        results=bindparam("results"),
+        user_results=bindparam("user_results"),
+        metrics=bindparam("metrics"),
+        updated_at=bindparam("updated_at"),
+    )
+)
+
+
+def _grade_chunk(exercise, answers):
+    """Grade distinct answers on the regrade pool - :return: {answer: score columns or None}"""
+    graded = {}
+    tasks = []
+    for answer in answers:
+        task = grading_task(exercise, answer)
+        rejected = precheck(task)
+        if rejected is not None:
+            graded[answer] = _score_values(task, rejected)
+        else:
+            tasks.append(task)
+
+    for task, outcome in zip(tasks, regrader.run_many(tasks)):
+        graded[task["answer"]] = _score_values(task, outcome)
+    return graded
+
+
+def _score_values(task, outcome):
+    """Columns to store for a graded answer, or None to leave the score as is"""
+    body, code = grading_response(outcome)
+    if code == 200:
+        return body["results"], body["user_results"], body["metrics"]
+    if isinstance(outcome, CompilationError):
+        # Compile lỗi/bị precheck từ chối thì mọi test (kể cả test ẩn) đều sai
+        count = len(task["tests"])
+        return [False] * count, [body["message"]] * count, [None] * count
+    # Busy, hết budget, timeout, crash không phải kết quả chấm, giữ nguyên score cũ
+    return None
+
+
+def regrade_exercise(exercise_id, chunk_size=None):
+    """
+    Regrade every stored Score of an exercise against its current tests - :return: stats dict
+
+    Đọc Score theo từng chunk (keyset theo id) nên không load hết vào memory, chấm
+    song song trên pool regrader và ghi mỗi chunk bằng một executemany UPDATE.
+    """
+    chunk_size = chunk_size or current_app.config["GRADER_REGRADE_CHUNK_SIZE"]
+    stats = {"exercise_id": exercise_id, "scores": 0, "updated": 0, "skipped": 0}
+
+    exercise = exercise_cache.get(exercise_id)
+    if check_exercise(exercise):
+        logger.warning(f"Cannot regrade exercise {exercise_id}, skipping")
+        return stats
+
+    last_id = 0
+    while True:
+        rows = (
+            db.session.query(Score.id, Score.answer)
+            .filter(
+                Score.exercise_id == exercise_id,
+                Score.id > last_id,
+                Score.answer.isnot(None),
+            )
+            .order_by(Score.id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        graded = _grade_chunk(exercise, {row.answer for row in rows})
+        now = datetime.now(timezone.utc)
+        params = []
+        for row in rows:
+            values = graded[row.answer]
+            if values is None:
+                stats["skipped"] += 1
+                continue
+            results, user_results, metrics = values
+            params.append(
+                {
+                    "score_id": row.id,
+                    "old_answer": row.answer,
+                    "results": results,
+                    "user_results": user_results,
+                    "metrics": metrics,
+                    "updated_at": now,
+                }
+            )
+
+        if params:
+            result = db.session.execute(_update_score, params)
+            db.session.commit()
+            stats["updated"] += result.rowcount if result.rowcount >= 0 else len(params)
+        stats["scores"] += len(rows)
+        logger.debug(
+            f"Regraded {stats['scores']} scores of exercise {exercise_id} so far"
+        )
+
+    logger.info(
+        f"Regraded exercise {exercise_id}: {stats['updated']}/{stats['scores']} scores updated"
+    )
+    return stats
+
+
+class RegradeRunner:
+    """
+    Background regrade of exercises whose test_cases or solutions changed.
+
+    Một thread mỗi process, chấm lần lượt từng exercise; exercise đã nằm trong
+    hàng đợi (chưa chạy) thì không xếp thêm lần nữa. Hết việc thì tắt pool
+    regrader, không giữ process chấm bài nằm trong gunicorn worker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._queued = set()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="regrade"
+                )
+                self._queued = set()
+                self._pid = os.getpid()
+            return self._executor
+
+    def schedule(self, exercise_id):
+        """Queue a regrade of an exercise - :return: False if one is already queued"""
+        executor = self._get_executor()
+        with self._lock:
+            if exercise_id in self._queued:
+                return False
+            self._queued.add(exercise_id)
+
+        app = current_app._get_current_object()
+        executor.submit(self._run, app, exercise_id)
+        logger.info(f"Regrade of exercise {exercise_id} queued")
+        return True
+
+    def _run(self, app, exercise_id):
+        with self._lock:
+            self._queued.discard(exercise_id)
+        try:
+            with app.app_context():
+                regrade_exercise(exercise_id)
+        except Exception as e:
+            logger.error(f"Regrade of exercise {exercise_id} failed: {str(e)}")
+            logger.exception("Full traceback:")
+        finally:
+            with self._lock:
+                drained = not self._queued
+            if drained:
+                # Exercise xếp hàng sau đó sẽ start lại pool lazily
+                regrader.shutdown()
+                logger.info("Regrade queue drained, regrade pool shut down")
+
+
+regrade_runner = RegradeRunner()
@@ -0,0 +1,198 @@
+# services/users/project/grading/runner.py
+
+import resource
+import signal
+import threading
+import time
+from contextlib import contextmanager
+
+from project.grading.output import PREVIEW_CHARS, compare_output, truncate
+from project.grading.precheck import CompilationError, compile_answer
+from project.grading.testcases import InvalidTestCase, compile_tests, generate_inputs
+from project.logger import get_logger
+
+# Get logger for this module
+logger = get_logger("grading_runner")
+
+
+def load_answer(answer):
+    """Execute the submitted answer and return its namespace"""
+    code = compile_answer(answer)
+    namespace = {}
+    try:
+        exec(code, namespace)
+    except Exception as e:
+        raise CompilationError(str(e))
+    return namespace
+
+
+def peak_rss_kb():
+    """High-water mark RSS of the grading process (ru_maxrss)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(started_wall, started_cpu, started_rss):
+    """
+    Cost of the code run since the given perf_counter/process_time/peak_rss_kb readings.
+
+    rss_growth_kb là phần test này đẩy high-water mark của process lên so với
+    trước khi chạy (0 nếu test dùng ít hơn mức đỉnh đã có); peak_rss_kb là đỉnh
+    của cả process chấm bài, không phải riêng từng test.
+    """
+    peak = peak_rss_kb()
+    return {
+        "wall_ms": round((time.perf_counter() - started_wall) * 1000, 3),
+        "cpu_ms": round((time.process_time() - started_cpu) * 1000, 3),
+        "rss_growth_kb": max(0, peak - started_rss),
+        "peak_rss_kb": peak,
+    }
+
+
+class TestTimeLimitExceeded(BaseException):
+    """Raised inside a test that used up its CPU time limit"""
+
+
+@contextmanager
+def cpu_time_limit(limit_ms):
+    """
+    Interrupt the block once it used limit_ms of process CPU time.
+
+    Dùng ITIMER_PROF nên chỉ có hiệu lực trong main thread (worker process);
+    chấm in-process trong thread của request thì chỉ đo rồi so sau khi chạy xong.
+    BaseException để answer có `except Exception` cũng không nuốt được.
+    """
+    if not limit_ms or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def on_timeout(signum, frame):
+        raise TestTimeLimitExceeded()
+
+    previous = signal.signal(signal.SIGPROF, on_timeout)
+    signal.setitimer(signal.ITIMER_PROF, limit_ms / 1000)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, previous)
+
+
+def run_tests(
+    namespace,
+    tests,
+    solutions,
+    key=None,
+    preview_chars=PREVIEW_CHARS,
+    limits=None,
+    setups=None,
+):
+    """
+    Evaluate each test against the answer namespace - yields (user_str, ok, metrics)
+
+    user_str chỉ là preview tối đa preview_chars ký tự của str(kết quả).
+    limits[i] là CPU time limit (ms) của test i: quá limit thì test sai và
+    metrics có time_ok = False. setups[i] là setup code sinh input cho test ẩn i,
+    kết quả của test ẩn không được trả về.
+    """
+    codes = compile_tests(tests, key)
+    limits = limits or [None] * len(codes)
+    setups = setups or [None] * len(codes)
+    for index, (code, sol) in enumerate(zip(codes, solutions)):
+        limit, setup = limits[index], setups[index]
+        inputs = None
+        timed_out = False
+        started_wall = time.perf_counter()
+        started_cpu = time.process_time()
+        started_rss = peak_rss_kb()
+        try:
+            if isinstance(code, InvalidTestCase):
+                raise code.error
+            if setup is not None:
+                input_key = key + ("input", index) if key is not None else None
+                inputs = generate_inputs(setup, input_key)
+                # Không tính thời gian sinh input vào thời gian của answer
+                started_wall = time.perf_counter()
+                started_cpu = time.process_time()
+                started_rss = peak_rss_kb()
+            with cpu_time_limit(limit):
+                res = eval(code, namespace, inputs)
+            cost = measure(started_wall, started_cpu, started_rss)
+            ok, user_str = compare_output(res, sol, preview_chars)
+        except TestTimeLimitExceeded:
+            cost = measure(started_wall, started_cpu, started_rss)
+            timed_out = True
+            user_str = f"Time limit exceeded ({limit} ms)"
+            ok = False
+        except Exception as e:
+            cost = measure(started_wall, started_cpu, started_rss)
+            user_str = truncate(f"Error: {str(e)}", preview_chars)
+            ok = False
+
+        if limit:
+            cost["time_limit_ms"] = limit
+            cost["time_ok"] = not timed_out and cost["cpu_ms"] <= limit
+            if not cost["time_ok"] and not timed_out:
+                user_str = f"Time limit exceeded ({limit} ms)"
+            ok = ok and cost["time_ok"]
+        if setup is not None and not user_str.startswith("Time limit"):
+            user_str = "Hidden test passed" if ok else "Hidden test failed"
+        yield user_str, ok, cost
+
+
+def iter_results(
+    answer,
+    tests,
+    solutions,
+    key=None,
+    fail_fast=False,
+    preview_chars=PREVIEW_CHARS,
+    limits=None,
+    setups=None,
+):
+    """
+    Load the answer and grade test by test - yields (user_str, ok, metrics)
+
+    fail_fast dừng ở test sai đầu tiên, các test còn lại trả về "Skipped".
+    """
+    namespace = load_answer(answer)
+
+    count = 0
+    for user_str, ok, cost in run_tests(
+        namespace, tests, solutions, key, preview_chars, limits, setups
+    ):
+        count += 1
+        yield user_str, ok, cost
+        if fail_fast and not ok:
+            break
+
+    for _ in range(min(len(tests), len(solutions)) - count):
+        yield "Skipped", False, None
+
+
+def grade(
+    answer,
+    tests,
+    solutions,
+    key=None,
+    fail_fast=False,
+    preview_chars=PREVIEW_CHARS,
+    limits=None,
+    setups=None,
+):
+    """
+    Grade an answer against the test cases - :return: dict with results, user_results and metrics
+
+    key = (exercise_id, revision) cho phép dùng lại test case đã compile.
+    """
+    results = []
+    user_results = []
+    metrics = []
+    for user_str, ok, cost in iter_results(
+        answer, tests, solutions, key, fail_fast, preview_chars, limits, setups
+    ):
+        user_results.append(user_str)
+        results.append(ok)
+        metrics.append(cost)
+
+    logger.debug(f"Graded answer: {results.count(True)}/{len(results)} tests passed")
+    return {"results": results, "user_results": user_results, "metrics": metrics}
@@ -0,0 +1,151 @@
+# services/users/project/grading/scheduler.py
+
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+
+from project.logger import get_logger
+
+# Get logger for this module
+logger = get_logger("grading_scheduler")
+
+
+class BudgetExceeded(Exception):
+    """Raised when a submitter has used up its grading time budget"""
+
+
+class _Submitter:
+    """Scheduling state of one submitter (user id or client address)"""
+
+    def __init__(self, budget, now):
+        self.waiting = deque()
+        self.in_flight = 0
+        self.usage = 0.0
+        self.tokens = budget
+        self.refilled_at = now
+
+
+class FairScheduler:
+    """
+    Hand idle workers to waiting submissions in weighted fair order.
+
+    Mỗi submitter có một hàng đợi riêng; worker rảnh được giao cho submitter có
+    usage (số giây đã chiếm worker / weight) nhỏ nhất, nên người spam chỉ phải
+    xếp sau chính bài của mình. Submitter mới hoặc đã nghỉ bắt đầu từ virtual
+    clock hiện tại, không được "để dành" lượt. Ngoài ra mỗi submitter có token
+    bucket budget giây chấm trong window giây; hết budget thì bị từ chối.
+
+    State nằm trong từng process: với N gunicorn worker, mỗi submitter thực tế
+    có tới N lần budget và max_pending.
+    """
+
+    def __init__(self, budget=0, window=0, max_pending=0):
+        self.budget = budget
+        self.window = window
+        self.budgeted = budget > 0 and window > 0
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        self._idle = []
+        self._submitters = {}
+        self._clock = 0.0
+        self._seq = itertools.count()
+
+    def add_worker(self, worker):
+        with self._cond:
+            self._idle.append(worker)
+            self._cond.notify_all()
+
+    def _submitter(self, key, now):
+        submitter = self._submitters.get(key)
+        if submitter is None:
+            submitter = _Submitter(self.budget, now)
+            self._submitters[key] = submitter
+        elif self.budgeted:
+            rate = self.budget / self.window
+            submitter.tokens = min(
+                self.budget, submitter.tokens + (now - submitter.refilled_at) * rate
+            )
+            submitter.refilled_at = now
+        return submitter
+
+    def _next(self):
+        """Ticket that gets the next idle worker: lowest usage, then arrival order"""
+        best = None
+        for submitter in self._submitters.values():
+            if not submitter.waiting:
+                continue
+            rank = (max(submitter.usage, self._clock), submitter.waiting[0][0])
+            if best is None or rank < best[0]:
+                best = (rank, submitter.waiting[0])
+        return best[1] if best else None
+
+    def acquire(self, key, timeout, metered=True, capped=True):
+        """
+        Wait for an idle worker on behalf of a submitter - :return: worker
+
+        Raise BudgetExceeded nếu hết budget, queue.Empty nếu hết timeout
+        hoặc submitter đã có quá max_pending bài đang chờ/chạy. metered=False
+        (regrade, benchmark... chạy nội bộ) vẫn xếp hàng công bằng nhưng không
+        bị budget và max_pending chặn; capped=False chỉ bỏ qua max_pending (batch
+        tự giới hạn số item chạy cùng lúc) nhưng vẫn trừ budget.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            now = time.monotonic()
+            submitter = self._submitter(key, now)
+            if metered and self.budgeted and submitter.tokens <= 0:
+                raise BudgetExceeded("Grading time budget exceeded")
+            if metered and capped and self.max_pending and (
+                len(submitter.waiting) + submitter.in_flight >= self.max_pending
+            ):
+                raise queue.Empty
+            if not submitter.waiting and not submitter.in_flight:
+                submitter.usage = max(submitter.usage, self._clock)
+
+            ticket = (next(self._seq), key)
+            submitter.waiting.append(ticket)
+            try:
+                while not (self._idle and self._next() is ticket):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise queue.Empty
+                    self._cond.wait(remaining)
+            except BaseException:
+                submitter.waiting.remove(ticket)
+                self._cond.notify_all()
+                raise
+
+            submitter.waiting.popleft()
+            submitter.in_flight += 1
+            self._clock = max(self._clock, submitter.usage)
+            # Người tiếp theo có thể lấy worker rảnh còn lại
+            self._cond.notify_all()
+            return self._idle.pop()
+
+    def release(self, worker, key, cost, weight=1, metered=True):
+        """Return a worker and charge a submitter cost seconds of grading time"""
+        with self._cond:
+            submitter = self._submitter(key, time.monotonic())
+            submitter.in_flight -= 1
+            submitter.usage += cost / max(weight, 1e-9)
+            if metered and self.budgeted:
+                submitter.tokens -= cost
+            self._idle.append(worker)
+            self._forget_idle()
+            self._cond.notify_all()
+
+    def _forget_idle(self):
+        """Drop submitters with nothing queued whose state no longer matters"""
+        if len(self._submitters) < 1024:
+            return
+        for key in [
+            key
+            for key, submitter in self._submitters.items()
+            if not submitter.waiting
+            and not submitter.in_flight
+            and submitter.usage <= self._clock
+            and submitter.tokens >= self.budget
+        ]:
+            del self._submitters[key]
@@ -0,0 +1,324 @@
+# services/users/project/grading/service.py
+
+import json
+import time
+
+from flask import current_app
+
+from project import grader
+from project.grading.memo import result_memo
+from project.grading.pool import (
+    FORK_SERVER_GRACE,
+    GraderBusy,
+    GraderError,
+    GraderQuotaExceeded,
+)
+from project.grading.precheck import SubmissionRejected, precheck
+from project.grading.runner import CompilationError
+from project.grading.telemetry import telemetry
+
+
+GRADING_MODES = ("serial", "fail_fast", "parallel")
+
+
+def grading_task(
+    exercise, answer, mode="serial", user=None, weight=1, metered=True, capped=True
+):
+    """
+    Build a grader task for a cached exercise entry
+
+    user là key để pool chia worker công bằng giữa các submitter, weight > 1
+    cho submitter đó nhiều phần hơn. user=None (regrade...) hoặc metered=False
+    (admin, benchmark) không bị tính vào budget/giới hạn bài chờ của ai;
+    capped=False chỉ bỏ giới hạn bài chờ cho batch.
+    """
+    # Test ẩn (input sinh bằng setup) chấm sau các test thường
+    large_tests = exercise.get("large_tests") or []
+    count = len(exercise["test_cases"])
+    return {
+        "answer": answer,
+        "tests": exercise["test_cases"] + [t["test"] for t in large_tests],
+        "solutions": exercise["solutions"] + [t["solution"] for t in large_tests],
+        "limits": (exercise.get("time_limits") or [None] * count)
+        + [t.get("time_limit_ms") for t in large_tests],
+        "setups": [None] * count + [t["setup"] for t in large_tests],
+        "key": (exercise["id"], exercise["revision"]),
+        "mode": mode,
+        "preview_chars": current_app.config["GRADER_RESULT_PREVIEW_CHARS"],
+        "user": user,
+        "weight": weight,
+        "metered": metered and user is not None,
+        "capped": capped,
+    }
+
+
+def run_grading(task):
+    """Grade a task on the pool - :return: result dict|CompilationError|GraderError"""
+    started = time.perf_counter()
+    outcome = _run_grading(task)
+    telemetry.record(task["key"][0], outcome, (time.perf_counter() - started) * 1000)
+    telemetry.maybe_flush()
+    return outcome
+
+
+def _run_grading(task):
+    # Answer quá lớn/sai cú pháp/dùng construct bị cấm thì không chiếm slot của pool
+    rejected = precheck(task)
+    if rejected is not None:
+        return rejected
+    if task.get("mode") == "parallel" and len(task["tests"]) > 1:
+        return run_parallel(task)
+    try:
+        return grader.run(task)
+    except (CompilationError, GraderError) as e:
+        return e
+
+
+def batch_deadline():
+    """
+    Last time.monotonic() a batch may start grading an item - :return: float
+
+    Item bắt đầu ngay trước deadline chờ worker tối đa tới deadline rồi chạy tối
+    đa GRADER_WALL_TIMEOUT + FORK_SERVER_GRACE, nên cả request vẫn xong trước
+    GUNICORN_TIMEOUT với GRADER_BATCH_SAFETY_MARGIN giây dư.
+    """
+    config = current_app.config
+    budget = (
+        config["GUNICORN_TIMEOUT"]
+        - config["GRADER_WALL_TIMEOUT"]
+        - FORK_SERVER_GRACE
+        - config["GRADER_BATCH_SAFETY_MARGIN"]
+    )
+    return time.monotonic() + budget
+
+
+def grade_many(tasks, deadline=None):
+    """
+    Run run_grading for tasks concurrently across the pool - :return: list of outcomes
+
+    Task chưa bắt đầu chấm khi đã quá deadline (time.monotonic()) thì trả về
+    GraderBusy luôn, task đang chờ worker cũng chỉ chờ tới deadline.
+    """
+    if deadline is None:
+        return grader.run_many(tasks, run=run_grading)
+
+    def run(task):
+        if time.monotonic() >= deadline:
+            raise GraderBusy("Batch time budget exceeded")
+        return run_grading(dict(task, queue_deadline=deadline))
+
+    return grader.run_many(tasks, run=run)
+
+
+def run_parallel(task):
+    """Grade each test case as its own task so they spread across the pool"""
+    subtasks = [
+        dict(
+            task,
+            tests=[test],
+            solutions=[sol],
+            limits=task["limits"][index : index + 1] if task.get("limits") else None,
+            setups=task["setups"][index : index + 1] if task.get("setups") else None,
+            key=task["key"] + (index,),
+            mode="serial",
+        )
+        for index, (test, sol) in enumerate(zip(task["tests"], task["solutions"]))
+    ]
+    outcomes = grader.run_many(subtasks)
+
+    for outcome in outcomes:
+        if isinstance(outcome, (CompilationError, GraderBusy)):
+            return outcome
+
+    # Test nào timeout/crash thì chỉ test đó bị tính sai
+    merged = {"results": [], "user_results": [], "metrics": []}
+    for outcome in outcomes:
+        if isinstance(outcome, GraderError):
+            merged["results"].append(False)
+            merged["user_results"].append(f"Error: {str(outcome)}")
+            merged["metrics"].append(None)
+        else:
+            merged["results"].extend(outcome["results"])
+            merged["user_results"].extend(outcome["user_results"])
+            merged["metrics"].extend(outcome["metrics"])
+    return merged
+
+
+def is_deterministic(outcome):
+    """Only real results and compile errors are worth memoizing, not timeouts or busy"""
+    return not isinstance(outcome, GraderError)
+
+
+def grade_submission(task):
+    """
+    Grade a task, serving duplicate submissions from the memo - :return: (dict, status code)
+    """
+    cached = result_memo.get(task)
+    if cached is not None:
+        return cached
+
+    outcome = run_grading(task)
+    body, code = grading_response(outcome)
+    if is_deterministic(outcome):
+        result_memo.put(task, body, code)
+    return body, code
+
+
+def grading_response(outcome):
+    """
+    Map a grading outcome to the validate_code body - :return: (dict, status code)
+    """
+    if isinstance(outcome, SubmissionRejected):
+        return (
+            {"status": "fail", "message": f"Submission rejected: {str(outcome)}!"},
+            400,
+        )
+    if isinstance(outcome, CompilationError):
+        return (
+            {"status": "fail", "message": f"Code compilation failed: {str(outcome)}!"},
+            400,
+        )
+    if isinstance(outcome, GraderQuotaExceeded):
+        return (
+            {"status": "fail", "message": "Grading budget exceeded, please try again later!"},
+            429,
+        )
+    if isinstance(outcome, GraderBusy):
+        return (
+            {"status": "fail", "message": "Grader is busy, please try again!"},
+            503,
+        )
+    if isinstance(outcome, GraderError):
+        return {"status": "fail", "message": f"{str(outcome)}!"}, 400
+
+    results = outcome["results"]
+    user_results = outcome["user_results"]
+    body = {
+        "status": "success",
+        "results": results,
+        "user_results": user_results,
+        "metrics": outcome["metrics"],
+        "all_correct": all(results),
+    }
+    # Exercise có time limit thì báo thêm answer có đạt yêu cầu độ phức tạp không
+    timed = [cost for cost in outcome["metrics"] if cost and "time_ok" in cost]
+    if timed:
+        body["met_time_limits"] = all(cost["time_ok"] for cost in timed)
+    return body, 200
+
+
+def check_exercise(exercise):
+    """Return an error (dict, status code) if the exercise cannot be graded, else None"""
+    if not exercise:
+        return {"status": "fail", "message": "Exercise not found!"}, 404
+    if len(exercise["test_cases"]) != len(exercise["solutions"]):
+        return {"status": "fail", "message": "Tests and solutions length mismatch!"}, 500
+    message = grading_spec_error(
+        exercise["test_cases"], exercise.get("time_limits"), exercise.get("large_tests")
+    )
+    if message:
+        return {"status": "fail", "message": message}, 500
+    return None
+
+
+def is_time_limit(value):
+    """A time limit is a positive number of ms, or None for no limit"""
+    return value is None or (
+        isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0
+    )
+
+
+def grading_spec_error(test_cases, time_limits, large_tests):
+    """Validate the time limits and large tests of an exercise - :return: error message or None"""
+    if time_limits is not None:
+        if not isinstance(time_limits, list) or not all(map(is_time_limit, time_limits)):
+            return "Invalid time limits!"
+        if isinstance(test_cases, list) and len(time_limits) != len(test_cases):
+            return "Tests and time limits length mismatch!"
+    if large_tests is not None:
+        if not isinstance(large_tests, list):
+            return "Invalid large test!"
+        for large_test in large_tests:
+            if not isinstance(large_test, dict) or not all(
+                k in large_test for k in ("setup", "test", "solution")
+            ):
+                return "Invalid large test!"
+            if not is_time_limit(large_test.get("time_limit_ms")):
+                return "Invalid time limits!"
+    return None
+
+
+def solutions_error(solutions, large_tests):
+    """Validate that every expected output of an exercise is a string - :return: error message or None"""
+    if solutions is not None:
+        if not isinstance(solutions, list) or not all(isinstance(s, str) for s in solutions):
+            return "Invalid solutions!"
+    if isinstance(large_tests, list):
+        for large_test in large_tests:
+            if isinstance(large_test, dict) and not isinstance(large_test.get("solution"), str):
+                return "Invalid solutions!"
+    return None
+
+
+def ndjson(obj):
+    return json.dumps(obj) + "\n"
+
+
+def stream_summary(body):
+    """Last NDJSON line of a stream: a success body without the per-test lists"""
+    return {
+        key: value
+        for key, value in body.items()
+        if key not in ("results", "user_results", "metrics")
+    }
+
+
+def stream_grading(task):
+    """
+    Grade a task yielding one NDJSON line per test as it finishes, then a summary line
+    """
+    cached = result_memo.get(task)
+    if cached is not None:
+        body, code = cached
+        if code != 200:
+            yield ndjson(body)
+            return
+        for index, (ok, user_str, cost) in enumerate(
+            zip(body["results"], body["user_results"], body["metrics"])
+        ):
+            yield ndjson(
+                {"index": index, "result": ok, "user_result": user_str, "metrics": cost}
+            )
+        yield ndjson(stream_summary(body))
+        return
+
+    started = time.perf_counter()
+    outcome = None
+    try:
+        rejected = precheck(task)
+        if rejected is not None:
+            outcome = rejected
+            yield ndjson(grading_response(rejected)[0])
+            return
+
+        outcome_so_far = {"results": [], "user_results": [], "metrics": []}
+        try:
+            for index, (user_str, ok, cost) in enumerate(grader.stream(task)):
+                outcome_so_far["results"].append(ok)
+                outcome_so_far["user_results"].append(user_str)
+                outcome_so_far["metrics"].append(cost)
+                yield ndjson(
+                    {"index": index, "result": ok, "user_result": user_str, "metrics": cost}
+                )
+        except (CompilationError, GraderError) as e:
+            outcome = e
+            yield ndjson(grading_response(e)[0])
+            return
+        outcome = outcome_so_far
+        yield ndjson(stream_summary(grading_response(outcome)[0]))
+    finally:
+        # Client ngắt giữa chừng thì không có outcome, bỏ qua
+        if outcome is not None:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            telemetry.record(task["key"][0], outcome, elapsed_ms)
+            telemetry.maybe_flush()
@@ -0,0 +1,197 @@
+# services/users/project/grading/telemetry.py
+
+import bisect
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import exc
+
+from project import db
+from project.api.models import GradingStat
+from project.grading.pool import GraderBusy, GraderCrashed, GraderError, GraderTimeout
+from project.grading.precheck import CompilationError, SubmissionRejected
+from project.logger import get_logger
+
+# Get logger for this module
+logger = get_logger("grading_telemetry")
+
+# Cận trên (ms) của các bucket latency, bucket cuối là phần còn lại
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+COUNTERS = (
+    "submissions",
+    "passed",
+    "failed",
+    "compile_errors",
+    "rejected",
+    "timeouts",
+    "crashes",
+    "busy",
+)
+
+
+def classify(outcome):
+    """Name of the counter a grading outcome falls into"""
+    if isinstance(outcome, SubmissionRejected):
+        return "rejected"
+    if isinstance(outcome, CompilationError):
+        return "compile_errors"
+    if isinstance(outcome, GraderTimeout):
+        return "timeouts"
+    if isinstance(outcome, GraderBusy):
+        return "busy"
+    if isinstance(outcome, (GraderCrashed, GraderError)):
+        return "crashes"
+    results = outcome["results"]
+    return "passed" if results and all(results) else "failed"
+
+
+def _empty_delta():
+    delta = dict.fromkeys(COUNTERS, 0)
+    delta.update(
+        total_ms=0.0, max_ms=0.0, latency_buckets=[0] * (len(LATENCY_BUCKETS_MS) + 1)
+    )
+    return delta
+
+
+def _merge(target, delta):
+    for name in COUNTERS:
+        target[name] += delta[name]
+    target["total_ms"] += delta["total_ms"]
+    target["max_ms"] = max(target["max_ms"], delta["max_ms"])
+    target["latency_buckets"] = [
+        a + b for a, b in zip(target["latency_buckets"], delta["latency_buckets"])
+    ]
+
+
+def _percentile(buckets, fraction):
+    """Upper bound of the bucket holding the given fraction of samples ("+Inf" past the last one)"""
+    total = sum(buckets)
+    if not total:
+        return None
+    rank = fraction * total
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS_MS, buckets):
+        seen += count
+        if seen >= rank:
+            return bound
+    return "+Inf"
+
+
+def summarize(stat):
+    """JSON view of a GradingStat row with pass rate, mean and percentile estimates"""
+    buckets = stat.latency_buckets or [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    graded = sum(buckets)
+    data = {name: getattr(stat, name) for name in COUNTERS}
+    data.update(
+        {
+            "exercise_id": stat.exercise_id,
+            "pass_rate": round(stat.passed / stat.submissions, 4) if stat.submissions else None,
+            "total_ms": round(stat.total_ms, 3),
+            "mean_ms": round(stat.total_ms / graded, 3) if graded else None,
+            "max_ms": round(stat.max_ms, 3),
+            "p50_ms": _percentile(buckets, 0.5),
+            "p90_ms": _percentile(buckets, 0.9),
+            "p99_ms": _percentile(buckets, 0.99),
+            "latency_buckets": dict(
+                zip([str(b) for b in LATENCY_BUCKETS_MS] + ["+Inf"], buckets)
+            ),
+            "updated_at": stat.updated_at.isoformat() if stat.updated_at else None,
+        }
+    )
+    return data
+
+
+class GradingTelemetry:
+    """
+    Per-exercise grading counters and latency histograms.
+
+    Ghi vào memory của process rồi cứ GRADER_TELEMETRY_FLUSH_INTERVAL giây cộng
+    dồn vào bảng grading_stats, nên mọi gunicorn worker và manage.py đều đọc
+    được số liệu chung mà không phải ghi DB ở mỗi request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flushed_at = time.monotonic()
+
+    def record(self, exercise_id, outcome, elapsed_ms):
+        """Count one graded submission of an exercise"""
+        name = classify(outcome)
+        with self._lock:
+            delta = self._pending.get(exercise_id)
+            if delta is None:
+                delta = self._pending[exercise_id] = _empty_delta()
+            delta["submissions"] += 1
+            delta[name] += 1
+            # Busy không chạy bài nên không tính vào latency
+            if name != "busy":
+                delta["total_ms"] += elapsed_ms
+                delta["max_ms"] = max(delta["max_ms"], elapsed_ms)
+                delta["latency_buckets"][
+                    bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)
+                ] += 1
+
+    def maybe_flush(self):
+        interval = current_app.config["GRADER_TELEMETRY_FLUSH_INTERVAL"]
+        if time.monotonic() - self._flushed_at >= interval:
+            self.flush()
+
+    def flush(self):
+        """Add the pending counters to grading_stats"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+
+        try:
+            for exercise_id, delta in sorted(pending.items()):
+                stat = db.session.get(GradingStat, exercise_id, with_for_update=True)
+                if stat is None:
+                    stat = GradingStat(exercise_id)
+                    db.session.add(stat)
+                totals = {name: getattr(stat, name) for name in COUNTERS}
+                totals.update(
+                    total_ms=stat.total_ms,
+                    max_ms=stat.max_ms,
+                    latency_buckets=stat.latency_buckets
+                    or [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                )
+                _merge(totals, delta)
+                for name, value in totals.items():
+                    setattr(stat, name, value)
+            db.session.commit()
+            logger.debug(f"Flushed grading telemetry of {len(pending)} exercises")
+        except exc.SQLAlchemyError as e:
+            logger.error(f"Failed to flush grading telemetry: {str(e)}")
+            db.session.rollback()
+            # Giữ lại để lần flush sau thử lại
+            with self._lock:
+                for exercise_id, delta in pending.items():
+                    if exercise_id in self._pending:
+                        _merge(self._pending[exercise_id], delta)
+                    else:
+                        self._pending[exercise_id] = delta
+
+    def report(self, exercise_id=None):
+        """Flush, then return the summaries sorted by total grading time"""
+        self.flush()
+        query = GradingStat.query
+        if exercise_id is not None:
+            query = query.filter_by(exercise_id=exercise_id)
+        return [
+            summarize(stat)
+            for stat in query.order_by(GradingStat.total_ms.desc(), GradingStat.exercise_id)
+        ]
+
+    def reset(self):
+        with self._lock:
+            self._pending = {}
+        GradingStat.query.delete()
+        db.session.commit()
+
+
+telemetry = GradingTelemetry()
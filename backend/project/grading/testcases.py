@@ -0,0 +1,188 @@
+# services/users/project/grading/testcases.py
+
+import copy
+import time
+
+from flask import current_app
+
+from project.cache import LRUCache
+from project.logger import get_logger
+
+# Get logger for this module
+logger = get_logger("grading_testcases")
+
+CACHE_SIZE = 256
+
+INPUT_CACHE_SIZE = 16
+
+# Per-process cache: (exercise_id, revision) -> compiled test cases
+_compiled_tests = LRUCache(maxsize=CACHE_SIZE)
+
+# Per-process cache: (exercise_id, revision, index) -> input của generated test
+_generated_inputs = LRUCache(maxsize=INPUT_CACHE_SIZE)
+_shared_inputs = False
+
+
+class InvalidTestCase:
+    """A test case whose source failed to compile"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _compile(test):
+    try:
+        return compile(test, "<string>", "eval")
+    except Exception as e:
+        return InvalidTestCase(e)
+
+
+def compile_tests(tests, key=None):
+    """
+    Compile test expressions once per exercise revision - :return: list of code|InvalidTestCase
+    """
+    if key is None:
+        return [_compile(test) for test in tests]
+
+    codes = _compiled_tests.get(key)
+    if codes is None:
+        logger.debug(f"Compiling {len(tests)} test cases for {key}")
+        codes = [_compile(test) for test in tests]
+        _compiled_tests.set(key, codes)
+    return codes
+
+
+class InputGenerationError(Exception):
+    """Raised when the setup code of a generated test fails"""
+
+
+def build_inputs(setup, key=None):
+    """
+    Run the setup code of a generated test once per key - :return: dict of the names it defines
+
+    Input lớn chỉ được build một lần cho mỗi (exercise_id, revision, index): fork
+    server build trước khi fork nên mọi child dùng chung page copy-on-write.
+    """
+    inputs = _generated_inputs.get(key) if key is not None else None
+    if inputs is None:
+        namespace = {}
+        try:
+            exec(setup, namespace)
+        except Exception as e:
+            raise InputGenerationError(str(e))
+        inputs = {
+            name: value
+            for name, value in namespace.items()
+            if not name.startswith("__")
+        }
+        if key is not None:
+            logger.debug(f"Generated inputs for {key}")
+            _generated_inputs.set(key, inputs)
+    return inputs
+
+
+def generate_inputs(setup, key=None):
+    """
+    Inputs of a generated test for one submission.
+
+    Ngoài child vừa fork (worker persistent, in-process) phải deepcopy vì
+    submission có thể sửa input đang nằm trong cache.
+    """
+    inputs = build_inputs(setup, key)
+    if _shared_inputs or key is None:
+        return inputs
+    return copy.deepcopy(inputs)
+
+
+def share_generated_inputs():
+    """Hand out cached inputs without copying, only safe in a throwaway forked child"""
+    global _shared_inputs
+    _shared_inputs = True
+
+
+class ExerciseCache:
+    """
+    Per-process cache of exercise test cases keyed by id and revision (updated_at).
+
+    Entry còn trong GRADER_EXERCISE_CACHE_TTL giây thì dùng luôn, không query DB;
+    hết TTL thì chỉ query lại updated_at, đổi revision mới load lại cả exercise.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self._entries = LRUCache(maxsize=maxsize)
+
+    def get(self, exercise_id):
+        """Return a dict with id, revision, test_cases and solutions, or None"""
+        from project import db
+        from project.api.models import Exercise
+
+        ttl = current_app.config.get("GRADER_EXERCISE_CACHE_TTL", 0)
+        now = time.monotonic()
+
+        entry = self._entries.get(exercise_id)
+        if entry is not None and now - entry["checked_at"] < ttl:
+            return entry
+
+        if entry is not None:
+            updated_at = (
+                db.session.query(Exercise.updated_at)
+                .filter(Exercise.id == exercise_id)
+                .scalar()
+            )
+            if updated_at is not None and updated_at.isoformat() == entry["revision"]:
+                entry["checked_at"] = now
+                return entry
+
+        exercise = db.session.get(Exercise, exercise_id)
+        if not exercise:
+            self._entries.pop(exercise_id)
+            return None
+        return self.put(exercise)
+
+    def get_many(self, exercise_ids):
+        """Return {exercise_id: entry}, loading stale or missing ones in a single IN query"""
+        from project.api.models import Exercise
+
+        ttl = current_app.config.get("GRADER_EXERCISE_CACHE_TTL", 0)
+        now = time.monotonic()
+
+        found = {}
+        missing = []
+        for exercise_id in set(exercise_ids):
+            entry = self._entries.get(exercise_id)
+            if entry is not None and now - entry["checked_at"] < ttl:
+                found[exercise_id] = entry
+            else:
+                missing.append(exercise_id)
+
+        if missing:
+            logger.debug(f"Loading {len(missing)} exercises in one query")
+            for exercise in Exercise.query.filter(Exercise.id.in_(missing)).all():
+                found[exercise.id] = self.put(exercise)
+            for exercise_id in missing:
+                if exercise_id not in found:
+                    self._entries.pop(exercise_id)
+        return found
+
+    def put(self, exercise):
+        entry = {
+            "id": exercise.id,
+            "revision": exercise.updated_at.isoformat(),
+            "test_cases": exercise.test_cases,
+            "solutions": exercise.solutions,
+            "time_limits": exercise.time_limits,
+            "large_tests": exercise.large_tests or [],
+            "checked_at": time.monotonic(),
+        }
+        self._entries.set(exercise.id, entry)
+        return entry
+
+    def invalidate(self, exercise_id):
+        logger.debug(f"Invalidating cached exercise {exercise_id}")
+        self._entries.pop(exercise_id)
+
+    def clear(self):
+        self._entries.clear()
+
+
+exercise_cache = ExerciseCache()
@@ -0,0 +1,167 @@
+# services/users/project/grading/watchdog.py
+
+import os
+import resource
+import signal
+import sys
+import threading
+from contextlib import contextmanager
+
+from flask import current_app
+
+from project.logger import get_logger
+
+# Get logger for this module
+logger = get_logger("grading_watchdog")
+
+
+def current_rss_kb():
+    """Resident set size of this process right now (not the high-water mark)"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Watchdog:
+    """
+    Leak watchdog for submissions graded in-process (GRADER_WORKERS = 0).
+
+    Sau mỗi lần chấm đo RSS so với lúc chấm bài đầu tiên và đếm module mà code
+    của user import thêm vào sys.modules. Vượt ngưỡng thì ghi lại một
+    WorkerRecycle rồi gửi SIGTERM cho chính process: gunicorn worker chạy xong
+    request đang dở rồi thoát, arbiter fork worker mới sạch sẽ.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._baseline_rss_kb = 0
+        self._polluted = set()
+        self._stats = {}
+        self._recycling = False
+
+    def _ensure_baseline(self):
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._baseline_rss_kb = current_rss_kb()
+        self._polluted = set()
+        self._recycling = False
+        self._stats = {
+            "pid": self._pid,
+            "checks": 0,
+            "baseline_rss_kb": self._baseline_rss_kb,
+            "rss_kb": self._baseline_rss_kb,
+            "rss_growth_kb": 0,
+            "new_modules": 0,
+            "recycling": False,
+        }
+
+    @contextmanager
+    def guard(self):
+        """Track what one in-process grading run leaves behind, then check the thresholds"""
+        if not current_app.config["GRADER_WATCHDOG_ENABLED"]:
+            yield
+            return
+
+        with self._lock:
+            self._ensure_baseline()
+        modules_before = set(sys.modules)
+        try:
+            yield
+        finally:
+            added = set(sys.modules) - modules_before
+            self.check(added)
+
+    def check(self, added_modules=()):
+        """Update the leak metrics - :return: reason the worker is being recycled, or None"""
+        max_growth_kb = current_app.config["GRADER_WATCHDOG_MAX_RSS_GROWTH_MB"] * 1024
+        max_modules = current_app.config["GRADER_WATCHDOG_MAX_NEW_MODULES"]
+
+        with self._lock:
+            self._ensure_baseline()
+            self._polluted.update(added_modules)
+            rss_kb = current_rss_kb()
+            self._stats["checks"] += 1
+            self._stats["rss_kb"] = rss_kb
+            self._stats["rss_growth_kb"] = rss_kb - self._baseline_rss_kb
+            self._stats["new_modules"] = len(self._polluted)
+
+            if self._recycling:
+                return None
+            if self._stats["rss_growth_kb"] > max_growth_kb:
+                reason = "rss"
+            elif len(self._polluted) > max_modules:
+                reason = "modules"
+            else:
+                return None
+            self._recycling = True
+            self._stats["recycling"] = True
+            stats = dict(self._stats)
+
+        self._recycle(reason, stats)
+        return reason
+
+    def _recycle(self, reason, stats):
+        from project import db
+        from project.api.models import WorkerRecycle
+
+        logger.warning(
+            f"Recycling worker {stats['pid']} ({reason}): RSS grew "
+            f"{stats['rss_growth_kb']} KB, {stats['new_modules']} modules imported by submissions"
+        )
+        try:
+            db.session.add(
+                WorkerRecycle(
+                    pid=stats["pid"],
+                    reason=reason,
+                    rss_kb=stats["rss_kb"],
+                    rss_growth_kb=stats["rss_growth_kb"],
+                    new_modules=stats["new_modules"],
+                    checks=stats["checks"],
+                )
+            )
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"Failed to record worker recycle: {str(e)}")
+            db.session.rollback()
+
+        # Chỉ gunicorn mới respawn worker, dev server thì chỉ log lại
+        if "gunicorn" in sys.modules:
+            os.kill(os.getpid(), signal.SIGTERM)
+        else:
+            logger.warning("Not running under gunicorn, worker will not be recycled")
+
+    def reset(self):
+        """Take a new baseline on the next check"""
+        with self._lock:
+            self._pid = None
+
+    def stats(self):
+        with self._lock:
+            self._ensure_baseline()
+            return dict(self._stats)
+
+
+def recycle_summary(limit=20):
+    """Recycle counts by reason and the most recent recycles of every worker"""
+    from project import db
+    from project.api.models import WorkerRecycle
+
+    counts = dict(
+        db.session.query(WorkerRecycle.reason, db.func.count(WorkerRecycle.id))
+        .group_by(WorkerRecycle.reason)
+        .all()
+    )
+    recent = WorkerRecycle.query.order_by(WorkerRecycle.id.desc()).limit(limit)
+    return {
+        "total": sum(counts.values()),
+        "by_reason": counts,
+        "recent": [recycle.to_json() for recycle in recent],
+    }
+
+
+watchdog = Watchdog()
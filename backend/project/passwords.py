@@ -0,0 +1,142 @@
+# services/users/project/passwords.py
+
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from flask import current_app
+
+from project.logger import get_logger
+
+# Get logger for this module
+logger = get_logger("passwords")
+
+# Calibrate bằng cost này rồi ngoại suy, mỗi round thêm gấp đôi thời gian
+CALIBRATION_ROUNDS = 8
+MAX_ROUNDS = 16
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many password hashes are already waiting"""
+
+
+def hash_rounds(pw_hash):
+    """Cost factor of a bcrypt hash ("$2b$12$..." -> 12), or None if unknown"""
+    try:
+        return int(pw_hash.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """
+    Run bcrypt hashing and verification on a small dedicated thread pool.
+
+    bcrypt nhả GIL khi hash nên AUTH_BCRYPT_WORKERS thread giới hạn số core
+    dùng cho bcrypt cùng lúc, request thread chỉ chờ kết quả. Quá
+    AUTH_BCRYPT_QUEUE_SIZE hash đang chờ/chạy thì raise PasswordHasherBusy ngay
+    thay vì để login xếp hàng vô hạn.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._pending = 0
+
+    def init_app(self, app):
+        app.config.setdefault("AUTH_BCRYPT_WORKERS", 2)
+        app.config.setdefault("AUTH_BCRYPT_QUEUE_SIZE", 16)
+        app.config.setdefault("AUTH_BCRYPT_TIMEOUT", 10)
+        app.config.setdefault("AUTH_BCRYPT_TARGET_MS", 0)
+        app.config.setdefault("AUTH_BCRYPT_MIN_ROUNDS", 10)
+        app.extensions["password_hasher"] = self
+
+        target_ms = app.config["AUTH_BCRYPT_TARGET_MS"]
+        if target_ms:
+            # MIN_ROUNDS là mức sàn, máy chậm không làm hash yếu hơn mức này;
+            # hash cũ cost cao hơn vẫn giữ nguyên (needs_rehash không hạ cost)
+            rounds = self.calibrate(target_ms, app.config["AUTH_BCRYPT_MIN_ROUNDS"])
+            logger.info(
+                f"bcrypt cost calibrated to {rounds} rounds for ~{target_ms} ms "
+                f"(configured {app.config.get('BCRYPT_LOG_ROUNDS')})"
+            )
+            app.config["BCRYPT_LOG_ROUNDS"] = rounds
+
+    @staticmethod
+    def calibrate(target_ms, min_rounds=4):
+        """Highest cost whose hash takes at most target_ms on this machine - :return: rounds"""
+        import bcrypt as _bcrypt
+
+        salt = _bcrypt.gensalt(CALIBRATION_ROUNDS)
+        elapsed = min(
+            _timed(_bcrypt.hashpw, b"calibration", salt) for _ in range(3)
+        )
+        extra = math.floor(math.log2(target_ms / 1000 / max(elapsed, 1e-6)))
+        return max(min_rounds, min(MAX_ROUNDS, CALIBRATION_ROUNDS + extra))
+
+    def _get_executor(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Executor tạo trước khi fork không có thread trong process con
+                self._executor = ThreadPoolExecutor(
+                    max_workers=current_app.config["AUTH_BCRYPT_WORKERS"],
+                    thread_name_prefix="bcrypt",
+                )
+                self._pending = 0
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        executor = self._get_executor()
+        with self._lock:
+            if self._pending >= current_app.config["AUTH_BCRYPT_QUEUE_SIZE"]:
+                raise PasswordHasherBusy("Too many password hashes in progress")
+            self._pending += 1
+
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            self._done()
+            raise
+        future.add_done_callback(lambda _: self._done())
+        try:
+            return future.result(timeout=current_app.config["AUTH_BCRYPT_TIMEOUT"])
+        except FutureTimeout:
+            raise PasswordHasherBusy("Password hashing timed out")
+
+    def _done(self):
+        with self._lock:
+            self._pending -= 1
+
+    def hash(self, password):
+        """bcrypt hash of a password at BCRYPT_LOG_ROUNDS - :return: str"""
+        from project import bcrypt
+
+        rounds = current_app.config.get("BCRYPT_LOG_ROUNDS")
+        return self._run(bcrypt.generate_password_hash, password, rounds).decode()
+
+    def check(self, pw_hash, password):
+        from project import bcrypt
+
+        return self._run(bcrypt.check_password_hash, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        """
+        True if a hash was made with a lower cost than BCRYPT_LOG_ROUNDS
+
+        Không bao giờ hạ cost của hash mạnh hơn: các worker calibrate riêng có
+        thể lệch nhau, và cost thấp hơn chỉ làm password dễ brute force hơn.
+        """
+        rounds = current_app.config.get("BCRYPT_LOG_ROUNDS")
+        current = hash_rounds(pw_hash)
+        return current is None or current < rounds
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
@@ -1,10 +1,19 @@
 # services/users/project/tests/test_auth.py
 
 import json
-from flask import current_app
+import os
+
+import pytest
+from flask import Flask, current_app
+from sqlalchemy import event
 
 from project import db
-from project.api.models import User
+from project.api.models import RevokedToken, User
+from project.api.revocation import BloomFilter
+from project.api.signing import generate_key_file, key_ring, load_key_file
+from project.api.user_cache import token_cache, token_epochs, user_state_cache
+from project.config import BaseConfig
+from project.passwords import PasswordHasher, hash_rounds
 from project.tests.utils import add_user
 
 
@@ -257,3 +266,311 @@ def test_invalid_status_inactive(client):
     assert data["status"] == "fail"
     assert data["message"] == "Provide a valid auth token."
     assert response.status_code == 401
+
+
+
+def login(client, email="test@test.com", password="test"):
+    resp_login = client.post(
+        "/auth/login",
+        data=json.dumps({"email": email, "password": password}),
+        content_type="application/json",
+    )
+    return json.loads(resp_login.data.decode())["auth_token"]
+
+
+def count_user_selects(client, path, token):
+    """GET path, returning the response and the number of SELECTs on users it ran"""
+    statements = []
+    # Mỗi request thật có session mới, identity map rỗng
+    db.session.expunge_all()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM users" in statement:
+            statements.append(statement)
+
+    engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = client.get(path, headers={"Authorization": f"Bearer {token}"})
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return response, len(statements)
+
+
+def test_status_queries_user_once(client):
+    """Đảm bảo endpoint cần đăng nhập chỉ query bảng users một lần mỗi request."""
+    client.application.config["AUTH_EPOCH_REFRESH_INTERVAL"] = 60
+    add_user("test", "test@test.com", "test")
+    token = login(client)
+    token_epochs.refresh()
+    response, queries = count_user_selects(client, "/auth/status", token)
+    assert response.status_code == 200
+    assert queries == 1
+    token_epochs.reset()
+
+
+def test_auth_state_cached(client):
+    """Đảm bảo auth state của user được cache và bị invalidate khi đổi active/admin."""
+    user_state_cache.clear()
+    client.application.config["AUTH_USER_CACHE_TTL"] = 30
+    user = add_user("test", "test@test.com", "test")
+    assert not user_state_cache.get(user.id).admin
+    user.make_admin()
+    assert user_state_cache.get(user.id).admin
+    user.deactivate_user()
+    assert not user_state_cache.get(user.id).active
+    user.activate_user()
+    assert user_state_cache.get(user.id).active
+    user.revoke_admin()
+    assert not user_state_cache.get(user.id).admin
+    user_state_cache.clear()
+
+
+def test_token_claims_authorize_without_query(client):
+    """Đảm bảo token có claim admin/epoch được authorize mà không query users."""
+    client.application.config["AUTH_EPOCH_REFRESH_INTERVAL"] = 60
+    user = add_user("test", "test@test.com", "test")
+    user.make_admin()
+    token = login(client)
+    token_epochs.refresh()
+
+    claims = User.decode_auth_claims(token)
+    assert claims["admin"] is True
+    assert claims["epoch"] == 0
+    response, queries = count_user_selects(client, "/auth/logout", token)
+    assert response.status_code == 200
+    assert queries == 0
+    token_epochs.reset()
+
+
+def test_token_revoked_on_epoch_bump(client):
+    """Đảm bảo token cũ bị từ chối sau khi revoke admin hoặc deactivate user."""
+    user_id = add_user("test", "test@test.com", "test").id
+    user = db.session.get(User, user_id)
+    user.make_admin()
+    token = login(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/auth/logout", headers=headers).status_code == 200
+
+    user = db.session.get(User, user_id)
+    user.revoke_admin()
+    assert client.get("/auth/logout", headers=headers).status_code == 401
+
+    token = login(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/auth/logout", headers=headers).status_code == 200
+    user = db.session.get(User, user_id)
+    user.deactivate_user()
+    assert client.get("/auth/logout", headers=headers).status_code == 401
+    token_epochs.reset()
+
+
+def test_logout_revokes_token(client):
+    """Đảm bảo token không dùng được nữa sau khi logout, token khác vẫn dùng được."""
+    add_user("test", "test@test.com", "test")
+    token = login(client)
+    other_token = login(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/auth/status", headers=headers).status_code == 200
+
+    response = client.get("/auth/logout", headers=headers)
+    assert response.status_code == 200
+    assert RevokedToken.query.count() == 1
+
+    response = client.get("/auth/status", headers=headers)
+    data = json.loads(response.data.decode())
+    assert response.status_code == 401
+    assert data["message"] == "Invalid token. Please log in again."
+    response = client.get(
+        "/auth/status", headers={"Authorization": f"Bearer {other_token}"}
+    )
+    assert response.status_code == 200
+
+
+def test_bloom_filter():
+    """Đảm bảo Bloom filter không có false negative và ít false positive."""
+    bloom = BloomFilter(1000)
+    keys = [f"jti-{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+def test_verified_token_cache(client):
+    """Đảm bảo token đã verify được cache tới lúc hết hạn và đếm hit/miss."""
+    token_cache.clear()
+    add_user("test", "test@test.com", "test")
+    token = login(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(3):
+        assert client.get("/auth/status", headers=headers).status_code == 200
+    stats = token_cache.stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 2
+    assert stats["size"] == 1
+
+    assert token_cache.get("not a token") is None
+    assert User.decode_auth_token("not a token") == "Invalid token. Please log in again."
+    assert token_cache.stats()["size"] == 1
+    token_cache.clear()
+
+
+def test_auth_telemetry(client):
+    """Đảm bảo /auth/telemetry trả counter của token cache, chỉ admin xem được."""
+    add_user("test", "test@test.com", "test")
+    admin = add_user("admin", "admin@test.com", "test")
+    admin.admin = True
+    db.session.commit()
+
+    response = client.get(
+        "/auth/telemetry", headers={"Authorization": f"Bearer {login(client)}"}
+    )
+    assert response.status_code == 401
+    response = client.get(
+        "/auth/telemetry",
+        headers={"Authorization": f"Bearer {login(client, 'admin@test.com')}"},
+    )
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    assert set(data["data"]["token_cache"]) == {"hits", "misses", "hit_rate", "size"}
+
+
+def test_jwks_without_signing_keys(client):
+    """Đảm bảo JWKS rỗng khi token vẫn ký bằng HS256."""
+    key_ring.reset()
+    response = client.get("/auth/jwks")
+    assert response.status_code == 200
+    assert json.loads(response.data.decode()) == {"keys": []}
+    assert response.headers["Cache-Control"]
+
+
+def test_asymmetric_token_with_rotation(client, tmp_path):
+    """Đảm bảo token ký bằng EdDSA/RS256 verify được qua JWKS và sau khi rotate key."""
+    pytest.importorskip("cryptography")
+    import jwt
+
+    key_ring.reset()
+    token_cache.clear()
+    client.application.config["AUTH_TOKEN_ALGORITHM"] = "EdDSA"
+    client.application.config["AUTH_SIGNING_KEYS_DIR"] = str(tmp_path)
+    old_path = generate_key_file(str(tmp_path), "EdDSA")
+    add_user("test", "test@test.com", "test")
+    old_token = login(client)
+    assert jwt.get_unverified_header(old_token)["alg"] == "EdDSA"
+
+    # Rotate: key mới ký, key cũ chỉ còn public key để verify token cũ
+    from cryptography.hazmat.primitives import serialization
+
+    old_key = load_key_file(old_path)
+    with open(old_path, "wb") as f:
+        f.write(
+            old_key.public_key.public_bytes(
+                serialization.Encoding.PEM,
+                serialization.PublicFormat.SubjectPublicKeyInfo,
+            )
+        )
+    generate_key_file(str(tmp_path), "RS256")
+    client.application.config["AUTH_TOKEN_ALGORITHM"] = "RS256"
+    token_cache.clear()
+    new_token = login(client)
+    assert jwt.get_unverified_header(new_token)["alg"] == "RS256"
+
+    for token in (old_token, new_token):
+        response = client.get("/auth/status", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+
+    response = client.get("/auth/jwks")
+    keys = json.loads(response.data.decode())["keys"]
+    assert sorted(key["alg"] for key in keys) == ["EdDSA", "RS256"]
+    response = client.get("/auth/jwks", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+    # Service khác verify token bằng public key trong JWKS
+    jwk = next(key for key in keys if key["kid"] == jwt.get_unverified_header(new_token)["kid"])
+    public_key = jwt.PyJWK(jwk).key
+    assert jwt.decode(new_token, public_key, algorithms=["RS256"])["sub"] == "1"
+
+    # Xoá key cũ thì token cũ hết hợp lệ ngay, kể cả khi claims đã được cache
+    os.remove(old_path)
+    response = client.get("/auth/status", headers={"Authorization": f"Bearer {old_token}"})
+    assert response.status_code == 401
+
+    client.application.config["AUTH_TOKEN_ALGORITHM"] = "HS256"
+    client.application.config["AUTH_SIGNING_KEYS_DIR"] = None
+    key_ring.reset()
+    token_cache.clear()
+
+
+def test_login_without_signing_key(client, tmp_path):
+    """Đảm bảo login trả 500 thay vì token hỏng khi không có signing key."""
+    key_ring.reset()
+    client.application.config["AUTH_TOKEN_ALGORITHM"] = "EdDSA"
+    client.application.config["AUTH_SIGNING_KEYS_DIR"] = str(tmp_path)
+    add_user("test", "test@test.com", "test")
+    try:
+        response = client.post(
+            "/auth/login",
+            data=json.dumps({"email": "test@test.com", "password": "test"}),
+            content_type="application/json",
+        )
+        data = json.loads(response.data.decode())
+        assert response.status_code == 500
+        assert data["message"] == "Authentication failed."
+        assert "auth_token" not in data
+    finally:
+        client.application.config["AUTH_TOKEN_ALGORITHM"] = "HS256"
+        client.application.config["AUTH_SIGNING_KEYS_DIR"] = None
+        key_ring.reset()
+
+
+def test_rehash_password_on_login(client):
+    """Đảm bảo password được hash lại với cost mới khi login sau khi đổi BCRYPT_LOG_ROUNDS."""
+    user_id = add_user("test", "test@test.com", "test").id
+    assert hash_rounds(db.session.get(User, user_id).password) == 4
+
+    client.application.config["BCRYPT_LOG_ROUNDS"] = 6
+    login(client)
+    db.session.expire_all()
+    assert hash_rounds(db.session.get(User, user_id).password) == 6
+    assert login(client)
+
+    # Cost giảm lại thì không hạ hash mạnh hơn xuống
+    client.application.config["BCRYPT_LOG_ROUNDS"] = 4
+    assert login(client)
+    db.session.expire_all()
+    assert hash_rounds(db.session.get(User, user_id).password) == 6
+
+
+def test_login_rejected_when_hasher_busy(client):
+    """Đảm bảo login trả 503 khi quá nhiều password đang chờ hash."""
+    add_user("test", "test@test.com", "test")
+    client.application.config["AUTH_BCRYPT_QUEUE_SIZE"] = 0
+    response = client.post(
+        "/auth/login",
+        data=json.dumps({"email": "test@test.com", "password": "test"}),
+        content_type="application/json",
+    )
+    data = json.loads(response.data.decode())
+    assert response.status_code == 503
+    assert data["message"] == "Server is busy, please try again!"
+    client.application.config["AUTH_BCRYPT_QUEUE_SIZE"] = 16
+
+
+def test_calibrate_bcrypt_rounds():
+    """Đảm bảo calibrate chọn cost lớn hơn cho latency mục tiêu lớn hơn, trong giới hạn."""
+    fast = PasswordHasher.calibrate(1, min_rounds=4)
+    slow = PasswordHasher.calibrate(1000, min_rounds=4)
+    assert 4 <= fast <= slow <= 16
+    assert PasswordHasher.calibrate(1, min_rounds=10) == 10
+
+
+def test_calibrate_bcrypt_rounds_default_config():
+    """Đảm bảo với config mặc định calibrate thực sự chọn cost, không dừng ở mức sàn."""
+    app = Flask(__name__)
+    app.config.from_object(BaseConfig)
+    PasswordHasher().init_app(app)
+    rounds = app.config["BCRYPT_LOG_ROUNDS"]
+    assert BaseConfig.AUTH_BCRYPT_MIN_ROUNDS < rounds <= 16
+    assert BaseConfig.AUTH_BCRYPT_MIN_ROUNDS < BaseConfig.BCRYPT_LOG_ROUNDS
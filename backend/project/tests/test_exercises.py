@@ -0,0 +1,916 @@
+# services/users/project/tests/test_exercises.py
+
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from project import db, grader, regrader
+from project.api.models import Exercise, GradingJob, GradingResult, Score
+from project.grading.jobs import job_runner
+from project.grading.memo import result_memo
+from project.grading.output import TRUNCATED_MARK, compare_output
+from project.grading.regrade import regrade_exercise, regrade_runner
+from project.grading.scheduler import BudgetExceeded, FairScheduler
+from project.grading.telemetry import telemetry
+from project.grading.watchdog import watchdog
+from project.tests.utils import add_exercise, add_user
+
+
+def validate(client, exercise_id, answer):
+    return client.post(
+        "/exercises/validate_code",
+        data=json.dumps({"exercise_id": exercise_id, "answer": answer}),
+        content_type="application/json",
+    )
+
+
+def test_validate_code_correct(client):
+    """Đảm bảo validate_code chấm đúng một answer đúng."""
+    with client.application.app_context():
+        exercise = add_exercise()
+        exercise_id = exercise.id
+    response = validate(client, exercise_id, "def sum(a, b):\n    return a + b")
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    assert data["status"] == "success"
+    assert data["results"] == [True, True]
+    assert data["user_results"] == ["5", "9"]
+    assert data["all_correct"] is True
+    assert len(data["metrics"]) == 2
+    for cost in data["metrics"]:
+        assert cost["wall_ms"] >= 0
+        assert cost["cpu_ms"] >= 0
+        assert cost["rss_growth_kb"] >= 0
+        assert cost["peak_rss_kb"] > 0
+
+
+def test_validate_code_wrong_and_error(client):
+    """Đảm bảo lỗi runtime trong test được trả về trong user_results."""
+    with client.application.app_context():
+        exercise = add_exercise(test_cases=["sum(2, 3)", "sum(1, 'a')"], solutions=["5", "1a"])
+        exercise_id = exercise.id
+    response = validate(client, exercise_id, "def sum(a, b):\n    return a + b")
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    assert data["results"] == [True, False]
+    assert data["user_results"][1].startswith("Error:")
+    assert data["all_correct"] is False
+
+
+def test_validate_code_compilation_failed(client):
+    """Đảm bảo lỗi được trả về nếu answer không compile được."""
+    with client.application.app_context():
+        exercise_id = add_exercise().id
+    response = validate(client, exercise_id, "def sum(a, b)\n    return a + b")
+    data = json.loads(response.data.decode())
+    assert response.status_code == 400
+    assert "Code compilation failed" in data["message"]
+
+
+def test_validate_code_infinite_loop(client):
+    """Đảm bảo answer chạy vô hạn bị kill và worker vẫn chấm được bài tiếp theo."""
+    with client.application.app_context():
+        exercise_id = add_exercise().id
+    response = validate(client, exercise_id, "while True:\n    pass")
+    data = json.loads(response.data.decode())
+    assert response.status_code == 400
+    assert "limit exceeded" in data["message"]
+
+    response = validate(client, exercise_id, "def sum(a, b):\n    return a + b")
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    assert data["all_correct"] is True
+
+
+def test_validate_code_after_exercise_update(client):
+    """Đảm bảo test case đã cache được load lại khi exercise đổi revision."""
+    with client.application.app_context():
+        exercise = add_exercise()
+        exercise_id = exercise.id
+    answer = "def sum(a, b):\n    return a + b"
+    data = json.loads(validate(client, exercise_id, answer).data.decode())
+    assert data["user_results"] == ["5", "9"]
+
+    with client.application.app_context():
+        exercise = db.session.get(Exercise, exercise_id)
+        exercise.test_cases = ["sum(1, 1)"]
+        exercise.solutions = ["2"]
+        db.session.commit()
+    data = json.loads(validate(client, exercise_id, answer).data.decode())
+    assert data["results"] == [True]
+    assert data["user_results"] == ["2"]
+
+
+def test_validate_code_batch(client):
+    """Đảm bảo batch endpoint trả kết quả từng item theo đúng thứ tự."""
+    with client.application.app_context():
+        exercise_id = add_exercise().id
+    response = client.post(
+        "/exercises/validate_code/batch",
+        data=json.dumps(
+            {
+                "submissions": [
+                    {"exercise_id": exercise_id, "answer": "def sum(a, b):\n    return a + b"},
+                    {"exercise_id": exercise_id, "answer": "def sum(a, b):\n    return a - b"},
+                    {"exercise_id": exercise_id, "answer": "def sum(a, b)"},
+                    {"exercise_id": 999, "answer": "def sum(a, b):\n    return a + b"},
+                ]
+            }
+        ),
+        content_type="application/json",
+    )
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    items = data["data"]["results"]
+    assert len(items) == 4
+    assert items[0]["all_correct"] is True
+    assert items[1]["all_correct"] is False
+    assert "Code compilation failed" in items[2]["message"]
+    assert items[3]["message"] == "Exercise not found!"
+    assert [item["status_code"] for item in items] == [200, 200, 400, 404]
+
+
+def test_validate_code_batch_deduplicates(client):
+    """Đảm bảo answer trùng nhau trong batch chỉ được chấm một lần và lưu memo một row."""
+    with client.application.app_context():
+        exercise_id = add_exercise().id
+        telemetry.reset()
+    answer = "def sum(a, b):\n    return (a + b)"
+    submissions = [{"exercise_id": exercise_id, "answer": answer}] * 3
+    submissions.append({"exercise_id": exercise_id, "answer": answer + "\r\n"})
+    response = client.post(
+        "/exercises/validate_code/batch",
+        data=json.dumps({"submissions": submissions}),
+        content_type="application/json",
+    )
+    items = json.loads(response.data.decode())["data"]["results"]
+    assert len(items) == 4
+    assert all(item == items[0] for item in items)
+    assert items[0]["all_correct"] is True
+    with client.application.app_context():
+        assert telemetry.report(exercise_id)[0]["submissions"] == 1
+        assert GradingResult.query.filter_by(exercise_id=exercise_id).count() == 1
+
+
+def test_validate_code_batch_time_budget(client):
+    """Đảm bảo item chưa chấm khi hết thời gian của batch trả 503 thay vì giữ request."""
+    with client.application.app_context():
+        exercise_id = add_exercise().id
+    client.application.config["GRADER_BATCH_SAFETY_MARGIN"] = 30
+    response = client.post(
+        "/exercises/validate_code/batch",
+        data=json.dumps(
+            {"submissions": [{"exercise_id": exercise_id, "answer": "def sum(a, b):\n    return b + a"}]}
+        ),
+        content_type="application/json",
+    )
+    client.application.config["GRADER_BATCH_SAFETY_MARGIN"] = 4
+    items = json.loads(response.data.decode())["data"]["results"]
+    assert response.status_code == 200
+    assert items[0]["status_code"] == 503
+
+
+def test_validate_code_batch_invalid_json(client):
+    """Đảm bảo lỗi được trả về nếu batch rỗng."""
+    response = client.post(
+        "/exercises/validate_code/batch",
+        data=json.dumps({"submissions": []}),
+        content_type="application/json",
+    )
+    assert response.status_code == 400
+
+
+def test_validate_code_job(client):
+    """Đảm bảo job chấm bài trả về job id ngay và có kết quả khi poll."""
+    with client.application.app_context():
+        exercise_id = add_exercise().id
+    response = client.post(
+        "/exercises/validate_code/jobs",
+        data=json.dumps(
+            {"exercise_id": exercise_id, "answer": "def sum(a, b):\n    return a + b"}
+        ),
+        content_type="application/json",
+    )
+    data = json.loads(response.data.decode())
+    assert response.status_code == 202
+    job_id = data["data"]["id"]
+
+    for _ in range(50):
+        response = client.get(f"/exercises/validate_code/jobs/{job_id}")
+        data = json.loads(response.data.decode())
+        if data["data"]["state"] in ("done", "failed"):
+            break
+        time.sleep(0.1)
+    assert response.status_code == 200
+    assert data["data"]["state"] == "done"
+    assert data["data"]["status_code"] == 200
+    assert data["data"]["result"]["all_correct"] is True
+
+
+def test_validate_code_job_not_found(client):
+    """Đảm bảo lỗi 404 nếu job không tồn tại."""
+    response = client.get("/exercises/validate_code/jobs/doesnotexist")
+    assert response.status_code == 404
+
+
+def test_stale_job_failed_and_purged(client):
+    """Đảm bảo job của process đã chết bị đánh dấu failed khi poll, job cũ và memo cũ bị xoá."""
+    long_ago = datetime.now(timezone.utc) - timedelta(days=30)
+    with client.application.app_context():
+        stale = GradingJob(exercise_id=1)
+        stale.updated_at = long_ago
+        db.session.add(stale)
+        db.session.add(GradingJob(exercise_id=1))
+        old_result = GradingResult("0" * 64, 1, 200, {"status": "success"})
+        old_result.created_at = long_ago
+        db.session.add(old_result)
+        db.session.commit()
+        stale_id = stale.id
+
+    response = client.get(f"/exercises/validate_code/jobs/{stale_id}")
+    data = json.loads(response.data.decode())
+    assert data["data"]["state"] == "failed"
+    assert data["data"]["status_code"] == 500
+
+    with client.application.app_context():
+        db.session.get(GradingJob, stale_id).updated_at = long_ago
+        db.session.commit()
+        job_runner.purge()
+        result_memo.purge()
+        assert db.session.get(GradingJob, stale_id) is None
+        assert GradingJob.query.filter_by(state="queued").count() == 1
+        assert GradingResult.query.count() == 0
+
+
+def test_validate_code_memoized(client):
+    """Đảm bảo submission trùng (khác line ending) được lấy từ memo."""
+    with client.application.app_context():
+        exercise_id = add_exercise().id
+    answer = "def sum(a, b):\n    return a + b\n"
+    first = json.loads(validate(client, exercise_id, answer).data.decode())
+    with client.application.app_context():
+        assert GradingResult.query.filter_by(exercise_id=exercise_id).count() == 1
+    second = json.loads(
+        validate(client, exercise_id, answer.replace("\n", "\r\n")).data.decode()
+    )
+    assert first == second
+    with client.application.app_context():
+        assert GradingResult.query.filter_by(exercise_id=exercise_id).count() == 1
+
+
+def test_validate_code_fail_fast(client):
+    """Đảm bảo mode fail_fast dừng ở test sai đầu tiên."""
+    with client.application.app_context():
+        exercise_id = add_exercise(
+            test_cases=["sum(1, 1)", "sum(2, 2)", "sum(3, 3)"], solutions=["2", "5", "6"]
+        ).id
+    response = client.post(
+        "/exercises/validate_code",
+        data=json.dumps(
+            {
+                "exercise_id": exercise_id,
+                "answer": "def sum(a, b):\n    return a + b",
+                "mode": "fail_fast",
+            }
+        ),
+        content_type="application/json",
+    )
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    assert data["results"] == [True, False, False]
+    assert data["user_results"] == ["2", "4", "Skipped"]
+
+
+def test_validate_code_parallel(client):
+    """Đảm bảo mode parallel trả kết quả giống mode serial."""
+    with client.application.app_context():
+        exercise_id = add_exercise(
+            test_cases=["sum(1, 1)", "sum(2, 2)", "sum(3, 'a')"], solutions=["2", "4", "6"]
+        ).id
+    response = client.post(
+        "/exercises/validate_code",
+        data=json.dumps(
+            {
+                "exercise_id": exercise_id,
+                "answer": "def sum(a, b):\n    return a + b",
+                "mode": "parallel",
+            }
+        ),
+        content_type="application/json",
+    )
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    assert data["results"] == [True, True, False]
+    assert data["user_results"][:2] == ["2", "4"]
+    assert data["user_results"][2].startswith("Error:")
+    assert len(data["metrics"]) == 3
+
+
+def test_validate_code_stream(client):
+    """Đảm bảo stream trả về mỗi test một dòng NDJSON và dòng tổng kết."""
+    with client.application.app_context():
+        exercise_id = add_exercise().id
+    response = client.post(
+        "/exercises/validate_code/stream",
+        data=json.dumps(
+            {"exercise_id": exercise_id, "answer": "def sum(a, b):\n    return a + b"}
+        ),
+        content_type="application/json",
+    )
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [line["user_result"] for line in lines[:-1]] == ["5", "9"]
+    assert [line["index"] for line in lines[:-1]] == [0, 1]
+    assert lines[-1] == {"status": "success", "all_correct": True}
+
+
+def test_validate_code_stream_timeout(client):
+    """Đảm bảo stream trả về dòng lỗi nếu answer chạy quá thời gian."""
+    with client.application.app_context():
+        exercise_id = add_exercise().id
+    response = client.post(
+        "/exercises/validate_code/stream",
+        data=json.dumps({"exercise_id": exercise_id, "answer": "while True:\n    pass"}),
+        content_type="application/json",
+    )
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert lines[-1]["status"] == "fail"
+    assert "limit exceeded" in lines[-1]["message"]
+
+
+def test_validate_code_isolated_between_submissions(client):
+    """Đảm bảo submission sửa state của module không ảnh hưởng submission sau."""
+    with client.application.app_context():
+        exercise_id = add_exercise(test_cases=["sum(0, 0)"], solutions=["3.14"]).id
+    validate(client, exercise_id, "import math\nmath.pi = 0\ndef sum(a, b):\n    return 0")
+    response = validate(
+        client, exercise_id, "import math\ndef sum(a, b):\n    return round(math.pi, 2)"
+    )
+    data = json.loads(response.data.decode())
+    assert data["user_results"] == ["3.14"]
+
+
+def test_validate_code_and_record(client):
+    """Đảm bảo chấm bài và lưu score trong cùng một request, gửi lại thì update."""
+    with client.application.app_context():
+        add_user("test", "test@test.com", "test")
+        exercise_id = add_exercise().id
+    resp_login = client.post(
+        "/auth/login",
+        data=json.dumps({"email": "test@test.com", "password": "test"}),
+        content_type="application/json",
+    )
+    token = json.loads(resp_login.data.decode())["auth_token"]
+
+    for answer, results in [
+        ("def sum(a, b):\n    return a - b", [False, False]),
+        ("def sum(a, b):\n    return a + b", [True, True]),
+    ]:
+        response = client.post(
+            "/exercises/validate_code/record",
+            data=json.dumps({"exercise_id": exercise_id, "answer": answer}),
+            content_type="application/json",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        data = json.loads(response.data.decode())
+        assert response.status_code == 200
+        assert data["results"] == results
+        assert data["score"]["answer"] == answer
+        assert data["score"]["results"] == results
+
+    with client.application.app_context():
+        scores = Score.query.filter_by(exercise_id=exercise_id).all()
+        assert len(scores) == 1
+        assert scores[0].user_results == ["5", "9"]
+
+
+def test_validate_code_and_record_no_token(client):
+    """Đảm bảo lỗi được trả về nếu không có auth token."""
+    response = client.post(
+        "/exercises/validate_code/record",
+        data=json.dumps({"exercise_id": 1, "answer": "x = 1"}),
+        content_type="application/json",
+    )
+    assert response.status_code == 403
+
+
+def test_validate_code_rejects_forbidden_code(client):
+    """Đảm bảo answer import module bị cấm bị loại trước khi chạy."""
+    with client.application.app_context():
+        exercise_id = add_exercise().id
+    for answer in [
+        "import os\ndef sum(a, b):\n    return a + b",
+        "from subprocess import run\ndef sum(a, b):\n    return a + b",
+        "def sum(a, b):\n    return ().__class__.__bases__",
+        "def sum(a, b):\n    return eval('a + b')",
+        "if False:\n    eval = None\ndef sum(a, b):\n    return eval('a + b')",
+        "def sum(a, b):\n    f = lambda: globals\n    return f()",
+    ]:
+        response = validate(client, exercise_id, answer)
+        data = json.loads(response.data.decode())
+        assert response.status_code == 400
+        assert "Submission rejected" in data["message"]
+
+
+def test_validate_code_allows_local_named_like_builtin(client):
+    """Đảm bảo biến local/tham số tên compile, eval... không bị coi là dùng builtin bị cấm."""
+    with client.application.app_context():
+        exercise_id = add_exercise().id
+    for answer in [
+        "def sum(a, b):\n    compile = a + b\n    return compile",
+        "def sum(a, b, eval=None):\n    return a + b",
+        "def sum(a, b):\n    return [globals for globals in [a + b]][0]",
+    ]:
+        response = validate(client, exercise_id, answer)
+        data = json.loads(response.data.decode())
+        assert response.status_code == 200
+        assert data["all_correct"] is True
+
+
+def test_validate_code_rejects_oversized_answer(client):
+    """Đảm bảo answer vượt GRADER_MAX_ANSWER_BYTES bị loại."""
+    with client.application.app_context():
+        exercise_id = add_exercise().id
+    limit = client.application.config["GRADER_MAX_ANSWER_BYTES"]
+    answer = "def sum(a, b):\n    return a + b\n" + "#" * limit
+    response = validate(client, exercise_id, answer)
+    data = json.loads(response.data.decode())
+    assert response.status_code == 400
+    assert "too large" in data["message"]
+
+
+def test_compare_output_matches_str():
+    """Đảm bảo compare_output cho kết quả giống str() mà không render hết."""
+    recursive = [1]
+    recursive.append(recursive)
+    values = [
+        5, "abc", None, 1.5, [1, "a", (2,)], (), {"a": [1, {2}]}, set(), frozenset({1}),
+        {1: {}}, recursive, [[[]]], True,
+    ]
+    for value in values:
+        assert compare_output(value, str(value)) == (True, str(value))
+        assert compare_output(value, str(value) + "x")[0] is False
+    assert compare_output(5, 5) == (True, "5")
+
+    ok, preview = compare_output(list(range(10 ** 6)), "[0, 1]", limit=10)
+    assert ok is False
+    assert preview == "[0, 1, 2, " + TRUNCATED_MARK
+
+
+def test_validate_code_truncates_large_result(client):
+    """Đảm bảo kết quả quá lớn chỉ trả về preview đã cắt ngắn."""
+    with client.application.app_context():
+        exercise_id = add_exercise(test_cases=["sum(1, 2)"], solutions=["3"]).id
+    response = validate(client, exercise_id, "def sum(a, b):\n    return [0] * 10 ** 7")
+    data = json.loads(response.data.decode())
+    limit = client.application.config["GRADER_RESULT_PREVIEW_CHARS"]
+    assert response.status_code == 200
+    assert data["results"] == [False]
+    assert data["user_results"][0].endswith(TRUNCATED_MARK)
+    assert len(data["user_results"][0]) == limit + len(TRUNCATED_MARK)
+
+
+def test_regrade_exercise(client):
+    """Đảm bảo regrade chấm lại các Score đã lưu theo test case mới."""
+    with client.application.app_context():
+        exercise = add_exercise()
+        exercise_id = exercise.id
+        for user_id, answer in enumerate(
+            ["def sum(a, b):\n    return a + b", "def sum(a, b):\n    return a - b", "def sum(a, b)"]
+        ):
+            db.session.add(
+                Score(user_id=user_id + 1, exercise_id=exercise_id, answer=answer, results=[True])
+            )
+        db.session.add(Score(user_id=9, exercise_id=exercise_id))
+        exercise.test_cases = ["sum(1, 1)"]
+        exercise.solutions = ["2"]
+        db.session.commit()
+
+        stats = regrade_exercise(exercise_id, chunk_size=2)
+        assert stats == {"exercise_id": exercise_id, "scores": 3, "updated": 3, "skipped": 0}
+
+        scores = {s.user_id: s for s in Score.query.filter_by(exercise_id=exercise_id)}
+        assert scores[1].results == [True]
+        assert scores[1].user_results == ["2"]
+        assert scores[2].results == [False]
+        assert scores[2].user_results == ["0"]
+        assert scores[3].results == [False]
+        assert "Code compilation failed" in scores[3].user_results[0]
+        assert scores[9].results is None
+
+
+def test_regrade_pool_niced_and_shut_down(client):
+    """Đảm bảo process regrade chạy với nice thấp hơn và pool tắt khi hàng đợi regrade hết."""
+    with client.application.app_context():
+        exercise_id = add_exercise().id
+        db.session.add(Score(user_id=1, exercise_id=exercise_id, answer="def sum(a, b):\n    return a + b"))
+        db.session.commit()
+
+        regrade_exercise(exercise_id)
+        pid = regrader._workers[0].process.pid
+        expected = min(19, os.getpriority(os.PRIO_PROCESS, 0) + 10)
+        assert os.getpriority(os.PRIO_PROCESS, pid) == expected
+
+        regrade_runner.schedule(exercise_id)
+        for _ in range(50):
+            if not regrader._workers:
+                break
+            time.sleep(0.1)
+        assert regrader._workers == []
+
+
+def test_grading_workers_not_forked_from_app_process(client):
+    """Đảm bảo process chấm bài không fork từ process app nhiều thread, kể cả khi respawn."""
+    with client.application.app_context():
+        validate(client, add_exercise().id, "def sum(a, b):\n    return a + b")
+
+        def parent_pid(pid):
+            with open(f"/proc/{pid}/stat") as f:
+                return int(f.read().rsplit(")", 1)[1].split()[1])
+
+        worker = grader._workers[0]
+        assert parent_pid(worker.process.pid) != os.getpid()
+        worker.restart()
+        assert parent_pid(worker.process.pid) != os.getpid()
+
+
+def test_regrade_keeps_score_on_timeout(client):
+    """Đảm bảo regrade không ghi đè score khi bài bị timeout, chỉ compile lỗi mới tính sai hết."""
+    with client.application.app_context():
+        exercise = add_exercise(
+            large_tests=[{"setup": "x = 1", "test": "sum(x, 1)", "solution": "2"}]
+        )
+        exercise_id = exercise.id
+        answers = ["def sum(a, b):\n    while True:\n        pass", "def sum(a, b)"]
+        for user_id, answer in enumerate(answers):
+            db.session.add(
+                Score(user_id=user_id + 1, exercise_id=exercise_id, answer=answer, results=[True])
+            )
+        db.session.commit()
+
+        stats = regrade_exercise(exercise_id)
+        assert stats == {"exercise_id": exercise_id, "scores": 2, "updated": 1, "skipped": 1}
+
+        scores = {s.user_id: s for s in Score.query.filter_by(exercise_id=exercise_id)}
+        assert scores[1].results == [True]
+        assert scores[2].results == [False, False, False]
+
+
+def test_fair_scheduler_serves_light_submitter_first():
+    """Đảm bảo submitter spam phải đợi sau bài của người khác."""
+    scheduler = FairScheduler()
+    scheduler.add_worker("worker")
+    order = []
+
+    def submit(key):
+        worker = scheduler.acquire(key, timeout=5)
+        order.append(key)
+        scheduler.release(worker, key, cost=1)
+
+    worker = scheduler.acquire("heavy", timeout=1)
+    threads = []
+    for key in ["heavy", "heavy", "heavy", "light"]:
+        thread = threading.Thread(target=submit, args=(key,))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.05)
+    scheduler.release(worker, "heavy", cost=1)
+    for thread in threads:
+        thread.join()
+    assert order == ["light", "heavy", "heavy", "heavy"]
+
+
+def test_fair_scheduler_budget_and_pending_limit():
+    """Đảm bảo submitter hết budget hoặc quá số bài chờ bị từ chối."""
+    scheduler = FairScheduler(budget=1, window=1000, max_pending=1)
+    scheduler.add_worker("a")
+    scheduler.add_worker("b")
+    worker = scheduler.acquire("user:1", timeout=1)
+    with pytest.raises(queue.Empty):
+        scheduler.acquire("user:1", timeout=1)
+    scheduler.release(worker, "user:1", cost=2)
+    with pytest.raises(BudgetExceeded):
+        scheduler.acquire("user:1", timeout=1)
+    scheduler.release(scheduler.acquire("user:2", timeout=1), "user:2", cost=0)
+
+
+def test_fair_scheduler_unmetered_ignores_budget():
+    """Đảm bảo caller nội bộ (regrade, benchmark) không bị budget và giới hạn bài chờ chặn."""
+    scheduler = FairScheduler(budget=1, window=1000, max_pending=1)
+    scheduler.add_worker("a")
+    scheduler.add_worker("b")
+    first = scheduler.acquire(None, timeout=1, metered=False)
+    second = scheduler.acquire(None, timeout=1, metered=False)
+    scheduler.release(first, None, cost=5, metered=False)
+    scheduler.release(second, None, cost=5, metered=False)
+    # Caller nội bộ không trừ budget nên vẫn còn nguyên cho lần metered
+    scheduler.release(scheduler.acquire(None, timeout=1), None, cost=2)
+    with pytest.raises(BudgetExceeded):
+        scheduler.acquire(None, timeout=1)
+
+
+def test_validate_code_budget_exceeded(client):
+    """Đảm bảo validate_code trả 429 khi submitter hết budget."""
+    with client.application.app_context():
+        exercise_id = add_exercise().id
+    client.application.config["GRADER_USER_BUDGET"] = 1e-6
+    client.application.config["GRADER_USER_BUDGET_WINDOW"] = 1000
+    grader.shutdown()
+    try:
+        validate(client, exercise_id, "def sum(a, b):\n    return a + b")
+        response = validate(client, exercise_id, "def sum(a, b):\n    return a * b")
+        data = json.loads(response.data.decode())
+        assert response.status_code == 429
+        assert "budget" in data["message"]
+    finally:
+        grader.shutdown()
+
+
+def test_validate_code_admin_not_budgeted(client):
+    """Đảm bảo admin (benchmark, tool chấm hàng loạt) không bị budget per submitter chặn."""
+    with client.application.app_context():
+        exercise_id = add_exercise().id
+        admin = add_user("admin", "admin@test.com", "test")
+        admin.admin = True
+        db.session.commit()
+    response = client.post(
+        "/auth/login",
+        data=json.dumps({"email": "admin@test.com", "password": "test"}),
+        content_type="application/json",
+    )
+    token = json.loads(response.data.decode())["auth_token"]
+    client.application.config["GRADER_USER_BUDGET"] = 1e-6
+    client.application.config["GRADER_USER_BUDGET_WINDOW"] = 1000
+    grader.shutdown()
+    try:
+        for answer in ["return a + b", "return a * b", "return a - b"]:
+            response = client.post(
+                "/exercises/validate_code",
+                data=json.dumps(
+                    {"exercise_id": exercise_id, "answer": f"def sum(a, b):\n    {answer}"}
+                ),
+                content_type="application/json",
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            assert response.status_code == 200
+    finally:
+        grader.shutdown()
+
+
+def test_grading_telemetry(client):
+    """Đảm bảo telemetry đếm pass/timeout/compile error theo exercise, chỉ admin xem được."""
+    with client.application.app_context():
+        exercise_id = add_exercise().id
+        admin = add_user("admin", "admin@test.com", "test")
+        admin.admin = True
+        db.session.commit()
+        add_user("test", "test@test.com", "test")
+        telemetry.reset()
+    validate(client, exercise_id, "def sum(a, b):\n    return a + b")
+    validate(client, exercise_id, "def sum(a, b):\n    return a - b")
+    validate(client, exercise_id, "def sum(a, b)")
+    validate(client, exercise_id, "def sum(a, b):\n    while True:\n        pass")
+
+    def login(email):
+        response = client.post(
+            "/auth/login",
+            data=json.dumps({"email": email, "password": "test"}),
+            content_type="application/json",
+        )
+        return json.loads(response.data.decode())["auth_token"]
+
+    response = client.get(
+        f"/exercises/telemetry?exercise_id={exercise_id}",
+        headers={"Authorization": f"Bearer {login('test@test.com')}"},
+    )
+    assert response.status_code == 401
+
+    response = client.get(
+        f"/exercises/telemetry?exercise_id={exercise_id}",
+        headers={"Authorization": f"Bearer {login('admin@test.com')}"},
+    )
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    stat = data["data"]["exercises"][0]
+    assert stat["exercise_id"] == exercise_id
+    assert stat["submissions"] == 4
+    assert stat["passed"] == 1
+    assert stat["failed"] == 1
+    assert stat["compile_errors"] == 1
+    assert stat["timeouts"] == 1
+    assert stat["pass_rate"] == 0.25
+    assert sum(stat["latency_buckets"].values()) == 4
+    assert stat["max_ms"] >= 1000
+
+
+def test_validate_code_time_limits_and_large_tests(client):
+    """Đảm bảo answer chậm bị tính quá time limit, test ẩn không lộ kết quả."""
+    with client.application.app_context():
+        exercise_id = add_exercise(
+            title="Fibonacci",
+            test_cases=["fibonacci(10)", "fibonacci(32)"],
+            solutions=["55", "2178309"],
+            time_limits=[None, 100],
+            large_tests=[
+                {
+                    "setup": "numbers = list(range(10 ** 5))",
+                    "test": "sum(fibonacci(n % 20) for n in numbers)",
+                    "solution": str(sum(
+                        [0, 1, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233, 377, 610,
+                         987, 1597, 2584, 4181][n % 20] for n in range(10 ** 5)
+                    )),
+                    "time_limit_ms": 1000,
+                }
+            ],
+        ).id
+
+    naive = "def fibonacci(n):\n    return n if n < 2 else fibonacci(n - 1) + fibonacci(n - 2)"
+    data = json.loads(validate(client, exercise_id, naive).data.decode())
+    assert data["results"][0] is True
+    assert data["results"][1] is False
+    assert data["user_results"][1] == "Time limit exceeded (100 ms)"
+    assert data["metrics"][1]["time_ok"] is False
+    assert data["met_time_limits"] is False
+    assert "time_ok" not in data["metrics"][0]
+
+    fast = (
+        "def fibonacci(n):\n"
+        "    a, b = 0, 1\n"
+        "    for _ in range(n):\n"
+        "        a, b = b, a + b\n"
+        "    return a"
+    )
+    data = json.loads(validate(client, exercise_id, fast).data.decode())
+    assert data["results"] == [True, True, True]
+    assert data["user_results"][2] == "Hidden test passed"
+    assert data["met_time_limits"] is True
+    assert data["all_correct"] is True
+
+    # Kết quả có time limit phụ thuộc tải máy, không được memo
+    with client.application.app_context():
+        assert GradingResult.query.filter_by(exercise_id=exercise_id).count() == 0
+
+    wrong = fast.replace("return a", "return b")
+    data = json.loads(validate(client, exercise_id, wrong).data.decode())
+    assert data["user_results"][2] == "Hidden test failed"
+
+
+def test_exercise_invalid_time_limits(client):
+    """Đảm bảo time limit không phải số dương hoặc sai độ dài bị từ chối lúc lưu exercise."""
+    with client.application.app_context():
+        exercise_id = add_exercise().id
+        admin = add_user("admin", "admin@test.com", "test")
+        admin.admin = True
+        db.session.commit()
+    response = client.post(
+        "/auth/login",
+        data=json.dumps({"email": "admin@test.com", "password": "test"}),
+        content_type="application/json",
+    )
+    headers = {"Authorization": f"Bearer {json.loads(response.data.decode())['auth_token']}"}
+    payload = {
+        "title": "Sum",
+        "body": "def sum(a, b):\n    pass",
+        "difficulty": 0,
+        "test_cases": ["sum(2, 3)"],
+        "solutions": ["5"],
+    }
+
+    for time_limits in [["100"], [0], [100, 100]]:
+        response = client.post(
+            "/exercises/",
+            data=json.dumps(dict(payload, time_limits=time_limits)),
+            content_type="application/json",
+            headers=headers,
+        )
+        assert response.status_code == 400
+    response = client.post(
+        "/exercises/",
+        data=json.dumps(
+            dict(
+                payload,
+                large_tests=[{"setup": "", "test": "sum(1, 1)", "solution": "2", "time_limit_ms": "1s"}],
+            )
+        ),
+        content_type="application/json",
+        headers=headers,
+    )
+    assert response.status_code == 400
+    response = client.post(
+        "/exercises/",
+        data=json.dumps(dict(payload, time_limits=[None])),
+        content_type="application/json",
+        headers=headers,
+    )
+    assert response.status_code == 201
+
+    # Exercise mặc định có 2 test, time_limits phải có đúng 2 phần tử
+    response = client.put(
+        f"/exercises/{exercise_id}",
+        data=json.dumps({"time_limits": [100]}),
+        content_type="application/json",
+        headers=headers,
+    )
+    data = json.loads(response.data.decode())
+    assert response.status_code == 400
+    assert "length mismatch" in data["message"]
+    response = client.put(
+        f"/exercises/{exercise_id}",
+        data=json.dumps({"time_limits": [100, None]}),
+        content_type="application/json",
+        headers=headers,
+    )
+    assert response.status_code == 200
+
+
+def test_exercise_invalid_solutions(client):
+    """Đảm bảo solution không phải string bị từ chối, exercise cũ lưu số vẫn chấm được."""
+    with client.application.app_context():
+        legacy_id = add_exercise(solutions=[5, "9"]).id
+        admin = add_user("admin", "admin@test.com", "test")
+        admin.admin = True
+        db.session.commit()
+    response = client.post(
+        "/auth/login",
+        data=json.dumps({"email": "admin@test.com", "password": "test"}),
+        content_type="application/json",
+    )
+    headers = {"Authorization": f"Bearer {json.loads(response.data.decode())['auth_token']}"}
+    payload = {
+        "title": "Sum",
+        "body": "def sum(a, b):\n    pass",
+        "difficulty": 0,
+        "test_cases": ["sum(2, 3)"],
+        "solutions": [5],
+    }
+
+    response = client.post(
+        "/exercises/", data=json.dumps(payload), content_type="application/json", headers=headers
+    )
+    assert response.status_code == 400
+    assert json.loads(response.data.decode())["message"] == "Invalid solutions!"
+    response = client.post(
+        "/exercises/",
+        data=json.dumps(
+            dict(
+                payload,
+                solutions=["5"],
+                large_tests=[{"setup": "", "test": "sum(1, 1)", "solution": 2, "time_limit_ms": None}],
+            )
+        ),
+        content_type="application/json",
+        headers=headers,
+    )
+    assert response.status_code == 400
+    response = client.put(
+        f"/exercises/{legacy_id}",
+        data=json.dumps({"solutions": ["5", 9]}),
+        content_type="application/json",
+        headers=headers,
+    )
+    assert response.status_code == 400
+
+    data = json.loads(validate(client, legacy_id, "def sum(a, b):\n    return a + b").data.decode())
+    assert data["results"] == [True, True]
+    assert data["user_results"] == ["5", "9"]
+
+
+def test_watchdog_records_module_pollution(client):
+    """Đảm bảo chấm in-process import module mới thì watchdog ghi nhận recycle."""
+    with client.application.app_context():
+        exercise_id = add_exercise().id
+        admin = add_user("admin", "admin@test.com", "test")
+        admin.admin = True
+        db.session.commit()
+    client.application.config["GRADER_WORKERS"] = 0
+    client.application.config["GRADER_WATCHDOG_MAX_NEW_MODULES"] = 0
+    watchdog.reset()
+    sys.modules.pop("colorsys", None)
+
+    response = validate(
+        client, exercise_id, "import colorsys\ndef sum(a, b):\n    return a + b"
+    )
+    assert json.loads(response.data.decode())["all_correct"] is True
+
+    resp_login = client.post(
+        "/auth/login",
+        data=json.dumps({"email": "admin@test.com", "password": "test"}),
+        content_type="application/json",
+    )
+    token = json.loads(resp_login.data.decode())["auth_token"]
+    response = client.get(
+        "/exercises/telemetry/workers", headers={"Authorization": f"Bearer {token}"}
+    )
+    data = json.loads(response.data.decode())["data"]
+    assert data["current"]["new_modules"] >= 1
+    assert data["current"]["recycling"] is True
+    assert data["recycles"]["by_reason"] == {"modules": 1}
+    assert data["recycles"]["recent"][0]["pid"] == os.getpid()
+    watchdog.reset()
@@ -2,7 +2,7 @@
 
 
 from project import db
-from project.api.models import User
+from project.api.models import Exercise, User
 
 
 def add_user(username, email, password):
@@ -10,3 +10,20 @@ def add_user(username, email, password):
     db.session.add(user)
     db.session.commit()
     return user
+
+
+def add_exercise(title="Sum of Two Integers", body="def sum(a, b):\n    pass",
+                 difficulty=0, test_cases=None, solutions=None, time_limits=None,
+                 large_tests=None):
+    exercise = Exercise(
+        title=title,
+        body=body,
+        difficulty=difficulty,
+        test_cases=test_cases if test_cases is not None else ["sum(2, 3)", "sum(4, 5)"],
+        solutions=solutions if solutions is not None else ["5", "9"],
+        time_limits=time_limits,
+        large_tests=large_tests,
+    )
+    db.session.add(exercise)
+    db.session.commit()
+    return exercise